@@ -0,0 +1,102 @@
+'''
+Checks a dispatch engine against the ReferenceDispatchEngine on random merit order stacks, using
+the DifferentialDispatchEngine. Each stack has random prices (with ties, and negative prices) and
+availabilities (with zero availabilities, and offers without an availability bid), and is
+dispatched at random demands, including zero, negative and huge demands. Some of its offers are
+then rebid, and the stack is created and dispatched again (so that dispatch engines that create
+stacks from the previous stack are also checked). Where a dispatch raises a KeyError (i.e. an offer
+without an availability bid was reached), the ReferenceDispatchEngine must raise one too. If any
+results differ, the exit status is 1.
+
+EXAMPLE USAGE: python -m benchmarks.dispatch_check -n 1200 -g 40
+'''
+
+import optparse, random, sys
+from datetime import datetime
+from franklin.dispatch import ArrayDispatchEngine, DifferentialDispatchEngine
+from franklin.messaging import GeneratorDispatchOffer
+
+NUM_PRICE_BANDS = 10
+TRADING_INTERVAL_DATE = datetime(2011, 10, 4, 4, 30)
+
+def create_availability_bid(num_price_bands, missing_probability, rand):
+    '''Creates a random availability bid with some zero availabilities (or None, for a missing bid, with the given probability).'''
+    
+    if rand.random() < missing_probability:
+        return None
+    availability_per_band = [ rand.choice([0, 0, rand.randint(1, 100), rand.uniform(0., 100.)]) for _ in xrange(num_price_bands) ]
+    return GeneratorDispatchOffer.TradingIntervalAvailabilityBid(availability_per_band, sum(availability_per_band))
+
+def create_dispatch_offers(num_offers, missing_probability, rand):
+    '''Creates dispatch offers with random prices (from a small set, so that many are equal) and availabilities.'''
+    
+    dispatch_offers = []
+    prices = [ round(rand.uniform(-1000., 12500.), 2) for _ in xrange(8) ]
+    for offer_no in xrange(num_offers):
+        price_per_band = sorted(rand.choice(prices) for _ in xrange(NUM_PRICE_BANDS))
+        availability_bid = create_availability_bid(NUM_PRICE_BANDS, missing_probability, rand)
+        availability_bid_by_trading_interval_date = {TRADING_INTERVAL_DATE: availability_bid} if availability_bid is not None else {}
+        dispatch_offers.append(GeneratorDispatchOffer('GEN%04d' % offer_no, TRADING_INTERVAL_DATE, price_per_band, availability_bid_by_trading_interval_date))
+    return dispatch_offers
+
+def create_total_demands(dispatch_offers, rand):
+    '''Creates the total demands to dispatch a stack at: zero, negative and huge demands, the total
+    availability of the offers (which is exactly met at the last price band), and random demands.'''
+    
+    total_availability = sum(sum(dispatch_offer.availability_bid_by_trading_interval_date[TRADING_INTERVAL_DATE].availability_per_band) for dispatch_offer in dispatch_offers if TRADING_INTERVAL_DATE in dispatch_offer.availability_bid_by_trading_interval_date)
+    return [ 0., -rand.uniform(0., 1000.), 1e15, total_availability ] + [ rand.uniform(0., total_availability * 1.1) for _ in xrange(4) ]
+
+def dispatch(differential_dispatch_engine, merit_order_stack, total_demand):
+    '''Dispatches a stack with the differential dispatch engine, raising an AssertionError if the results
+    differ. Returns True if it was dispatched, or False if both engines raised a KeyError.'''
+    
+    try:
+        differential_dispatch_engine.dispatch(merit_order_stack, total_demand)
+        return True
+    except KeyError:
+        try:
+            differential_dispatch_engine.reference_dispatch_engine.dispatch(merit_order_stack[1], total_demand)
+        except KeyError:
+            return False
+        raise AssertionError('Dispatch engine raised a KeyError at %s where the reference did not' % TRADING_INTERVAL_DATE)
+
+def check_dispatch_engine(dispatch_engine, num_stacks, max_offers, rand):
+    '''Dispatches random stacks with the dispatch engine and the ReferenceDispatchEngine. Returns the
+    number of stacks and dispatches checked, and the number of dispatches where both raised a KeyError.'''
+    
+    differential_dispatch_engine = DifferentialDispatchEngine(dispatch_engine)
+    num_checked_stacks = num_dispatches = num_key_errors = 0
+    while num_checked_stacks < num_stacks:
+        #most stacks have an availability bid from every offer, so that dispatches rarely reach a missing bid
+        missing_probability = rand.choice([ 0., 0., 0.02 ])
+        dispatch_offers = create_dispatch_offers(rand.randint(0, max_offers), missing_probability, rand)
+        num_price_bands = rand.choice([ NUM_PRICE_BANDS, NUM_PRICE_BANDS, rand.randint(1, NUM_PRICE_BANDS) ])
+        #the first stack of the offers, followed by stacks after each round of rebids
+        for _ in xrange(min(3, num_stacks - num_checked_stacks)):
+            merit_order_stack = differential_dispatch_engine.create_merit_order_stack(dispatch_offers, TRADING_INTERVAL_DATE, num_price_bands)
+            for total_demand in create_total_demands(dispatch_offers, rand):
+                if not dispatch(differential_dispatch_engine, merit_order_stack, total_demand):
+                    num_key_errors += 1
+                num_dispatches += 1
+            num_checked_stacks += 1
+            for dispatch_offer in rand.sample(dispatch_offers, min(len(dispatch_offers), rand.randint(0, 3))):
+                availability_bid = create_availability_bid(NUM_PRICE_BANDS, missing_probability, rand)
+                if availability_bid is not None:
+                    dispatch_offer.availability_bid_by_trading_interval_date[TRADING_INTERVAL_DATE] = availability_bid
+                else:
+                    dispatch_offer.availability_bid_by_trading_interval_date.pop(TRADING_INTERVAL_DATE, None)
+    return num_checked_stacks, num_dispatches, num_key_errors
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--stacks', help='Number of merit order stacks to check.', type='int', default=1200)
+    parser.add_option('-g', '--generators', help='Maximum number of dispatch offers per stack.', type='int', default=40)
+    parser.add_option('-s', '--seed', help='Seed for the random stacks.', type='int', default=0)
+    options, _ = parser.parse_args()
+    
+    try:
+        num_stacks, num_dispatches, num_key_errors = check_dispatch_engine(ArrayDispatchEngine(), options.stacks, options.generators, random.Random(options.seed))
+    except AssertionError as e:
+        print 'MISMATCH: %s' % e
+        sys.exit(1)
+    print 'Checked %d stacks (%d dispatches, %d raising a KeyError in both engines): the results are identical' % (num_stacks, num_dispatches, num_key_errors)
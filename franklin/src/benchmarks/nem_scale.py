@@ -0,0 +1,226 @@
+'''
+Benchmarks Franklin at NEM scale on synthetic data (see the synthetic_data module), with a
+configurable number of regions, generators per region, trading days and rebids per generator:
+ - simulation: a full simulation, run via run_simulation_with_config(), recording its wall time,
+   the time per simulated day, the messages delivered per second and the peak memory use
+   (resident set size) of the process. It is run first, so that its peak memory is not inflated
+   by the other benchmarks.
+ - parser: parsing the PUBLIC_YESTBID and PUBLIC_PRICES files alone (without a cache).
+ - clearing: creating merit order stacks and dispatching them with each dispatch engine alone.
+The results are written to a JSON file, and can be compared against a baseline (the results of
+an earlier run, with the same parameters), flagging any metric that is worse than the baseline
+by more than a threshold. If any are, the exit status is 1.
+
+EXAMPLE USAGE: python -m benchmarks.nem_scale -r 5 -g 60 -d 2 -b 4 -o results.json -c baseline.json
+'''
+
+import optparse, os, sys, time, json, random, shutil, platform, tempfile
+from datetime import timedelta
+from franklin import configuration_utilities
+from franklin.agents import AEMOperator, GeneratorWithBidDataProvider, ConsumerWithDemandForecastDataProvider
+from franklin.data_providers import CSVPublicYestBidDataProvider, CSVPublicPricesDataProvider, DirectoryPublicYestBidDataProvider
+from franklin.data_monitors import StreamingCSVFileMonitor
+from franklin.dispatch import ReferenceDispatchEngine, ArrayDispatchEngine, numpy
+from franklin.logger import NullLogger
+from franklin.messaging import GeneratorDispatchOffer
+from franklin.metrics import SimulationMetrics
+from benchmarks import synthetic_data
+
+BENCHMARK_NAMES = [ 'simulation', 'parser', 'clearing' ]
+
+'''The metrics where a higher value is better (for every other metric, lower is better).'''
+HIGHER_IS_BETTER_METRICS = set([ 'messages_per_second', 'rows_per_second' ])
+
+'''The metrics that describe the work done by a benchmark, which are not compared against a baseline.'''
+UNCOMPARED_METRICS = set([ 'messages_delivered', 'rows_parsed', 'simulated_days' ])
+
+def benchmark_simulation(data, directory):
+    '''Runs a simulation of the synthetic data. Returns its metrics.'''
+    
+    bid_data_provider = DirectoryPublicYestBidDataProvider(os.path.dirname(data.yestbid_file_locations[0]))
+    demand_forecast_data_provider = CSVPublicPricesDataProvider(data.prices_file_location)
+    config_dict = {
+        'start_date': data.start_date,
+        'end_date': data.end_date,
+        'generators': [ GeneratorWithBidDataProvider(generator_id, region_id, bid_data_provider) for region_id,generator_ids in data.generator_ids_by_region_id.items() for generator_id in generator_ids ],
+        'consumers': [ ConsumerWithDemandForecastDataProvider('%s-CONSUMER' % region_id, region_id, demand_forecast_data_provider) for region_id in data.region_ids ],
+        'regions': data.region_ids,
+        'data_monitor': StreamingCSVFileMonitor(os.path.join(directory, 'results.csv')),
+        'logger': NullLogger(),
+    }
+    critical_errors, _ = configuration_utilities.validate_config_dict(config_dict)
+    assert not critical_errors, '\n'.join(critical_errors)
+    
+    start_time = time.time()
+    simulation = configuration_utilities.run_simulation_with_config(config_dict, collect_metrics=True)
+    wall_seconds = time.time() - start_time
+    simulated_days = (data.end_date - data.start_date).total_seconds() / 86400.
+    messages_delivered = simulation.metrics.totals.get(SimulationMetrics.MESSAGES_DELIVERED, 0)
+    peak_memory = simulation.metrics.get_peak_memory()
+    return {
+        'simulated_days': simulated_days,
+        'wall_seconds': wall_seconds,
+        'seconds_per_simulated_day': wall_seconds / simulated_days,
+        'messages_delivered': messages_delivered,
+        'messages_per_second': messages_delivered / wall_seconds,
+        'peak_rss_mb': peak_memory / 1048576. if peak_memory is not None else None,
+    }
+
+def benchmark_parser(data, repeats):
+    '''Parses the synthetic data files (the fastest of a number of repeats). Returns the metrics of the parser.'''
+    
+    yestbid_seconds = prices_seconds = None
+    rows_parsed = 0
+    for _ in xrange(repeats):
+        start_time = time.time()
+        rows_parsed = sum(CSVPublicYestBidDataProvider(file_location).rows_parsed for file_location in data.yestbid_file_locations)
+        seconds = time.time() - start_time
+        yestbid_seconds = seconds if yestbid_seconds is None else min(yestbid_seconds, seconds)
+        
+        start_time = time.time()
+        CSVPublicPricesDataProvider(data.prices_file_location)
+        seconds = time.time() - start_time
+        prices_seconds = seconds if prices_seconds is None else min(prices_seconds, seconds)
+    return {
+        'rows_parsed': rows_parsed,
+        'yestbid_seconds': yestbid_seconds,
+        'rows_per_second': rows_parsed / yestbid_seconds,
+        'prices_seconds': prices_seconds,
+    }
+
+def create_dispatch_offers(num_offers, trading_interval_date, rand):
+    '''Creates dispatch offers with random prices and availabilities for a trading interval.'''
+    
+    dispatch_offers = []
+    for offer_no in xrange(num_offers):
+        price_per_band = sorted(round(rand.uniform(-100., 300.), 2) for _ in xrange(AEMOperator.NUM_PRICE_BANDS))
+        availability_per_band = [ rand.randint(1, synthetic_data.MAX_AVAILABILITY_PER_BAND) for _ in xrange(AEMOperator.NUM_PRICE_BANDS) ]
+        availability_bid = GeneratorDispatchOffer.TradingIntervalAvailabilityBid(availability_per_band, sum(availability_per_band))
+        dispatch_offers.append(GeneratorDispatchOffer('GEN%04d' % offer_no, trading_interval_date, price_per_band, {trading_interval_date: availability_bid}))
+    return dispatch_offers
+
+def benchmark_clearing(dispatch_engine, num_offers, num_trading_intervals, repeats, rand):
+    '''Creates a merit order stack of a region's dispatch offers, and then, for each of a number of trading intervals,
+    rebids one offer's availability, creates the stack again and dispatches it at the demand of every dispatch interval
+    within the trading interval (the fastest of a number of repeats). Returns the mean times in microseconds: of creating
+    a stack from new offers, of creating it again after a rebid (which dispatch engines may do from the previous stack),
+    and of dispatching it.'''
+    
+    trading_interval_date = synthetic_data.DEFAULT_START_DATE + timedelta(minutes=30)
+    dispatch_offers = create_dispatch_offers(num_offers, trading_interval_date, rand)
+    total_demands = [ num_offers * rand.uniform(2., AEMOperator.NUM_PRICE_BANDS * 0.8) for _ in xrange(AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL) ]
+    new_stack_seconds = stack_seconds = dispatch_seconds = None
+    for _ in xrange(repeats):
+        #a new engine, so that nothing is kept from earlier stacks
+        dispatch_engine = dispatch_engine.__class__()
+        start_time = time.time()
+        dispatch_engine.create_merit_order_stack(dispatch_offers, trading_interval_date, AEMOperator.NUM_PRICE_BANDS)
+        new_stack_duration = time.time() - start_time
+        
+        stack_duration = dispatch_duration = 0.
+        for _ in xrange(num_trading_intervals):
+            rebid_offer = rand.choice(dispatch_offers)
+            availability_per_band = [ rand.randint(1, synthetic_data.MAX_AVAILABILITY_PER_BAND) for _ in xrange(AEMOperator.NUM_PRICE_BANDS) ]
+            rebid_offer.availability_bid_by_trading_interval_date[trading_interval_date] = GeneratorDispatchOffer.TradingIntervalAvailabilityBid(availability_per_band, sum(availability_per_band))
+            start_time = time.time()
+            merit_order_stack = dispatch_engine.create_merit_order_stack(dispatch_offers, trading_interval_date, AEMOperator.NUM_PRICE_BANDS)
+            stack_duration += time.time() - start_time
+            start_time = time.time()
+            for total_demand in total_demands:
+                dispatch_engine.dispatch(merit_order_stack, total_demand)
+            dispatch_duration += time.time() - start_time
+        new_stack_seconds = new_stack_duration if new_stack_seconds is None else min(new_stack_seconds, new_stack_duration)
+        stack_seconds = stack_duration if stack_seconds is None else min(stack_seconds, stack_duration)
+        dispatch_seconds = dispatch_duration if dispatch_seconds is None else min(dispatch_seconds, dispatch_duration)
+    return {
+        'create_new_stack_us': new_stack_seconds * 1000000.,
+        'create_stack_us': stack_seconds / num_trading_intervals * 1000000.,
+        'dispatch_us': dispatch_seconds / (num_trading_intervals * len(total_demands)) * 1000000.,
+    }
+
+def compare_results(results, baseline, threshold):
+    '''Compares the metrics of each benchmark against a baseline. Returns a list of (benchmark name, metric
+    name, baseline value, value, relative change, is a regression) tuples for every metric in both, where
+    a regression is a change for the worse of more than the threshold (e.g. 0.1 for 10%).'''
+    
+    comparisons = []
+    for benchmark_name,metrics in sorted(results['benchmarks'].items()):
+        baseline_metrics = baseline['benchmarks'].get(benchmark_name, {})
+        for metric_name,value in sorted(metrics.items()):
+            baseline_value = baseline_metrics.get(metric_name, None)
+            if metric_name in UNCOMPARED_METRICS or value is None or not baseline_value:
+                continue
+            change = (value - baseline_value) / float(baseline_value)
+            is_regression = change < -threshold if metric_name in HIGHER_IS_BETTER_METRICS else change > threshold
+            comparisons.append((benchmark_name, metric_name, baseline_value, value, change, is_regression))
+    return comparisons
+
+def run_benchmarks(parameters, benchmark_names, repeats, directory):
+    '''Generates the synthetic data in a directory and runs the named benchmarks on it. Returns the results.'''
+    
+    data = synthetic_data.generate(directory, parameters['regions'], parameters['generators_per_region'], parameters['days'], parameters['rebids_per_generator'], seed=parameters['seed'])
+    results = {
+        'parameters': parameters,
+        'python_version': platform.python_version(),
+        'numpy': numpy is not None,
+        'benchmarks': {},
+    }
+    if 'simulation' in benchmark_names:
+        results['benchmarks']['simulation'] = benchmark_simulation(data, directory)
+    if 'parser' in benchmark_names:
+        results['benchmarks']['parser'] = benchmark_parser(data, repeats)
+    if 'clearing' in benchmark_names:
+        dispatch_engines = [ ReferenceDispatchEngine() ] + ([ ArrayDispatchEngine() ] if numpy is not None else [])
+        for dispatch_engine in dispatch_engines:
+            results['benchmarks']['clearing:%s' % dispatch_engine.__class__.__name__] = benchmark_clearing(dispatch_engine, parameters['generators_per_region'], 48, repeats, random.Random(parameters['seed']))
+    return results
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('-r', '--regions', help='Number of regions.', type='int', default=5)
+    parser.add_option('-g', '--generators', help='Number of generators per region.', type='int', default=60)
+    parser.add_option('-d', '--days', help='Number of trading days to simulate.', type='int', default=1)
+    parser.add_option('-b', '--rebids', help='Number of rebids per generator per trading day.', type='int', default=4)
+    parser.add_option('-s', '--seed', help='Seed for the synthetic data.', type='int', default=0)
+    parser.add_option('-k', '--benchmarks', help='Comma-separated benchmarks to run (default: %s).' % ','.join(BENCHMARK_NAMES), default=','.join(BENCHMARK_NAMES))
+    parser.add_option('-n', '--repeats', help='Number of repeats of the parser and clearing benchmarks (the fastest is kept).', type='int', default=3)
+    parser.add_option('-o', '--output', help='JSON file to write the results to.')
+    parser.add_option('-c', '--compare', help='JSON file of baseline results to compare against.')
+    parser.add_option('-t', '--threshold', help='Relative change for the worse that is flagged as a regression (default: 0.1).', type='float', default=0.1)
+    parser.add_option('--data-directory', help='Directory to write the synthetic data to (default: a temporary directory, removed afterwards).')
+    options, _ = parser.parse_args()
+    
+    benchmark_names = [ name.strip() for name in options.benchmarks.split(',') if name.strip() ]
+    for name in benchmark_names:
+        if name not in BENCHMARK_NAMES:
+            parser.error('Unknown benchmark: %s' % name)
+    parameters = {'regions': options.regions, 'generators_per_region': options.generators, 'days': options.days, 'rebids_per_generator': options.rebids, 'seed': options.seed}
+    
+    directory = options.data_directory or tempfile.mkdtemp(prefix='franklin-benchmark-')
+    try:
+        results = run_benchmarks(parameters, benchmark_names, options.repeats, directory)
+    finally:
+        if not options.data_directory:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    for benchmark_name,metrics in sorted(results['benchmarks'].items()):
+        print benchmark_name
+        for metric_name,value in sorted(metrics.items()):
+            print '  %-28s %s' % (metric_name, '%.3f' % value if isinstance(value, float) else value)
+    if options.output:
+        with open(options.output, 'wb') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+    
+    if options.compare:
+        with open(options.compare, 'rb') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('parameters') != parameters:
+            print 'WARNING: the baseline was run with different parameters: %s' % baseline.get('parameters')
+        comparisons = compare_results(results, baseline, options.threshold)
+        print 'Compared with %s (threshold %.0f%%):' % (options.compare, options.threshold * 100)
+        for benchmark_name,metric_name,baseline_value,value,change,is_regression in comparisons:
+            print '  %-48s %12.3f -> %12.3f  %+7.1f%%%s' % ('%s.%s' % (benchmark_name, metric_name), baseline_value, value, change * 100, '  REGRESSION' if is_regression else '')
+        num_regressions = sum(1 for comparison in comparisons if comparison[5])
+        print '%d regression(s) found' % num_regressions
+        if num_regressions > 0:
+            sys.exit(1)
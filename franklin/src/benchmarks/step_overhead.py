@@ -0,0 +1,65 @@
+'''
+Measures the overhead of a simulation time step, i.e. the cost of collating and 
+executing agents that have nothing to do. The overhead of the persistent agent 
+registry is compared against rebuilding the agents dictionary every time step 
+(as was done before the registry was introduced).
+
+EXAMPLE USAGE: python -m benchmarks.step_overhead -g 300 -s 10000
+'''
+
+import optparse, time
+from datetime import datetime
+from franklin.simulation import Simulation
+from franklin.agents import Agent
+from franklin.logger import NullLogger
+
+REGION_IDS = [ 'NSW1', 'QLD1', 'SA1', 'TAS1', 'VIC1' ]
+
+class IdleAgent(Agent):
+    '''An agent that never does anything.'''
+    
+    def get_initialisation_times(self, simulation):
+        return []
+
+def rebuild_agents_by_id(simulation):
+    '''Collates every agent in the simulation into a new dictionary, as the 
+    agents_by_id property did before the agent registry was introduced.'''
+    
+    agents_by_id = {}
+    for region_id in simulation.region_ids:
+        if region_id in simulation.operator_by_region:
+            operator = simulation.operator_by_region[region_id]
+            agents_by_id[operator.id] = operator
+        if region_id in simulation.generators_by_region:
+            agents_by_id.update({ generator.id : generator for generator in simulation.generators_by_region[region_id] })
+        if region_id in simulation.consumers_by_region:
+            agents_by_id.update({ consumer.id : consumer for consumer in simulation.consumers_by_region[region_id] })
+    return agents_by_id
+
+def time_steps(simulation, num_steps, get_agents_by_id):
+    '''Times num_steps idle time steps, using get_agents_by_id to collate the agents
+    each time step. Returns the mean time per step in microseconds.'''
+    
+    start_time = time.time()
+    for _ in xrange(num_steps):
+        for agent in get_agents_by_id(simulation).values():
+            agent.step(simulation)
+    return (time.time() - start_time) / num_steps * 1000000.
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('-g', '--generators', help='Number of generators per region.', type='int', default=300)
+    parser.add_option('-s', '--steps', help='Number of time steps to measure.', type='int', default=10000)
+    options, _ = parser.parse_args()
+    
+    generators = [ IdleAgent('%s-GEN%d' % (region_id, i), region_id) for region_id in REGION_IDS for i in xrange(options.generators) ]
+    consumers = [ IdleAgent('%s-CONSUMER' % region_id, region_id) for region_id in REGION_IDS ]
+    simulation = Simulation(NullLogger(), datetime(2011, 10, 4, 4), datetime(2011, 10, 5, 4), REGION_IDS, generators, consumers, [])
+    simulation.set_time(simulation.start_date)
+    
+    print 'Agents: %d' % len(simulation.agents_by_id)
+    rebuild_us = time_steps(simulation, options.steps, rebuild_agents_by_id)
+    registry_us = time_steps(simulation, options.steps, lambda simulation: simulation.agents_by_id)
+    print 'Step overhead (rebuilding agents_by_id): %.1fus' % rebuild_us
+    print 'Step overhead (agent registry):          %.1fus' % registry_us
+    print 'Speed-up: %.2fx' % (rebuild_us / registry_us)
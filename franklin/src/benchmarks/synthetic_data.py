@@ -0,0 +1,121 @@
+'''
+Generates synthetic market data for benchmarks, at a configurable scale: a PUBLIC_YESTBID
+file per trading day (named as AEMO names them, so that a directory of them can be read by
+a DirectoryPublicYestBidDataProvider), and a PUBLIC_PRICES file with the demand of every
+region. Every generator makes a daily dispatch offer for each trading day, followed by a
+specified number of availability rebids spread across the trading day. Each region's
+demand is kept well within the availability of its generators, so that every dispatch
+interval can be cleared. The data is generated from a seed, so the same parameters always
+produce the same files.
+
+EXAMPLE USAGE: python -m benchmarks.synthetic_data -r 5 -g 60 -d 2 -b 4 /tmp/franklin-data
+'''
+
+import optparse, os, random
+from csv import writer
+from datetime import datetime, timedelta
+from collections import namedtuple
+
+REGION_IDS = [ 'NSW1', 'QLD1', 'SA1', 'TAS1', 'VIC1' ]
+DEFAULT_START_DATE = datetime(2011, 10, 4, 4, 0)
+NUM_PRICE_BANDS = 10
+TRADING_INTERVALS_PER_DAY = 48
+DISPATCH_INTERVALS_PER_DAY = 288
+MAX_AVAILABILITY_PER_BAND = 20 #MW
+MAX_REBID_TRADING_INTERVALS = 12 #the most trading intervals whose availabilities are changed by a rebid
+
+DATE_FORMAT = '%Y/%m/%d %H:%M:%S'
+FILE_PUBLISH_DATE_FORMAT = '%Y/%m/%d'
+FILE_NAME_DATE_FORMAT = '%Y%m%d'
+
+'''The files and population of a synthetic data set.'''
+SyntheticData = namedtuple('SyntheticData', 'start_date end_date region_ids generator_ids_by_region_id yestbid_file_locations prices_file_location')
+
+def get_region_ids(num_regions):
+    '''Gets the ids of a number of regions: the NEM's regions, followed by synthetic regions if more are needed.'''
+    return REGION_IDS[:num_regions] + [ 'REGION%d' % (region_no + 1) for region_no in xrange(len(REGION_IDS), num_regions) ]
+
+def generate(directory, num_regions=5, generators_per_region=60, num_days=1, rebids_per_generator=4, start_date=DEFAULT_START_DATE, seed=0):
+    '''Writes a synthetic data set to the specified directory (which is created, if it does not exist).
+    Returns a SyntheticData tuple describing it. Each generator makes rebids_per_generator rebids per
+    trading day.'''
+    
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    rand = random.Random(seed)
+    region_ids = get_region_ids(num_regions)
+    generator_ids_by_region_id = { region_id: [ '%s-GEN%03d' % (region_id, generator_no + 1) for generator_no in xrange(generators_per_region) ] for region_id in region_ids }
+    yestbid_file_locations = [ write_yestbid_file(directory, start_date + timedelta(days=day_no), generator_ids_by_region_id, rebids_per_generator, rand) for day_no in xrange(num_days) ]
+    #consumers forecast the demand 24 hours ahead, so the demand continues for a day after the last trading day
+    prices_file_location = write_prices_file(directory, start_date, num_days + 1, generator_ids_by_region_id, rand)
+    return SyntheticData(start_date, start_date + timedelta(days=num_days), region_ids, generator_ids_by_region_id, yestbid_file_locations, prices_file_location)
+
+def write_yestbid_file(directory, trading_day_start_date, generator_ids_by_region_id, rebids_per_generator, rand):
+    '''Writes the PUBLIC_YESTBID file of a trading day, with a daily dispatch offer and a number of rebids
+    for every generator. Returns the file's location.'''
+    
+    trading_day_end_date = trading_day_start_date + timedelta(days=1)
+    settlement_date_text = trading_day_start_date.replace(hour=0, minute=0).strftime(DATE_FORMAT)
+    trading_interval_dates = [ trading_day_start_date + timedelta(minutes=30 * (trading_interval_no + 1)) for trading_interval_no in xrange(TRADING_INTERVALS_PER_DAY) ]
+    file_location = os.path.join(directory, 'PUBLIC_YESTBID_%s0000_%s040507.csv' % (trading_day_start_date.strftime(FILE_NAME_DATE_FORMAT), trading_day_end_date.strftime(FILE_NAME_DATE_FORMAT)))
+    
+    with open(file_location, 'wb') as data_file:
+        file_writer = writer(data_file)
+        file_writer.writerow(['C', 'NEMP.WORLD', 'YESTBID', 'AEMO', 'PUBLIC', trading_day_end_date.strftime(FILE_PUBLISH_DATE_FORMAT), '04:05:07'])
+        for region_id in sorted(generator_ids_by_region_id):
+            for generator_id in generator_ids_by_region_id[region_id]:
+                price_per_band = sorted(round(rand.uniform(-100., 300.), 2) for _ in xrange(NUM_PRICE_BANDS))
+                #the daily offer is made the day before, and each rebid at a different minute within the trading day
+                offer_dates = [ (trading_day_start_date - timedelta(days=1)).replace(hour=rand.randint(6, 11), minute=rand.randint(0, 59), second=rand.randint(0, 59)) ]
+                rebid_minutes = rand.sample(xrange(24 * 60 - 30), min(rebids_per_generator, 24 * 60 - 30))
+                offer_dates.extend(sorted(trading_day_start_date + timedelta(minutes=minute, seconds=rand.randint(0, 59)) for minute in rebid_minutes))
+                for offer_no,offer_date in enumerate(offer_dates):
+                    offer_date_text = offer_date.strftime(DATE_FORMAT)
+                    entry_type = 'DAILY' if offer_no == 0 else 'REBID'
+                    file_writer.writerow(['D', 'BIDS', 'BIDDAYOFFER', '1', settlement_date_text, generator_id, 'ENERGY', settlement_date_text, offer_date_text, '', '', '', 'Synthetic %s' % entry_type.lower()] +
+                                         [ '%.2f' % price for price in price_per_band ] + [''] * 9 + [entry_type])
+                    if offer_no == 0:
+                        offer_trading_interval_dates = trading_interval_dates
+                    else:
+                        offer_trading_interval_dates = sorted(rand.sample(trading_interval_dates, rand.randint(1, MAX_REBID_TRADING_INTERVALS)))
+                    for trading_interval_date in offer_trading_interval_dates:
+                        availability_per_band = [ rand.randint(1, MAX_AVAILABILITY_PER_BAND) for _ in xrange(NUM_PRICE_BANDS) ]
+                        max_availability = sum(availability_per_band)
+                        file_writer.writerow(['D', 'BIDS', 'BIDPEROFFER', '1', settlement_date_text, generator_id, 'ENERGY', settlement_date_text, offer_date_text, trading_interval_date.strftime(DATE_FORMAT), str(max_availability), '', '5', '5', '', '', '', ''] +
+                                             [ str(availability) for availability in availability_per_band ] + [str(max_availability + 10), '', '1'])
+        file_writer.writerow(['C', 'END OF REPORT', '1'])
+    return file_location
+
+def write_prices_file(directory, start_date, num_days, generator_ids_by_region_id, rand):
+    '''Writes a PUBLIC_PRICES file with the price and demand of every region for every dispatch interval
+    of a number of days. Returns the file's location.'''
+    
+    end_date = start_date + timedelta(days=num_days)
+    file_location = os.path.join(directory, 'PUBLIC_PRICES_%s0000_%s040503.csv' % (start_date.strftime(FILE_NAME_DATE_FORMAT), end_date.strftime(FILE_NAME_DATE_FORMAT)))
+    region_ids = sorted(generator_ids_by_region_id)
+    
+    with open(file_location, 'wb') as data_file:
+        file_writer = writer(data_file)
+        file_writer.writerow(['C', 'NEMP.WORLD', 'PRICES', 'AEMO', 'PUBLIC', end_date.strftime(FILE_PUBLISH_DATE_FORMAT), '04:05:03'])
+        for dispatch_interval_no in xrange(num_days * DISPATCH_INTERVALS_PER_DAY):
+            dispatch_interval_date_text = (start_date + timedelta(minutes=5 * (dispatch_interval_no + 1))).strftime(DATE_FORMAT)
+            for region_id in region_ids:
+                #every generator offers at least 1MW per band, so this demand can always be supplied
+                total_demand = len(generator_ids_by_region_id[region_id]) * rand.uniform(2., NUM_PRICE_BANDS * 0.8)
+                file_writer.writerow(['D', 'DREGION', '', '', dispatch_interval_date_text, '1', region_id, '0', '%.2f' % rand.uniform(10., 80.), '', '', '', '', '%.2f' % total_demand, '0', '0', '0'])
+        file_writer.writerow(['C', 'END OF REPORT', '1'])
+    return file_location
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] DIRECTORY')
+    parser.add_option('-r', '--regions', help='Number of regions.', type='int', default=5)
+    parser.add_option('-g', '--generators', help='Number of generators per region.', type='int', default=60)
+    parser.add_option('-d', '--days', help='Number of trading days.', type='int', default=1)
+    parser.add_option('-b', '--rebids', help='Number of rebids per generator per trading day.', type='int', default=4)
+    parser.add_option('-s', '--seed', help='Seed for the random data.', type='int', default=0)
+    options, arguments = parser.parse_args()
+    if len(arguments) != 1:
+        parser.error('A directory to write the data to is required.')
+    
+    data = generate(arguments[0], options.regions, options.generators, options.days, options.rebids, seed=options.seed)
+    print 'Wrote %d PUBLIC_YESTBID file(s) and %s for %d generators' % (len(data.yestbid_file_locations), os.path.basename(data.prices_file_location), sum(len(generator_ids) for generator_ids in data.generator_ids_by_region_id.values()))
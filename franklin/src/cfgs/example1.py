@@ -7,9 +7,9 @@ from csv import reader
 EXAMPLE USAGE: python main.py -c cfgs/example1
 '''
 
-bid_data_provider = CSVPublicYestBidDataProvider('../data/PUBLIC_YESTBID_201110040000_20111005040507.csv')
+bid_data_provider = CSVPublicYestBidDataProvider('../data/PUBLIC_YESTBID_201110040000_20111005040507.csv', cache_directory='../data/cache')
 
-demand_forecast_data_provider = CSVPublicPricesDataProvider('../data/PUBLIC_PRICES_201110040000_20111005040503.csv')
+demand_forecast_data_provider = CSVPublicPricesDataProvider('../data/PUBLIC_PRICES_201110040000_20111005040503.csv', cache_directory='../data/cache')
 
 generators = set()
 for row in reader(open('../data/registered-generators.csv', 'rb')):
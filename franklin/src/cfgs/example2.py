@@ -7,7 +7,7 @@ from csv import reader
 EXAMPLE USAGE: python main.py -c cfgs/example2
 '''
 
-bid_data_provider = CSVPublicYestBidDataProvider('../data/PUBLIC_YESTBID_201110040000_20111005040507.csv')
+bid_data_provider = CSVPublicYestBidDataProvider('../data/PUBLIC_YESTBID_201110040000_20111005040507.csv', cache_directory='../data/cache')
 
 generators = set()
 for row in reader(open('../data/registered-generators.csv', 'rb')):
@@ -17,10 +17,10 @@ for row in reader(open('../data/registered-generators.csv', 'rb')):
         generators.add(GeneratorWithBidDataProvider(duid, region_id, bid_data_provider))
 
 consumers = [ ConsumerWithDemandForecastDataProvider('VIC-Consumer 1', 'VIC1', MathApproximationDemandForecastDataProvider()),
-              ConsumerWithDemandForecastDataProvider('NSW-Consumer 1', 'NSW1', RandomDemandForecastDataProvider(500, 1000)), 
-              ConsumerWithDemandForecastDataProvider('NSW-Consumer 2', 'NSW1', RandomDemandForecastDataProvider(800, 1500)),
-              ConsumerWithDemandForecastDataProvider('NSW-Consumer 3', 'NSW1', RandomDemandForecastDataProvider(1200, 2000)),
-              ConsumerWithDemandForecastDataProvider('NSW-Consumer 4', 'NSW1', RandomDemandForecastDataProvider(1500, 2500)),  ]
+              ConsumerWithDemandForecastDataProvider('NSW-Consumer 1', 'NSW1', RandomDemandForecastDataProvider(500, 1000, stream='NSW-Consumer 1')), 
+              ConsumerWithDemandForecastDataProvider('NSW-Consumer 2', 'NSW1', RandomDemandForecastDataProvider(800, 1500, stream='NSW-Consumer 2')),
+              ConsumerWithDemandForecastDataProvider('NSW-Consumer 3', 'NSW1', RandomDemandForecastDataProvider(1200, 2000, stream='NSW-Consumer 3')),
+              ConsumerWithDemandForecastDataProvider('NSW-Consumer 4', 'NSW1', RandomDemandForecastDataProvider(1500, 2500, stream='NSW-Consumer 4')),  ]
 
 config = {
     'start_date': bid_data_provider.start_date,
@@ -0,0 +1,15 @@
+from franklin.data_providers import RandomDemandForecastDataProvider
+from franklin.agents import ConsumerWithDemandForecastDataProvider
+from cfgs.example1 import config
+
+'''
+EXAMPLE USAGE: python sweep.py -s cfgs/example_sweep -o ../results/example_sweep
+'''
+
+#the recorded demand of example1, followed by random demand per region (with a few different seeds)
+sweep = [ { 'name': 'recorded-demand' } ]
+for seed in xrange(4):
+    sweep.append({
+        'name': 'random-demand-%d' % seed,
+        'consumers': [ ConsumerWithDemandForecastDataProvider('Consumer-%s' % region_id, region_id, RandomDemandForecastDataProvider(4000, 8000, seed)) for region_id in config['regions'] ],
+    })
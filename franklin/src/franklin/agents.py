@@ -2,12 +2,18 @@
 This module provides agents, such as generators and consumers, to 
 a simulation. An agent requires three functions to be used within a 
 simulation: get_initialisation_times(), step(), and handle_messages()
-(and therefore does not necessarily need to subclass Agent).
+(and therefore does not necessarily need to subclass Agent). An agent may
+also provide a next_wake_time() function, allowing the simulation to skip
+over the time steps at which the agent has nothing to do.
 '''
 
-from messaging import GeneratorDispatchOffer, GeneratorAvailabilityRebid, DemandForecast, GeneratorDispatchNotification
+from messaging import GeneratorDispatchOffer, GeneratorAvailabilityRebid, DemandForecast, DemandForecastBatch, GeneratorDispatchNotification
+from dispatch import create_default_dispatch_engine
 from datetime import timedelta
 from collections import namedtuple
+from copy import copy
+from results import IntervalResultStore, IntervalInfoView, IntervalAccumulator, DemandForecastStore
+from logger import INFO, WARNING, OFFERS, DISPATCH, NOTIFICATIONS, MESSAGES
 
 class Agent(object):
     '''
@@ -30,6 +36,12 @@ class Agent(object):
         '''Execute the agent at this time in the simulation.'''
         pass
     
+    def next_wake_time(self, simulation):
+        '''Gets the next time after the current simulation time at which this agent's
+        step() function needs to be called, or None if it never needs to be called again.
+        By default, the agent is called every time step.'''
+        return simulation.time + simulation.TIME_STEP
+    
     def handle_messages(self, simulation, messages):
         '''Process messages received from other agents.'''
         pass
@@ -47,6 +59,7 @@ class GeneratorWithBidDataProvider(Agent):
         assert hasattr(bid_data_provider, 'get_bids_by_offer_date_before_date')
         self.bid_data_provider = bid_data_provider
         self.custom_bids_by_offer_date = custom_bids_by_offer_date if custom_bids_by_offer_date else {}
+        self._upcoming_offer_dates = None #the bid data provider and date that the current offer dates iterator is for, the iterator itself and its current offer date (see _get_next_offer_date())
     
     def get_initialisation_times(self, simulation):
         '''Returns the offer dates of all bids before the simulation start date.'''
@@ -63,18 +76,56 @@ class GeneratorWithBidDataProvider(Agent):
         for bid in self._get_bids_at_offer_date(simulation.time):
             simulation.message_dispatcher.send(bid, simulation.time, simulation.operator_by_region[self.region_id].id)
     
+    def next_wake_time(self, simulation):
+        '''Returns the next offer date of this generator's bids.'''
+        
+        if not hasattr(self.bid_data_provider, 'iter_offer_dates_from_date'):
+            return simulation.time + simulation.TIME_STEP
+        offer_dates = [offer_date for offer_date in self.custom_bids_by_offer_date if offer_date > simulation.time]
+        offer_date = self._get_next_offer_date(simulation.time, after=True)
+        if offer_date is not None:
+            offer_dates.append(offer_date)
+        return min(offer_dates) if len(offer_dates) > 0 else None
+    
     def _get_bids_at_offer_date(self, time):
         bids = set()
         if time in self.custom_bids_by_offer_date:
             bids.update(self.custom_bids_by_offer_date[time])
-        bids.update(self.bid_data_provider.get_bids_at_offer_date(self.id, time))
+        #only ask the bid data provider for bids at its offer dates (if it can iterate over them)
+        if not hasattr(self.bid_data_provider, 'iter_offer_dates_from_date') or self._get_next_offer_date(time) == time:
+            bids.update(self.bid_data_provider.get_bids_at_offer_date(self.id, time))
         return bids
+    
+    def _get_next_offer_date(self, date, after=False):
+        '''Gets the bid data provider's next offer date for this generator from the specified date
+        (or after it), or None if there are none. Rather than searching the provider each time, its
+        offer dates are walked in order with an iterator, which is only restarted if the provider
+        changes or an earlier date is asked for.'''
+        
+        provider, start_date, offer_dates, offer_date = self._upcoming_offer_dates if self._upcoming_offer_dates else (None, None, None, None)
+        if provider is not self.bid_data_provider or date < start_date:
+            provider, start_date = self.bid_data_provider, date
+            offer_dates = provider.iter_offer_dates_from_date(self.id, date)
+            offer_date = next(offer_dates, None)
+        while offer_date is not None and (offer_date < date or (after and offer_date == date)):
+            offer_date = next(offer_dates, None)
+        self._upcoming_offer_dates = (provider, start_date, offer_dates, offer_date)
+        return offer_date
      
+    def __getstate__(self):
+        #the offer dates iterator cannot be pickled (e.g. in a snapshot), so it is restarted when next needed
+        state = self.__dict__.copy()
+        state['_upcoming_offer_dates'] = None
+        return state
+    
     def handle_messages(self, simulation, messages):
         pass
-        for message in messages:
-            if isinstance(message, GeneratorDispatchNotification):
-                simulation.logger.info("%s: Received notification from %s to dispatch for %.2fMW" % (self.id, message.sender_id, message.demand_to_supply))
+        logger = simulation.logger
+        if logger.is_enabled_for(INFO, NOTIFICATIONS):
+            for message in messages:
+                if isinstance(message, GeneratorDispatchNotification):
+                    logger.log(INFO, NOTIFICATIONS, 'dispatch_notification', self.id, simulation.time, '%(agent_id)s: Received notification from %(sender_id)s to dispatch for %(demand_to_supply).2fMW', 
+                               sender_id=message.sender_id, demand_to_supply=message.demand_to_supply)
                 
         
 class ConsumerWithDemandForecastDataProvider(Agent):
@@ -82,37 +133,104 @@ class ConsumerWithDemandForecastDataProvider(Agent):
     Represents an electrical consumer that consumes power from the grid and
     reports predicted demand for the day ahead to the regional market operator. 
     This type of consumer uses a demand forecast data provider to determine demand 
-    predictions.
+    predictions. The demand of each dispatch interval is predicted 24 hours ahead,
+    but is sent for a whole trading day at a time (in a single DemandForecastBatch),
+    at the first dispatch interval of the trading day before. If the demand forecast
+    data provider is changed, the demand that has already been sent is predicted again
+    with the new provider (from 24 hours after the next dispatch interval), replacing it.
     '''
     
     def __init__(self, id, region_id, demand_forecast_data_provider):
         super(ConsumerWithDemandForecastDataProvider, self).__init__(id, region_id)
         assert hasattr(demand_forecast_data_provider, 'get_demand_forecast')
+        self._last_forecast_date = None #the last dispatch interval date that demand has been predicted for
         self.demand_forecast_data_provider = demand_forecast_data_provider
+    
+    @property
+    def demand_forecast_data_provider(self):
+        '''The data provider used to predict demand. Changing it makes the demand that has already been sent
+        due to be predicted again.'''
+        return self._demand_forecast_data_provider
+    
+    @demand_forecast_data_provider.setter
+    def demand_forecast_data_provider(self, demand_forecast_data_provider):
+        self._demand_forecast_data_provider = demand_forecast_data_provider
+        self._is_reforecast_due = self._last_forecast_date is not None
         
     def get_initialisation_times(self, simulation):
-        '''Returns 24 hours worth of dispatch interval times for the day before the simulation start date.
-        This will be required to seed the simulation's first trading day with a demand forecast per 
-        dispatch interval.'''
+        '''Returns the dispatch interval times in the day before the simulation start date at which this consumer
+        sends its demand forecasts. These will be required to seed the simulation's first trading day with a demand
+        forecast per dispatch interval.'''
         
+        self._last_forecast_date = None
+        self._is_reforecast_due = False
+        calendar = simulation.calendar
         initialisation_times = set()
-        time = simulation.start_date - timedelta(days=1)
-        while time < simulation.start_date:
-            initialisation_times.add(time)
-            time += timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+        minute = calendar.get_next_dispatch_interval_minute(-calendar.MINUTES_PER_DAY - 1)
+        while minute < 0:
+            initialisation_times.add(calendar.get_date(minute))
+            minute = calendar.get_trading_day_end_minute(minute + calendar.MINUTES_PER_DAY) + AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES - calendar.MINUTES_PER_DAY
         return initialisation_times
     
     def step(self, simulation):
         '''
-        Each time step, this consumer gets its forecasted demand for 24 hours
-        from the current trading interval time, and send it as a message to the 
-        regional market operator.
+        If the demand 24 hours from the current dispatch interval has not yet been predicted,
+        this consumer gets its forecasted demand for every dispatch interval from then to the
+        end of that trading day, and sends them as a message to the regional market operator.
+        If the demand forecast data provider has changed since demand was last predicted, the
+        demand that has already been sent (from 24 hours ahead) is predicted and sent again.
         '''
         
-        if simulation.time.minute % AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES == 0:
-            demand_forecast_tomorrow = self.demand_forecast_data_provider.get_demand_forecast(self.region_id, simulation.time)
-            if demand_forecast_tomorrow:
-                simulation.message_dispatcher.send(DemandForecast(self.id, simulation.time + timedelta(days=1), demand_forecast_tomorrow), simulation.time, simulation.operator_by_region[self.region_id].id)
+        calendar = simulation.calendar
+        forecast_minute = simulation.minute + calendar.MINUTES_PER_DAY
+        #dispatch intervals before the simulation start date are never dispatched, so their demand is not predicted
+        if calendar.is_dispatch_interval(simulation.minute) and forecast_minute >= 0:
+            last_forecast_minute = calendar.get_minute(self._last_forecast_date) if self._last_forecast_date is not None else None
+            if self._is_reforecast_due and last_forecast_minute >= forecast_minute:
+                #the new provider's forecasts replace those already sent, including dispatch intervals it predicts no demand for
+                self._send_demand_forecasts(simulation, forecast_minute, last_forecast_minute, True)
+            elif last_forecast_minute is None or last_forecast_minute < forecast_minute:
+                last_forecast_minute = calendar.get_trading_day_end_minute(forecast_minute)
+                self._send_demand_forecasts(simulation, forecast_minute, last_forecast_minute, False)
+                self._last_forecast_date = calendar.get_date(last_forecast_minute)
+            self._is_reforecast_due = False
+    
+    def _send_demand_forecasts(self, simulation, forecast_minute, last_forecast_minute, is_reforecast):
+        '''Gets the forecasted demand for every dispatch interval from the forecast minute index to the last, and
+        sends them to the regional market operator in a DemandForecastBatch (unless no demand is predicted and
+        they are not replacing demand that has already been sent).'''
+        
+        calendar = simulation.calendar
+        count = (last_forecast_minute - forecast_minute) // AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES + 1
+        demand_forecasts = self._get_demand_forecast_batch(simulation.time, count)
+        #dispatch intervals without any predicted demand are not forecast
+        demand_forecasts = [ demand_forecast if demand_forecast else None for demand_forecast in demand_forecasts ]
+        if is_reforecast or any(demand_forecasts):
+            simulation.message_dispatcher.send(DemandForecastBatch(self.id, calendar.get_date(forecast_minute), demand_forecasts), simulation.time, simulation.operator_by_region[self.region_id].id)
+    
+    def _get_demand_forecast_batch(self, time, count):
+        '''Gets the demand forecasts for 24 hours from each of the specified number of dispatch intervals from the 
+        specified time, in a single call if the demand forecast data provider supports it.'''
+        
+        demand_forecast_data_provider = self.demand_forecast_data_provider
+        if hasattr(demand_forecast_data_provider, 'get_demand_forecast_batch'):
+            return demand_forecast_data_provider.get_demand_forecast_batch(self.region_id, time, count)
+        dispatch_interval_duration = timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+        return [ demand_forecast_data_provider.get_demand_forecast(self.region_id, time + dispatch_interval_duration * interval_no) for interval_no in xrange(count) ]
+    
+    def next_wake_time(self, simulation):
+        '''Returns the next dispatch interval time at which demand is due to be predicted (i.e. 24 hours before the 
+        first dispatch interval that has not yet been predicted, or the next dispatch interval if the demand forecast 
+        data provider has changed).'''
+        
+        calendar = simulation.calendar
+        if self._is_reforecast_due:
+            #the current minute is included, since a provider may be changed (by an event) before the agents are stepped
+            return calendar.get_date(calendar.get_next_dispatch_interval_minute(simulation.minute - 1))
+        minute = calendar.get_next_dispatch_interval_minute(simulation.minute)
+        if self._last_forecast_date is not None:
+            minute = max(minute, calendar.get_minute(self._last_forecast_date) + AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES - calendar.MINUTES_PER_DAY)
+        return calendar.get_date(minute)
     
     def handle_messages(self, simulation, messages):
         pass
@@ -126,6 +244,9 @@ class AEMOperator(Agent):
 
     DispatchIntervalInfo = namedtuple('DispatchIntervalInfo', 'price total_demand_supplied total_demand price_band_no price_offer_and_supply_by_generator_id')
     TradingIntervalInfo = namedtuple('TradingIntervalInfo', 'spot_price total_demand_supplied total_demand demand_supplied_by_generator_id')
+    DISPATCH_INTERVAL_RESULT_COLUMNS = ('price', 'total_demand_supplied', 'total_demand', 'price_band_no')
+    TRADING_INTERVAL_RESULT_COLUMNS = ('spot_price', 'total_demand_supplied', 'total_demand')
+    ROLLUP_RESULT_COLUMNS = ('average_price', 'total_demand_supplied', 'total_demand')
     
     DISPATCH_INTERVAL_DURATION_MINUTES = 5
     DISPATCH_INTERVALS_PER_TRADING_INTERVAL = 6
@@ -141,12 +262,66 @@ class AEMOperator(Agent):
     MARKET_FLOOR_CAP = -1000.
     NUM_PRICE_BANDS = 10
     
-    def __init__(self, id, region):
+    def __init__(self, id, region, dispatch_engine=None):
         super(AEMOperator, self).__init__(id, region)
+        self.dispatch_engine = dispatch_engine if dispatch_engine else create_default_dispatch_engine() #determines the merit order dispatch of generators (see the dispatch module)
+        self._merit_order_stack_by_trading_interval_date_by_settlement_date = {} #cached merit order stacks. key = settlement date, value = dict of trading interval date mapped to a merit order stack.
+        self._current_trading_day_settlement_date = None #the settlement date of the trading day currently being dispatched
         self._dispatch_offer_by_settlement_date_by_generator_id = {} #generator ids mapped to settlement dates mapped to a dispatch offer
-        self._demand_forecasts_by_dispatch_interval_date = {} #demand forecasts stored in a dict. key = date, value = demand forecast for that date.
-        self.dispatch_interval_info_by_date = {} #dispatch interval information stored in a dict. key = date, value = dispatch interval information at that date.
-        self.trading_interval_info_by_date = {} #trading interval information stored in a dict. key = date, value = trading interval information at that date.
+        self._dispatch_offer_by_generator_id_by_settlement_date = {} #the same dispatch offers indexed by settlement date first (i.e. the offers for each trading day)
+        self._demand_forecasts = DemandForecastStore(self.DISPATCH_INTERVAL_DURATION_MINUTES) #the total demand forecast of each upcoming dispatch interval (summed as forecasts are received, per consumer)
+        self.dispatch_interval_results = None #the results of every dispatch interval, in columns (see the results module). created at the first dispatch interval.
+        self.trading_interval_results = None #the results of every trading interval, in columns (see the results module). created at the first dispatch interval.
+        self.result_history_minutes = None #if specified, only the results of the intervals in this many minutes up to the latest one are kept
+        self._trading_interval_accumulator = IntervalAccumulator(self.DISPATCH_INTERVAL_DURATION_MINUTES * self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL, self.DISPATCH_INTERVAL_DURATION_MINUTES)
+        self._rollup_accumulator_by_name = {} #running totals of the current interval of each rollup (see add_rollup())
+        self.rollup_results_by_name = {} #the results of every interval of each rollup, in columns (see the results module). created at the end of each rollup's first interval.
+    
+    def add_rollup(self, name, interval_duration_minutes):
+        '''Adds a rollup of the dispatch intervals into longer intervals of the specified duration (e.g. 60 for 
+        hourly or 1440 for daily), which must be a whole number of dispatch intervals and divide a day. Rollup 
+        intervals are counted from the start of the trading day (so daily intervals are trading days). Like 
+        trading intervals, each rollup interval's average price, total demand and demand supplied (in total 
+        and by generator) are stored (in rollup_results_by_name) if every one of its dispatch intervals was 
+        dispatched.'''
+        
+        assert (24 * 60) % interval_duration_minutes == 0, 'A rollup interval must divide a day.'
+        self._rollup_accumulator_by_name[name] = IntervalAccumulator(interval_duration_minutes, self.DISPATCH_INTERVAL_DURATION_MINUTES)
+    
+    @property
+    def dispatch_interval_info_by_date(self):
+        '''A read-only view of the dispatch interval results, with dates mapped to DispatchIntervalInfo namedtuples.'''
+        return IntervalInfoView(self.dispatch_interval_results, self._create_dispatch_interval_info)
+    
+    @property
+    def trading_interval_info_by_date(self):
+        '''A read-only view of the trading interval results, with dates mapped to TradingIntervalInfo namedtuples.'''
+        return IntervalInfoView(self.trading_interval_results, self._create_trading_interval_info)
+    
+    @classmethod
+    def _create_dispatch_interval_info(cls, results, minute):
+        price, total_demand_supplied, total_demand, price_band_no = results.get_values(minute)
+        price_offer_and_supply_by_generator_id = { generator_id: (price_offer, demand_to_supply) for generator_id,price_offer,demand_to_supply in results.get_supply_entries(minute) }
+        return cls.DispatchIntervalInfo(price=price, total_demand_supplied=total_demand_supplied, total_demand=total_demand, 
+                                        price_band_no=int(price_band_no), price_offer_and_supply_by_generator_id=price_offer_and_supply_by_generator_id)
+    
+    @classmethod
+    def _create_trading_interval_info(cls, results, minute):
+        spot_price, total_demand_supplied, total_demand = results.get_values(minute)
+        return cls.TradingIntervalInfo(spot_price=spot_price, total_demand_supplied=total_demand_supplied, total_demand=total_demand, 
+                                       demand_supplied_by_generator_id=dict(results.get_supply_entries(minute)))
+    
+    def _create_result_stores(self, simulation):
+        '''Creates the stores of dispatch and trading interval results, with rows preallocated for every interval
+        from the current one to the end of the simulation (or the end of the result history, if it is limited).'''
+        
+        calendar = simulation.calendar
+        last_minute = max(simulation.minute, calendar.get_minute_at_or_after(simulation.end_date))
+        if self.result_history_minutes is not None:
+            last_minute = min(last_minute, simulation.minute + self.result_history_minutes)
+        self.dispatch_interval_results = IntervalResultStore(calendar, self.DISPATCH_INTERVAL_DURATION_MINUTES, self.DISPATCH_INTERVAL_RESULT_COLUMNS, simulation.minute, last_minute)
+        self.trading_interval_results = IntervalResultStore(calendar, self.DISPATCH_INTERVAL_DURATION_MINUTES * self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL, 
+                                                            self.TRADING_INTERVAL_RESULT_COLUMNS, calendar.get_trading_interval_end_minute(simulation.minute), last_minute, has_price_offers=False)
     
     def get_initialisation_times(self, simulation):
         return []
@@ -155,108 +330,141 @@ class AEMOperator(Agent):
         '''Each time step, this agent processes its dispatch schedule if
         the simulation time is currently at a dispatch interval.'''
         
-        if (simulation.time >= simulation.start_date or schedule_before_simulation_start) and simulation.time.minute % self.DISPATCH_INTERVAL_DURATION_MINUTES == 0:
-            self._process_dispatch_schedule(simulation)
+        #minute indices are counted from the simulation start date (see the clock module)
+        if (simulation.minute >= 0 or schedule_before_simulation_start) and simulation.calendar.is_dispatch_interval(simulation.minute):
+            metrics = simulation.metrics
+            if metrics is None:
+                self._process_dispatch_schedule(simulation)
+            else:
+                start_time = metrics.timer()
+                self._process_dispatch_schedule(simulation)
+                metrics.add_duration(metrics.OPERATOR_CLEARING, metrics.timer() - start_time)
+    
+    def next_wake_time(self, simulation):
+        '''Returns the next dispatch interval time.'''
+        return simulation.calendar.get_date(simulation.calendar.get_next_dispatch_interval_minute(simulation.minute))
     
     def _process_dispatch_schedule(self, simulation):
         '''Determines which generators to dispatch at this dispatch interval to meet the 
         consumer demand/load using a stack-based pricing model (i.e. generators are dispatched 
         in order of lowest price).'''        
         
-        if simulation.time in self._demand_forecasts_by_dispatch_interval_date:
-            #determine the current trading interval's end date #FIXME: a bit excessive calling this every dispatch interval. needs refactoring too.
-            if 0 < simulation.time.minute <= self.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE:
-                current_trading_interval_end_date = simulation.time.replace(minute=self.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE)
-            elif simulation.time.minute == self.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE:
-                current_trading_interval_end_date = simulation.time
-            else:
-                current_trading_interval_end_date = simulation.time.replace(minute=self.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE) + timedelta(hours=1)
+        total_demand = self._demand_forecasts.get_total_demand(simulation.minute)
+        self._demand_forecasts.discard_before(simulation.minute) #the forecasts of past dispatch intervals are no longer needed
+        if total_demand is not None:
+            #determine the current trading interval's end date and the trading day's settlement date (used to get today's 
+            #bids). both are looked up in the simulation calendar, which precomputes them for every minute of the day
+            calendar = simulation.calendar
+            current_trading_interval_end_date = calendar.get_date(calendar.get_trading_interval_end_minute(simulation.minute))
+            trading_day_settlement_date = calendar.get_date(calendar.get_trading_day_settlement_minute(simulation.minute))
             
-            #determine the trading day's settlement date (used to get today's bids)
-            trading_day_settlement_date = simulation.time.replace(hour=self.TRADING_DAY_SETTLEMENT_HOUR, minute=self.TRADING_DAY_SETTLEMENT_MINUTE)
-            if simulation.time.hour < self.TRADING_DAY_START_HOUR or (simulation.time.hour == self.TRADING_DAY_START_HOUR and simulation.time.minute == 0):
-                trading_day_settlement_date -= timedelta(days=1)
+            #get the merit order stack for this trading interval; it is cached until a dispatch offer or re-bid changes it
+            if trading_day_settlement_date != self._current_trading_day_settlement_date:
+                self._start_trading_day(trading_day_settlement_date)
+            merit_order_stack_by_trading_interval_date = self._merit_order_stack_by_trading_interval_date_by_settlement_date.setdefault(trading_day_settlement_date, {})
+            merit_order_stack = merit_order_stack_by_trading_interval_date.get(current_trading_interval_end_date, None)
+            if merit_order_stack is None:
+                #using the settlement date, get all price offers submitted for this trading day (in generator id
+                #order, so that equally priced offers are always dispatched in the same order)
+                dispatch_offer_by_generator_id = self._dispatch_offer_by_generator_id_by_settlement_date.get(trading_day_settlement_date, {})
+                dispatch_offers = [ dispatch_offer for _,dispatch_offer in sorted(dispatch_offer_by_generator_id.items()) ]
+                merit_order_stack = self.dispatch_engine.create_merit_order_stack(dispatch_offers, current_trading_interval_end_date, self.NUM_PRICE_BANDS)
+                if simulation.metrics is not None:
+                    simulation.metrics.add_value(simulation.metrics.OFFERS_IN_STACK, len(dispatch_offers))
+                merit_order_stack_by_trading_interval_date[current_trading_interval_end_date] = merit_order_stack
             
-            #using the settlement date, get all price offers submitted for this trading day
-            dispatch_offers = set()
-            for generator in self._dispatch_offer_by_settlement_date_by_generator_id:
-                if trading_day_settlement_date in self._dispatch_offer_by_settlement_date_by_generator_id[generator]:
-                    dispatch_offers.add(self._dispatch_offer_by_settlement_date_by_generator_id[generator][trading_day_settlement_date])
-            
-            #get the total demand for this dispatch interval
-            total_demand = sum(demand_forecast.demand for demand_forecast in self._demand_forecasts_by_dispatch_interval_date[simulation.time])
             
             #using stack-based pricing, determine the dispatch schedule for generators
-            total_demand_supplied = 0.
-            dispatch_interval_price = 0.
-            price_offer_and_supply_by_generator_id = {} #maps a generator id to its price offer and the demand it will be dispatched to generate
-            for price_band_no in xrange(self.NUM_PRICE_BANDS):
-                total_demand_supplied = 0.
-                dispatch_interval_price = 0.
-                price_offer_and_supply_by_generator_id.clear()
-                #determine which generators get dispatched for this interval based on their price
-                for dispatch_offer in sorted(dispatch_offers, key=lambda dispatch_offer: dispatch_offer.price_per_band[price_band_no]):
-                    availability_bid = dispatch_offer.availability_bid_by_trading_interval_date[current_trading_interval_end_date]
-                    availability = sum(availability_bid.availability_per_band[:price_band_no+1])
-                    #availability = min(sum(availability_bid.availability_per_band[:price_band_no+1]), availability_bid.max_availability)
-                    if availability > 0:
-                        demand_to_supply = min(availability, total_demand - total_demand_supplied)
-                        total_demand_supplied += demand_to_supply
-                        price_offer = dispatch_offer.price_per_band[price_band_no]
-                        price_offer_and_supply_by_generator_id[dispatch_offer.sender_id] = (price_offer,demand_to_supply)
-                        dispatch_interval_price = price_offer
-                        if total_demand_supplied >= total_demand:
-                            break
-                    else:
-                        #FIXME: what to do here?
-                        pass
-                
-                if total_demand_supplied >= total_demand:
-                    break
+            dispatch_interval_price, total_demand_supplied, price_band_no, price_offer_and_supply_by_generator_id = self.dispatch_engine.dispatch(merit_order_stack, total_demand)
             
             #send dispatch notifications
             for duid,(price_offer,demand_to_supply) in price_offer_and_supply_by_generator_id.items():
                 simulation.message_dispatcher.send(GeneratorDispatchNotification(self.id, simulation.time, demand_to_supply), simulation.time, duid)
             
-            #store information for this dispatch interval date
-            self.dispatch_interval_info_by_date[simulation.time] = self.DispatchIntervalInfo(price=dispatch_interval_price, total_demand_supplied=total_demand_supplied, 
-                                                                                             total_demand=total_demand, price_band_no=price_band_no, 
-                                                                                             price_offer_and_supply_by_generator_id=price_offer_and_supply_by_generator_id)
+            #store the results of this dispatch interval
+            if self.dispatch_interval_results is None:
+                self._create_result_stores(simulation)
+            self.dispatch_interval_results.add(simulation.minute, (dispatch_interval_price, total_demand_supplied, total_demand, price_band_no), 
+                                               ((generator_id, price_offer, demand_to_supply) for generator_id,(price_offer,demand_to_supply) in price_offer_and_supply_by_generator_id.items()))
+            
+            logger = simulation.logger
+            if logger.is_enabled_for(INFO, DISPATCH):
+                logger.log(INFO, DISPATCH, 'dispatch_interval', self.id, simulation.time, '%(agent_id)s: Dispatch interval schedule -> demand supplied = %(total_demand_supplied).2fMW of %(total_demand).2fMW, price = $%(price).2f (band %(price_band_no)d)', 
+                           total_demand_supplied=total_demand_supplied, total_demand=total_demand, price=dispatch_interval_price, price_band_no=price_band_no)
+            for monitor in simulation.streaming_monitors:
+                monitor.log_dispatch_interval(simulation, self, simulation.minute)
             
-            simulation.logger.info("%s: Dispatch interval schedule -> demand supplied = %.2fMW of %.2fMW, price = $%.2f (band %d)" % (self.id, total_demand_supplied, total_demand, dispatch_interval_price, price_band_no))
+            #add this dispatch interval to the running totals of the current trading interval (and rollup intervals)
+            supplies = [ (generator_id, demand_to_supply) for generator_id,(price_offer,demand_to_supply) in price_offer_and_supply_by_generator_id.items() ]
+            trading_interval_accumulator = self._trading_interval_accumulator
+            trading_interval_accumulator.add(simulation.minute, dispatch_interval_price, total_demand_supplied, total_demand, supplies)
+            for accumulator in self._rollup_accumulator_by_name.values():
+                accumulator.add(simulation.minute, dispatch_interval_price, total_demand_supplied, total_demand, supplies)
             
             #calculate the spot price (average dispatch interval price) if this is the last dispatch interval in the trading interval
-            if simulation.time.minute == self.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE or simulation.time.minute == self.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE:
-                dispatch_interval_infos = []
-                for i in xrange(self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL):
-                    dispatch_interval_time = simulation.time - timedelta(minutes=self.DISPATCH_INTERVAL_DURATION_MINUTES * i)
-                    if dispatch_interval_time in self.dispatch_interval_info_by_date:
-                        dispatch_interval_infos.append(self.dispatch_interval_info_by_date[dispatch_interval_time])
-                    else:
-                        break
-                
-                if len(dispatch_interval_infos) == self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL:
-                    #calculate trading interval info
-                    spot_price = 0.
-                    total_demand_supplied = 0.
-                    total_demand = 0.
-                    demand_supplied_by_generator_id = {}
-                    for dispatch_interval_info in dispatch_interval_infos:
-                        spot_price += dispatch_interval_info.price
-                        total_demand_supplied += dispatch_interval_info.total_demand_supplied
-                        total_demand += dispatch_interval_info.total_demand
-                        for generator_id,(price_offer,demand_to_supply) in dispatch_interval_info.price_offer_and_supply_by_generator_id.items():
-                            demand_supplied_by_generator_id[generator_id] = demand_supplied_by_generator_id.get(generator_id, 0) + demand_to_supply
-                    spot_price = max(self.MARKET_FLOOR_CAP, min(self.MARKET_PRICE_CAP, spot_price / self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL))
+            if calendar.is_trading_interval_end(simulation.minute):
+                if trading_interval_accumulator.is_complete():
+                    spot_price = max(self.MARKET_FLOOR_CAP, min(self.MARKET_PRICE_CAP, trading_interval_accumulator.get_average_price()))
                     
-                    #store information for this trading interval date
-                    self.trading_interval_info_by_date[simulation.time] = self.TradingIntervalInfo(spot_price=spot_price, total_demand_supplied=total_demand_supplied, 
-                                                                                                   total_demand=total_demand, demand_supplied_by_generator_id=demand_supplied_by_generator_id)
-                    simulation.logger.info("%s: Trading interval finished -> spot price = $%.2f" % (self.id, spot_price))
+                    #store the results of this trading interval
+                    self.trading_interval_results.add(simulation.minute, (spot_price, trading_interval_accumulator.total_demand_supplied, trading_interval_accumulator.total_demand), 
+                                                      trading_interval_accumulator.demand_supplied_by_generator_id.items())
+                    if logger.is_enabled_for(INFO, DISPATCH):
+                        logger.log(INFO, DISPATCH, 'trading_interval', self.id, simulation.time, '%(agent_id)s: Trading interval finished -> spot price = $%(spot_price).2f', spot_price=spot_price)
+                    for monitor in simulation.streaming_monitors:
+                        monitor.log_trading_interval(simulation, self, simulation.minute)
                 else:
-                    simulation.logger.info("%s: Trading interval %d finished; insufficient dispatch interval information to calculate spot price." % (self.id, simulation.time.minute / self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL))
+                    if logger.is_enabled_for(INFO, DISPATCH):
+                        logger.log(INFO, DISPATCH, 'insufficient_trading_interval', self.id, simulation.time, '%(agent_id)s: Trading interval %(trading_interval_no)d finished; insufficient dispatch interval information to calculate spot price.', 
+                                   trading_interval_no=simulation.time.minute / self.DISPATCH_INTERVALS_PER_TRADING_INTERVAL)
+                trading_interval_accumulator.reset()
+            
+            #store the results of any rollup intervals that end at this dispatch interval
+            for name,accumulator in self._rollup_accumulator_by_name.items():
+                if accumulator.is_interval_end(calendar, simulation.minute):
+                    if accumulator.is_complete():
+                        rollup_results = self.rollup_results_by_name.get(name, None)
+                        if rollup_results is None:
+                            rollup_results = self.rollup_results_by_name[name] = IntervalResultStore(calendar, accumulator.interval_duration_minutes, self.ROLLUP_RESULT_COLUMNS, simulation.minute, 
+                                                                                                     max(simulation.minute, calendar.get_minute_at_or_after(simulation.end_date)), has_price_offers=False)
+                        rollup_results.add(simulation.minute, (accumulator.get_average_price(), accumulator.total_demand_supplied, accumulator.total_demand), 
+                                           accumulator.demand_supplied_by_generator_id.items())
+                    accumulator.reset()
+            
+            #discard the results that are older than the result history (they have already been passed to any streaming monitors)
+            if self.result_history_minutes is not None:
+                self.dispatch_interval_results.discard_before(simulation.minute - self.result_history_minutes)
+                self.trading_interval_results.discard_before(simulation.minute - self.result_history_minutes)
         else:
-            simulation.logger.info("%s: No load and/or bid data for this trading interval." % self.id)
+            if simulation.logger.is_enabled_for(INFO, DISPATCH):
+                simulation.logger.log(INFO, DISPATCH, 'no_data', self.id, simulation.time, '%(agent_id)s: No load and/or bid data for this trading interval.')
+    
+    def _start_trading_day(self, trading_day_settlement_date):
+        '''Prepares to dispatch a new trading day, discarding the dispatch offers and cached merit
+        order stacks of previous trading days (so that memory use does not grow over long simulations).'''
+        
+        for settlement_date in self._dispatch_offer_by_generator_id_by_settlement_date.keys():
+            if settlement_date < trading_day_settlement_date:
+                for generator_id in self._dispatch_offer_by_generator_id_by_settlement_date.pop(settlement_date):
+                    dispatch_offer_by_settlement_date = self._dispatch_offer_by_settlement_date_by_generator_id[generator_id]
+                    del dispatch_offer_by_settlement_date[settlement_date]
+                    if len(dispatch_offer_by_settlement_date) == 0:
+                        del self._dispatch_offer_by_settlement_date_by_generator_id[generator_id]
+        for settlement_date in self._merit_order_stack_by_trading_interval_date_by_settlement_date.keys():
+            if settlement_date < trading_day_settlement_date:
+                del self._merit_order_stack_by_trading_interval_date_by_settlement_date[settlement_date]
+        self._current_trading_day_settlement_date = trading_day_settlement_date
+    
+    def _invalidate_merit_order_stacks(self, settlement_date, trading_interval_dates=None):
+        '''Discards the cached merit order stacks for a trading day (or only those of the specified
+        trading intervals), since the dispatch offers they were created from have changed.'''
+        
+        if trading_interval_dates is None:
+            self._merit_order_stack_by_trading_interval_date_by_settlement_date.pop(settlement_date, None)
+        elif settlement_date in self._merit_order_stack_by_trading_interval_date_by_settlement_date:
+            merit_order_stack_by_trading_interval_date = self._merit_order_stack_by_trading_interval_date_by_settlement_date[settlement_date]
+            for trading_interval_date in trading_interval_dates:
+                merit_order_stack_by_trading_interval_date.pop(trading_interval_date, None)
     
     def handle_messages(self, simulation, messages):
         for message in messages:
@@ -264,11 +472,14 @@ class AEMOperator(Agent):
                 self._handle_dispatch_offer(message, simulation)
             elif isinstance(message, GeneratorAvailabilityRebid):
                 self._handle_availability_rebid(message, simulation)
+            elif isinstance(message, DemandForecastBatch):
+                self._handle_demand_forecast_batch(message, simulation)
             elif isinstance(message, DemandForecast):
                 self._handle_demand_forecast(message, simulation)
             else:
                 #unrecognised!
-                simulation.logger.warning("%s: received unknown message type (%s)." % (self.id, type(message)))
+                if simulation.logger.is_enabled_for(WARNING, MESSAGES):
+                    simulation.logger.log(WARNING, MESSAGES, 'unknown_message', self.id, simulation.time, '%(agent_id)s: received unknown message type (%(message_type)s).', message_type=type(message))
     
     def _handle_dispatch_offer(self, dispatch_offer, simulation):
         '''Processes a generator's dispatch offer. Rejects the offer if it is submitted after the cut-off time.
@@ -277,6 +488,10 @@ class AEMOperator(Agent):
         
         cut_off_date = (dispatch_offer.settlement_date - timedelta(days=1)).replace(hour=self.DAILY_DISPATCH_OFFER_CUTOFF_HOUR, minute=self.DAILY_DISPATCH_OFFER_CUTOFF_MINUTE)
         if simulation.time < cut_off_date:
+            #keep a copy of the offer (and its availability bids), since these are modified below and by
+            #re-bids, whereas the original may be shared (e.g. by a data provider used by several runs)
+            dispatch_offer = copy(dispatch_offer)
+            dispatch_offer.availability_bid_by_trading_interval_date = dict(dispatch_offer.availability_bid_by_trading_interval_date)
             dispatch_offer_by_settlement_date = self._dispatch_offer_by_settlement_date_by_generator_id.setdefault(dispatch_offer.sender_id, {})
             if dispatch_offer.settlement_date in dispatch_offer_by_settlement_date:
                 #if the dispatch offer does not have sufficient trading interval availability bids,
@@ -287,9 +502,12 @@ class AEMOperator(Agent):
                         dispatch_offer.availability_bid_by_trading_interval_date[key] = value
             
             dispatch_offer_by_settlement_date[dispatch_offer.settlement_date] = dispatch_offer
-            simulation.logger.info('%s: Received dispatch offer from %s.' % (self.id, dispatch_offer.sender_id))
-        else:
-            simulation.logger.info('%s: Rejected dispatch offer from %s (received after daily cut-off time).' % (self.id, dispatch_offer.sender_id))
+            self._dispatch_offer_by_generator_id_by_settlement_date.setdefault(dispatch_offer.settlement_date, {})[dispatch_offer.sender_id] = dispatch_offer
+            self._invalidate_merit_order_stacks(dispatch_offer.settlement_date)
+            if simulation.logger.is_enabled_for(INFO, OFFERS):
+                simulation.logger.log(INFO, OFFERS, 'dispatch_offer', self.id, simulation.time, '%(agent_id)s: Received dispatch offer from %(sender_id)s.', sender_id=dispatch_offer.sender_id)
+        elif simulation.logger.is_enabled_for(INFO, OFFERS):
+            simulation.logger.log(INFO, OFFERS, 'rejected_dispatch_offer', self.id, simulation.time, '%(agent_id)s: Rejected dispatch offer from %(sender_id)s (received after daily cut-off time).', sender_id=dispatch_offer.sender_id)
     
     def _handle_availability_rebid(self, availability_rebid, simulation):
         '''Processes a generator's availability re-bid. Please note that if a trading interval's availability is not specified in the re-bid,
@@ -300,12 +518,24 @@ class AEMOperator(Agent):
            availability_rebid.settlement_date in self._dispatch_offer_by_settlement_date_by_generator_id[availability_rebid.sender_id]:
             #replace/update the dispatch offer's reference to the availability bids per trading interval
             self._dispatch_offer_by_settlement_date_by_generator_id[availability_rebid.sender_id][availability_rebid.settlement_date].availability_bid_by_trading_interval_date.update(availability_rebid.availability_bid_by_trading_interval_date)
-            simulation.logger.info('%s: Received availability re-bid from %s for trading day %s. Explanation: %s' % (self.id, availability_rebid.sender_id, availability_rebid.settlement_date, availability_rebid.rebid_explanation))
-        else:
-            simulation.logger.info('%s: Rejected availability re-bid from %s for trading day %s (no original dispatch offer received for this trading day).' % (self.id, availability_rebid.settlement_date, availability_rebid.sender_id))
+            self._invalidate_merit_order_stacks(availability_rebid.settlement_date, availability_rebid.availability_bid_by_trading_interval_date.keys())
+            if simulation.logger.is_enabled_for(INFO, OFFERS):
+                simulation.logger.log(INFO, OFFERS, 'availability_rebid', self.id, simulation.time, '%(agent_id)s: Received availability re-bid from %(sender_id)s for trading day %(settlement_date)s. Explanation: %(rebid_explanation)s', 
+                                      sender_id=availability_rebid.sender_id, settlement_date=availability_rebid.settlement_date, rebid_explanation=availability_rebid.rebid_explanation)
+        elif simulation.logger.is_enabled_for(INFO, OFFERS):
+            simulation.logger.log(INFO, OFFERS, 'rejected_availability_rebid', self.id, simulation.time, '%(agent_id)s: Rejected availability re-bid from %(sender_id)s for trading day %(settlement_date)s (no original dispatch offer received for this trading day).', 
+                                  sender_id=availability_rebid.sender_id, settlement_date=availability_rebid.settlement_date)
 
     def _handle_demand_forecast(self, demand_forecast, simulation):
         '''Processes a consumers's demand forecast.'''
         
-        self._demand_forecasts_by_dispatch_interval_date.setdefault(demand_forecast.dispatch_interval_date, set()).add(demand_forecast)
-            
\ No newline at end of file
+        self._demand_forecasts.add(simulation.calendar.get_minute(demand_forecast.dispatch_interval_date), [demand_forecast.demand], demand_forecast.sender_id)
+    
+    def _handle_demand_forecast_batch(self, demand_forecast_batch, simulation):
+        '''Processes a consumer's demand forecasts for consecutive dispatch intervals.'''
+        
+        self._demand_forecasts.add(simulation.calendar.get_minute(demand_forecast_batch.first_dispatch_interval_date), demand_forecast_batch.demands, demand_forecast_batch.sender_id)
+            
+#module-level references to the nested namedtuples, which are required for their instances to be pickled
+DispatchIntervalInfo = AEMOperator.DispatchIntervalInfo
+TradingIntervalInfo = AEMOperator.TradingIntervalInfo
@@ -0,0 +1,114 @@
+'''
+This module defines the calendar used by a simulation's clock. Internally, the clock counts
+whole minutes from an epoch (the simulation start date) as integers, which are far cheaper
+to compare, hash and step than dates. The calendar converts between these minute indices
+and dates (at the edges, e.g. for agents, data providers and data monitors), and precomputes
+the dispatch intervals, trading intervals and trading days that each minute of the day falls
+in, so that none of these need to be calculated with date arithmetic every time step.
+'''
+
+from agents import AEMOperator
+from datetime import timedelta
+
+class SimulationCalendar(object):
+    '''
+    Maps the minutes of a simulation (integer indices counted from an epoch date) to and from
+    dates, and to the market intervals they belong to. Minute indices can be negative (i.e.
+    before the epoch). Dates that are not a whole number of minutes from the epoch belong to
+    the minute they fall in; only the minute of a date is considered when determining its
+    market intervals (as AEMOperator does).
+    '''
+    
+    MINUTES_PER_DAY = 24 * 60
+    ONE_MINUTE = timedelta(minutes=1)
+    MAX_MEMOISED_DATES = 2 * 24 * 60 #the memoised conversions are discarded when there are more than this (so memory use does not grow over long simulations)
+    
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self._epoch_minute_of_day = epoch.hour * 60 + epoch.minute
+        self._date_by_minute = {} #memoised conversions of minute indices to dates
+        self._minute_by_date = {} #memoised conversions of dates to minute indices
+        
+        #precompute the market intervals of each minute of the day, as offsets (in minutes) from that minute
+        self._is_dispatch_interval_by_minute_of_day = []
+        self._is_trading_interval_end_by_minute_of_day = []
+        self._trading_interval_end_offset_by_minute_of_day = []
+        self._trading_day_settlement_offset_by_minute_of_day = []
+        trading_day_start_minute_of_day = self._trading_day_start_minute_of_day = AEMOperator.TRADING_DAY_START_HOUR * 60 + AEMOperator.TRADING_DAY_START_MINUTE
+        trading_day_settlement_minute_of_day = AEMOperator.TRADING_DAY_SETTLEMENT_HOUR * 60 + AEMOperator.TRADING_DAY_SETTLEMENT_MINUTE
+        for minute_of_day in xrange(self.MINUTES_PER_DAY):
+            minute_of_hour = minute_of_day % 60
+            self._is_dispatch_interval_by_minute_of_day.append(minute_of_hour % AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES == 0)
+            self._is_trading_interval_end_by_minute_of_day.append(minute_of_hour in (AEMOperator.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE, AEMOperator.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE))
+            
+            #the end of the trading interval the minute is in (a trading interval includes its end, but not its start)
+            if 0 < minute_of_hour <= AEMOperator.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE:
+                self._trading_interval_end_offset_by_minute_of_day.append(AEMOperator.FIRST_HOURLY_TRADING_INTERVAL_END_MINUTE - minute_of_hour)
+            elif minute_of_hour == AEMOperator.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE:
+                self._trading_interval_end_offset_by_minute_of_day.append(0)
+            else:
+                self._trading_interval_end_offset_by_minute_of_day.append(60 + AEMOperator.SECOND_HOURLY_TRADING_INTERVAL_END_MINUTE - minute_of_hour)
+            
+            #the settlement date of the trading day the minute is in (the trading day includes its end, but not its start)
+            settlement_offset = minute_of_day - trading_day_settlement_minute_of_day
+            if minute_of_day <= trading_day_start_minute_of_day:
+                settlement_offset += self.MINUTES_PER_DAY
+            self._trading_day_settlement_offset_by_minute_of_day.append(-settlement_offset)
+    
+    def get_minute(self, date):
+        '''Gets the minute index that the specified date falls in.'''
+        
+        minute = self._minute_by_date.get(date, None)
+        if minute is None:
+            time_difference = date - self.epoch
+            minute = (time_difference.days * 86400 + time_difference.seconds) // 60
+        return minute
+    
+    def get_minute_at_or_after(self, date):
+        '''Gets the first minute index that is not before the specified date.'''
+        
+        minute = self._minute_by_date.get(date, None)
+        if minute is None:
+            time_difference = date - self.epoch
+            minute = -(-(time_difference.days * 86400000000 + time_difference.seconds * 1000000 + time_difference.microseconds) // 60000000)
+        return minute
+    
+    def get_date(self, minute):
+        '''Gets the date of the specified minute index.'''
+        
+        date = self._date_by_minute.get(minute, None)
+        if date is None:
+            if len(self._date_by_minute) >= self.MAX_MEMOISED_DATES:
+                self._date_by_minute.clear()
+                self._minute_by_date.clear()
+            date = self._date_by_minute[minute] = self.epoch + self.ONE_MINUTE * minute
+            self._minute_by_date[date] = minute
+        return date
+    
+    def get_minute_of_day(self, minute):
+        '''Gets the minute of the day (from midnight) of the specified minute index.'''
+        return (self._epoch_minute_of_day + minute) % self.MINUTES_PER_DAY
+    
+    def is_dispatch_interval(self, minute):
+        '''Returns True if a dispatch interval ends at the specified minute index; otherwise, False.'''
+        return self._is_dispatch_interval_by_minute_of_day[(self._epoch_minute_of_day + minute) % self.MINUTES_PER_DAY]
+    
+    def is_trading_interval_end(self, minute):
+        '''Returns True if a trading interval ends at the specified minute index; otherwise, False.'''
+        return self._is_trading_interval_end_by_minute_of_day[(self._epoch_minute_of_day + minute) % self.MINUTES_PER_DAY]
+    
+    def get_next_dispatch_interval_minute(self, minute):
+        '''Gets the minute index of the first dispatch interval after the specified minute index.'''
+        return minute + AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES - self.get_minute_of_day(minute) % AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES
+    
+    def get_trading_interval_end_minute(self, minute):
+        '''Gets the minute index at which the trading interval of the specified minute index ends.'''
+        return minute + self._trading_interval_end_offset_by_minute_of_day[(self._epoch_minute_of_day + minute) % self.MINUTES_PER_DAY]
+    
+    def get_trading_day_end_minute(self, minute):
+        '''Gets the minute index at which the trading day of the specified minute index ends.'''
+        return minute + (self._trading_day_start_minute_of_day - self.get_minute_of_day(minute)) % self.MINUTES_PER_DAY
+    
+    def get_trading_day_settlement_minute(self, minute):
+        '''Gets the minute index of the settlement date of the trading day of the specified minute index.'''
+        return minute + self._trading_day_settlement_offset_by_minute_of_day[(self._epoch_minute_of_day + minute) % self.MINUTES_PER_DAY]
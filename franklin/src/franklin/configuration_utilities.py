@@ -5,9 +5,11 @@ parsing, validating, and running configuration dictionaries.
 '''
 
 import os
-from franklin.logger import BasicFileLogger
+from franklin.logger import BasicFileLogger, LoggerAdapter
 from franklin.simulation import Simulation
+from franklin.parallel import ParallelSimulation
 from franklin.events import SimulationEvent
+from franklin.metrics import SimulationMetrics
 from franklin.agents import AEMOperator
 from datetime import datetime, timedelta
 
@@ -74,8 +76,59 @@ CONFIG_SYNTAX = {
     'data_monitor': {
         'pre-validator': lambda x: _has_attributes(x, 'log_run'),
     },
+    'dispatch_engine': {
+        'pre-validator': lambda x: _has_attributes(x, 'create_merit_order_stack', 'dispatch'),
+        'default': None, #use the market operator's default dispatch engine
+    },
+    'parallel_regions': {
+        'pre-validator': lambda x: isinstance(x, bool),
+        'default': False, #if True, each region is simulated in a separate process (see the parallel module)
+    },
+    'region_exchange': {
+        'pre-validator': lambda x: _has_attributes(x, 'get_quantity', 'receive_quantities'),
+        'default': None, #exchanges quantities between regions when parallel_regions is True
+        'post-validators': {
+            'parallel_regions': lambda x, parallel_regions: x is None or parallel_regions,
+        },
+    },
+    'snapshot_file': {
+        'pre-validator': lambda x: isinstance(x, basestring),
+        'default': None, #if specified, snapshots of the simulation are saved to this file as it runs, so that it can be resumed
+        'post-validators': {
+            'parallel_regions': lambda x, parallel_regions: x is None or not parallel_regions,
+        },
+    },
+    'snapshot_interval': {
+        'pre-validator': lambda x: isinstance(x, timedelta) and x > timedelta(0),
+        'default': timedelta(days=1), #the simulated time between snapshots
+    },
+    'result_history_window': {
+        'pre-validator': lambda x: isinstance(x, timedelta) and x >= timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL),
+        'default': None, #if specified, market operators only keep the results of their intervals within this window (which requires a streaming data monitor)
+        'post-validators': {
+            'data_monitor': lambda x, data_monitor: x is None or _is_streaming_data_monitor(data_monitor),
+            'parallel_regions': lambda x, parallel_regions: x is None or not parallel_regions,
+            'snapshot_file': lambda x, snapshot_file: x is None or snapshot_file is None,
+        },
+    },
+    'rollup_intervals': {
+        'pre-validator': lambda x: isinstance(x, dict) and all(_is_rollup_interval(interval) for interval in x.values()),
+        'default': {}, #names mapped to the duration of intervals that every market operator rolls its dispatch intervals up into (e.g. hourly; see AEMOperator.add_rollup())
+    },
+    'metrics_file': {
+        'pre-validator': lambda x: isinstance(x, basestring),
+        'default': None, #if specified, metrics of the simulation's performance are written to this file as it runs (see the metrics module)
+        'post-validators': {
+            'parallel_regions': lambda x, parallel_regions: x is None or not parallel_regions,
+        },
+    },
+    'metrics_interval': {
+        'pre-validator': lambda x: isinstance(x, timedelta) and x > timedelta(0),
+        'default': timedelta(hours=1), #the simulated time between writing metrics to file
+    },
     'logger': {
         'pre-validator': lambda x: _has_attributes(x, 'debug', 'info', 'warning', 'error', 'critical'),
+        'post-processor': lambda x: x if _has_attributes(x, 'is_enabled_for', 'log', 'flush', 'close') else LoggerAdapter(x), #a logger with only the level methods is adapted (see the logger module)
         'default': BasicFileLogger(),
     },
 }
@@ -88,6 +141,19 @@ def _has_attributes(x, *attributes):
             return False
     return True
 
+def _is_streaming_data_monitor(x):
+    '''Returns True if x is a data monitor that can be passed the results of each interval while a
+    simulation is running (see the data_monitors module); otherwise, False.'''
+    return _has_attributes(x, 'start_run', 'log_dispatch_interval', 'log_trading_interval', 'finish_run')
+
+def _is_rollup_interval(x):
+    '''Returns True if x is a valid rollup interval (a whole number of dispatch intervals that divides a day); otherwise, False.'''
+    
+    if not isinstance(x, timedelta) or x <= timedelta(0) or x > timedelta(days=1):
+        return False
+    minutes, remainder = divmod(x.days * 86400 + x.seconds, 60)
+    return remainder == 0 and x.microseconds == 0 and minutes % AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES == 0 and (24 * 60) % minutes == 0
+
 def _is_iterable(x, treat_string_as_iterable=True):
     '''Returns True if x is an iterable sequence; otherwise, False. By default,
     strings are treated as iterable.'''
@@ -142,9 +208,10 @@ def validate_config_dict(config_dict):
             
     return (critical_errors, non_critical_errors)
 
-def load_config_dict_from_module(module_path):
+def load_config_dict_from_module(module_path, attribute_name=CONFIG_DICT_NAME):
     '''Loads a Python module containing a config dictionary from a specified file path.
-    Returns the config dictionary if it exists; otherwise, None is returned.'''
+    Returns the config dictionary if it exists; otherwise, None is returned. Another of the 
+    module's attributes can be loaded instead by specifying its name.'''
     
     folder = os.path.dirname(module_path)
     mod_name = os.path.basename(module_path)
@@ -159,7 +226,7 @@ def load_config_dict_from_module(module_path):
         for bit in mod_name.split('.'):
             mod = getattr(mod, bit)
         
-        return getattr(mod, CONFIG_DICT_NAME, None)
+        return getattr(mod, attribute_name, None)
     
     elif os.path.exists(py_file):
         mod = { }
@@ -170,18 +237,70 @@ def load_config_dict_from_module(module_path):
         finally:
             source.close()
         
-        return mod.get(CONFIG_DICT_NAME, None)
+        return mod.get(attribute_name, None)
     else:
         return None
 
-def run_simulation_with_config(config_dict):
-    '''Executes a simulation run using the specified config dictionary. This can fail if the config
-    has not been parsed and validated first.'''
+def run_simulation_with_config(config_dict, resume=False, collect_metrics=False):
+    '''Executes a simulation run using the specified config dictionary, returning the simulation once
+    it has finished. If resume is True, the simulation is resumed from the config's snapshot file instead
+    of starting from the beginning. Metrics are collected (in the simulation's metrics) if collect_metrics
+    is True or the config specifies a metrics file. This can fail if the config has not been parsed and 
+    validated first.'''
     
     #run a simulation
-    simulation = Simulation(config_dict['logger'], config_dict['start_date'], config_dict['end_date'], config_dict['regions'], 
-                            config_dict['generators'], config_dict['consumers'], config_dict['events'])
-    simulation.run()
+    if resume:
+        assert config_dict['snapshot_file'], 'A snapshot file is required to resume a simulation.'
+        simulation = Simulation.load_snapshot(config_dict['snapshot_file'])
+        simulation.logger = config_dict['logger']
+    elif config_dict['parallel_regions']:
+        simulation = ParallelSimulation(config_dict['logger'], config_dict['start_date'], config_dict['end_date'], config_dict['regions'], 
+                                        config_dict['generators'], config_dict['consumers'], config_dict['events'], config_dict['dispatch_engine'],
+                                        config_dict['region_exchange'])
+    else:
+        simulation = Simulation(config_dict['logger'], config_dict['start_date'], config_dict['end_date'], config_dict['regions'], 
+                                config_dict['generators'], config_dict['consumers'], config_dict['events'], config_dict['dispatch_engine'])
+    
+    #roll each market operator's dispatch intervals up into longer intervals (a resumed simulation's operators already do)
+    if not resume:
+        for name,rollup_interval in config_dict['rollup_intervals'].items():
+            for operator in simulation.operator_by_region.values():
+                operator.add_rollup(name, (rollup_interval.days * 86400 + rollup_interval.seconds) // 60)
+    
+    if collect_metrics or config_dict['metrics_file']:
+        if simulation.metrics is None:
+            simulation.metrics = SimulationMetrics()
+        simulation.metrics.file_location = config_dict['metrics_file']
+        simulation.metrics.report_interval = config_dict['metrics_interval']
+    
+    if config_dict['result_history_window'] is not None:
+        result_history_window = config_dict['result_history_window']
+        for operator in simulation.operator_by_region.values():
+            operator.result_history_minutes = result_history_window.days * 24 * 60 + result_history_window.seconds // 60
+    
+    #stream the results of each interval to the data monitor while the simulation runs, if it supports it
+    #(the market operators of parallel regions run in other processes, so their results are logged at the end)
+    data_monitor = config_dict['data_monitor']
+    streaming = _is_streaming_data_monitor(data_monitor) and not config_dict['parallel_regions']
+    if streaming:
+        data_monitor.start_run(simulation)
+        simulation.streaming_monitors.append(data_monitor)
+    try:
+        if config_dict['snapshot_file']:
+            simulation.run(config_dict['snapshot_file'], config_dict['snapshot_interval'])
+        else:
+            simulation.run()
+    finally:
+        try:
+            if streaming:
+                simulation.streaming_monitors.remove(data_monitor)
+                data_monitor.finish_run(simulation)
+        finally:
+            #write any log records still waiting to be written
+            simulation.logger.close()
     
-    #log the run data via the data monitor
-    config_dict['data_monitor'].log_run(simulation)
\ No newline at end of file
+    #log the run data via the data monitor (and the metrics of the final report interval)
+    data_monitor.log_run(simulation)
+    if simulation.metrics is not None and simulation.metrics.file_location:
+        simulation.metrics.report(simulation)
+    return simulation
\ No newline at end of file
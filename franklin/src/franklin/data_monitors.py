@@ -3,16 +3,20 @@ This module defines classes that enable one to monitor the output data produced
 a simulation run.
 '''
 
-import os
+import os, threading, Queue, itertools, sqlite3, cPickle
 from datetime import datetime, timedelta
 from csv import writer
 from agents import AEMOperator
+from clock import SimulationCalendar
+from results import IntervalResultStore
 
 class CSVFileMonitor(object):
     '''A basic monitor that outputs demand and price per dispatch interval
     per region to a specified file. Output is in CSV format.'''
     
     DATE_TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+    TRADING_INTERVAL_HEADER = ['INTERVAL_TYPE', 'REGION_ID', 'TRADING_INTERVAL', 'SPOT_PRICE', 'TOTAL_DEMAND', 'DEMAND_SUPPLIED', 'GENERATORS_DISPATCHED(MW)']
+    DISPATCH_INTERVAL_HEADER = ['INTERVAL_TYPE', 'REGION_ID', 'DISPATCH_INTERVAL', 'PRICE', 'PRICE_BAND_NO', 'TOTAL_DEMAND', 'DEMAND_SUPPLIED', 'GENERATORS_DISPATCHED(PRICE,MW)']
     
     def __init__(self, file_location):
         self.file_location = file_location
@@ -28,45 +32,331 @@ class CSVFileMonitor(object):
         #open file
         file_writer = writer(open(self.file_location, 'wb'))
         
-        #write trading interval data to file
-        file_writer.writerow(['INTERVAL_TYPE', 'REGION_ID', 'TRADING_INTERVAL', 'SPOT_PRICE', 'TOTAL_DEMAND', 'DEMAND_SUPPLIED', 'GENERATORS_DISPATCHED(MW)'])
+        #write trading interval data to file (directly from the operators' result stores, see the results module)
+        file_writer.writerow(self.TRADING_INTERVAL_HEADER)
+        trading_interval_minutes = self._get_interval_minutes(simulation, AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL)
         for operator in simulation.operator_by_region.values():
-            time = simulation.start_date
-            while time < simulation.end_date:
-                time += timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL)
-                if time in operator.trading_interval_info_by_date:
-                    trading_interval_info_by_date = operator.trading_interval_info_by_date[time]
-                    file_writer.writerow(['TRADING', 
-                                          operator.region_id, 
-                                          time.strftime(self.DATE_TIME_FORMAT), 
-                                          trading_interval_info_by_date.spot_price, 
-                                          trading_interval_info_by_date.total_demand, 
-                                          trading_interval_info_by_date.total_demand_supplied,
-                                          ','.join(['%s(%.2f)' % (id,demand_supplied) for (id,demand_supplied) in sorted(trading_interval_info_by_date.demand_supplied_by_generator_id.items(), key=lambda (id,demand_supplied): demand_supplied, reverse=True)])])
+            results = operator.trading_interval_results
+            for minute in trading_interval_minutes:
+                if results is not None and minute in results:
+                    file_writer.writerow(self._get_trading_interval_row(simulation, operator, minute))
                 else:
-                    file_writer.writerow(['TRADING', operator.region_id, time.strftime(self.DATE_TIME_FORMAT), 'N/A', 'N/A', 'N/A', 'N/A'])
+                    file_writer.writerow(['TRADING', operator.region_id, simulation.calendar.get_date(minute).strftime(self.DATE_TIME_FORMAT), 'N/A', 'N/A', 'N/A', 'N/A'])
         
         #write dispatch interval data to file
-        file_writer.writerow(['INTERVAL_TYPE', 'REGION_ID', 'DISPATCH_INTERVAL', 'PRICE', 'PRICE_BAND_NO', 'TOTAL_DEMAND', 'DEMAND_SUPPLIED', 'GENERATORS_DISPATCHED(PRICE,MW)'])
+        file_writer.writerow(self.DISPATCH_INTERVAL_HEADER)
+        dispatch_interval_minutes = self._get_interval_minutes(simulation, AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
         for operator in simulation.operator_by_region.values():
-            time = simulation.start_date
-            while time < simulation.end_date:
-                time += timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
-                if time in operator.dispatch_interval_info_by_date:
-                    dispatch_interval_info = operator.dispatch_interval_info_by_date[time]
-                    file_writer.writerow(['DISPATCH', 
-                                          operator.region_id, 
-                                          time.strftime(self.DATE_TIME_FORMAT), 
-                                          dispatch_interval_info.price, 
-                                          dispatch_interval_info.price_band_no+1, 
-                                          dispatch_interval_info.total_demand,
-                                          dispatch_interval_info.total_demand_supplied,
-                                          ','.join(['%s(%.2f,%.2f)' % (id,price_offer,demand_supplied) for id,(price_offer,demand_supplied) in sorted(dispatch_interval_info.price_offer_and_supply_by_generator_id.items(), key=lambda (id,(price_offer,demand_supplied)): price_offer)])])
+            results = operator.dispatch_interval_results
+            for minute in dispatch_interval_minutes:
+                if results is not None and minute in results:
+                    file_writer.writerow(self._get_dispatch_interval_row(simulation, operator, minute))
                 else:
-                    file_writer.writerow(['DISPATCH', operator.region_id, time.strftime(self.DATE_TIME_FORMAT), 'N/A', 'N/A', 'N/A', 'N/A', 'N/A'])
+                    file_writer.writerow(['DISPATCH', operator.region_id, simulation.calendar.get_date(minute).strftime(self.DATE_TIME_FORMAT), 'N/A', 'N/A', 'N/A', 'N/A', 'N/A'])
+    
+    def _get_trading_interval_row(self, simulation, operator, minute):
+        '''Gets the row written to file for an operator's trading interval (at the specified minute index).'''
+        
+        results = operator.trading_interval_results
+        spot_price, total_demand_supplied, total_demand = results.get_values(minute)
+        return ['TRADING', 
+                operator.region_id, 
+                simulation.calendar.get_date(minute).strftime(self.DATE_TIME_FORMAT), 
+                spot_price, 
+                total_demand, 
+                total_demand_supplied,
+                ','.join(['%s(%.2f)' % (id,demand_supplied) for (id,demand_supplied) in sorted(results.get_supply_entries(minute), key=lambda (id,demand_supplied): demand_supplied, reverse=True)])]
+    
+    def _get_dispatch_interval_row(self, simulation, operator, minute):
+        '''Gets the row written to file for an operator's dispatch interval (at the specified minute index).'''
+        
+        results = operator.dispatch_interval_results
+        price, total_demand_supplied, total_demand, price_band_no = results.get_values(minute)
+        return ['DISPATCH', 
+                operator.region_id, 
+                simulation.calendar.get_date(minute).strftime(self.DATE_TIME_FORMAT), 
+                price, 
+                int(price_band_no)+1, 
+                total_demand,
+                total_demand_supplied,
+                ','.join(['%s(%.2f,%.2f)' % (id,price_offer,demand_supplied) for id,price_offer,demand_supplied in sorted(results.get_supply_entries(minute), key=lambda (id,price_offer,demand_supplied): price_offer)])]
+    
+    def _get_interval_minutes(self, simulation, interval_duration_minutes):
+        '''Gets the minute index (see the clock module) at the end of every interval of the specified duration 
+        (in minutes) from the simulation start date, up to the first one at or after the end date.'''
+        
+        calendar = simulation.calendar
+        start_minute = calendar.get_minute(simulation.start_date)
+        end_minute = calendar.get_minute_at_or_after(simulation.end_date)
+        return xrange(start_minute + interval_duration_minutes, end_minute + interval_duration_minutes, interval_duration_minutes)
     
     def _format_dict_for_csv(self, d):
         return 
     
     def _format_iterable_for_csv(self, iterable):
-        return ','.join(iterable)
\ No newline at end of file
+        return ','.join(iterable)
+
+class StreamingCSVFileMonitor(CSVFileMonitor):
+    '''
+    A monitor that writes the same rows as CSVFileMonitor, but while the simulation is running: it is
+    passed the results of each dispatch and trading interval by the market operators as soon as they
+    are stored, so they are not lost if the run is interrupted, and the operators do not need to keep
+    their full history (see the result_history_window config key). Rows are written in the order the
+    intervals finish (trading and dispatch interval rows interleaved, after both header rows), and only
+    for intervals with results. Rows are handed to a background thread in batches, which writes them to
+    file, so the simulation never waits on disk I/O. If the monitor is not used for streaming (e.g. when
+    regions are run in parallel), the whole run is written at the end, as CSVFileMonitor does.
+    '''
+    
+    def __init__(self, file_location, rows_per_batch=1000):
+        super(StreamingCSVFileMonitor, self).__init__(file_location)
+        self.rows_per_batch = rows_per_batch #the number of rows handed to the writer thread at a time
+        self._rows = None #the rows waiting to be handed to the writer thread
+        self._row_batches = None #a queue of the row batches waiting to be written (None stops the writer thread)
+        self._writer_thread = None
+        self._writer_error = None
+        self._streamed = False
+    
+    def start_run(self, simulation):
+        '''Opens the file and starts the writer thread. Any results the operators already have (e.g. when
+        the simulation has been resumed from a snapshot) are written first.'''
+        
+        #create directory if it does not exist
+        directory = os.path.dirname(self.file_location)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        self._row_batches = Queue.Queue()
+        self._writer_thread = threading.Thread(target=self._write_row_batches, args=(open(self.file_location, 'wb'),))
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+        self._rows = [self.TRADING_INTERVAL_HEADER, self.DISPATCH_INTERVAL_HEADER]
+        self._writer_error = None
+        self._streamed = True
+        
+        for operator in simulation.operator_by_region.values():
+            if operator.dispatch_interval_results is not None:
+                for minute in operator.dispatch_interval_results.get_minutes():
+                    self.log_dispatch_interval(simulation, operator, minute)
+                for minute in operator.trading_interval_results.get_minutes():
+                    self.log_trading_interval(simulation, operator, minute)
+    
+    def log_dispatch_interval(self, simulation, operator, minute):
+        '''Writes an operator's dispatch interval results (at the specified minute index) to file.'''
+        
+        if self._is_in_run(simulation, minute, AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES):
+            self._add_row(self._get_dispatch_interval_row(simulation, operator, minute))
+    
+    def log_trading_interval(self, simulation, operator, minute):
+        '''Writes an operator's trading interval results (at the specified minute index) to file.'''
+        
+        if self._is_in_run(simulation, minute, AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL):
+            self._add_row(self._get_trading_interval_row(simulation, operator, minute))
+    
+    def finish_run(self, simulation):
+        '''Writes any remaining rows, then waits for the writer thread to finish and closes the file.'''
+        
+        if self._writer_thread is not None:
+            self._row_batches.put(self._rows)
+            self._row_batches.put(None)
+            self._writer_thread.join()
+            self._rows = self._row_batches = self._writer_thread = None
+            if self._writer_error is not None:
+                raise IOError('Failed to write to \'%s\': %s' % (self.file_location, self._writer_error))
+    
+    def log_run(self, simulation):
+        '''Writes the whole run to file, unless it has already been streamed.'''
+        
+        if not self._streamed:
+            super(StreamingCSVFileMonitor, self).log_run(simulation)
+    
+    def _is_in_run(self, simulation, minute, interval_duration_minutes):
+        '''Returns True if the interval ending at the specified minute index is one that CSVFileMonitor 
+        writes (see _get_interval_minutes()); otherwise, False.'''
+        
+        calendar = simulation.calendar
+        start_minute = calendar.get_minute(simulation.start_date)
+        return start_minute < minute < calendar.get_minute_at_or_after(simulation.end_date) + interval_duration_minutes
+    
+    def _add_row(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.rows_per_batch:
+            self._row_batches.put(self._rows)
+            self._rows = []
+    
+    def _write_row_batches(self, output_file):
+        '''Writes the row batches in the queue to file until it is stopped (run in the writer thread).'''
+        
+        with output_file:
+            file_writer = writer(output_file)
+            while True:
+                rows = self._row_batches.get()
+                if rows is None:
+                    break
+                if self._writer_error is None:
+                    try:
+                        file_writer.writerows(rows)
+                    except Exception as e:
+                        self._writer_error = e #reported by finish_run()
+    
+    def __getstate__(self):
+        #the writer thread and its queue are not copied (e.g. into a sweep's variants)
+        state = self.__dict__.copy()
+        state.update(_rows=None, _row_batches=None, _writer_thread=None, _writer_error=None, _streamed=False)
+        return state
+
+class SQLiteFileMonitor(object):
+    '''
+    A monitor that outputs the results of every dispatch and trading interval per region to an SQLite
+    database file (replacing any existing file), with the supply of each generator dispatched in separate,
+    normalised tables. Intervals are identified by the minute index they end at, counted from the
+    simulation start date (which is stored in the simulation table); the interval tables are indexed by
+    region and interval. Every row is inserted in bulk, in a single transaction. The results can be read
+    back with load_results(), or queried directly with SQL.
+    '''
+    
+    SCHEMA = '''
+        CREATE TABLE simulation (start_date TEXT, end_date TEXT);
+        CREATE TABLE generators (generator_no INTEGER PRIMARY KEY, generator_id TEXT UNIQUE);
+        CREATE TABLE trading_intervals (region_id TEXT, interval_minute INTEGER, spot_price REAL, total_demand REAL, total_demand_supplied REAL, 
+                                        PRIMARY KEY (region_id, interval_minute));
+        CREATE TABLE trading_interval_supplies (region_id TEXT, interval_minute INTEGER, generator_no INTEGER REFERENCES generators, demand_supplied REAL);
+        CREATE TABLE dispatch_intervals (region_id TEXT, interval_minute INTEGER, price REAL, price_band_no INTEGER, total_demand REAL, total_demand_supplied REAL, 
+                                         PRIMARY KEY (region_id, interval_minute));
+        CREATE TABLE dispatch_interval_supplies (region_id TEXT, interval_minute INTEGER, generator_no INTEGER REFERENCES generators, price_offer REAL, demand_supplied REAL);
+    '''
+    DATE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S' #the date format understood by SQLite's date functions
+    INDEXES = '''
+        CREATE INDEX trading_interval_supplies_by_interval ON trading_interval_supplies (region_id, interval_minute);
+        CREATE INDEX trading_interval_supplies_by_generator ON trading_interval_supplies (generator_no);
+        CREATE INDEX dispatch_interval_supplies_by_interval ON dispatch_interval_supplies (region_id, interval_minute);
+        CREATE INDEX dispatch_interval_supplies_by_generator ON dispatch_interval_supplies (generator_no);
+    '''
+    
+    def __init__(self, file_location):
+        self.file_location = file_location
+    
+    def log_run(self, simulation):
+        '''Writes the results of every dispatch and trading interval to the database file.'''
+        
+        #create directory if it does not exist, and replace any existing file
+        directory = os.path.dirname(self.file_location)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.file_location):
+            os.remove(self.file_location)
+        
+        connection = sqlite3.connect(self.file_location)
+        try:
+            with connection:
+                connection.executescript(self.SCHEMA)
+                connection.execute('INSERT INTO simulation VALUES (?, ?)', (simulation.start_date.strftime(self.DATE_TIME_FORMAT), simulation.end_date.strftime(self.DATE_TIME_FORMAT)))
+                generator_no_by_generator_id = {}
+                for region_id,operator in sorted(simulation.operator_by_region.items()):
+                    if operator.dispatch_interval_results is not None:
+                        self._insert_results(connection, region_id, operator.trading_interval_results, 'trading', generator_no_by_generator_id)
+                        self._insert_results(connection, region_id, operator.dispatch_interval_results, 'dispatch', generator_no_by_generator_id)
+                connection.executemany('INSERT INTO generators VALUES (?, ?)', ((generator_no, generator_id) for generator_id,generator_no in generator_no_by_generator_id.items()))
+                #indexing once all rows are inserted is faster than maintaining the indexes during the inserts
+                connection.executescript(self.INDEXES)
+        finally:
+            connection.close()
+    
+    def _insert_results(self, connection, region_id, results, interval_type, generator_no_by_generator_id):
+        '''Inserts the results of every interval in a result store into the tables of an interval type (e.g. trading).'''
+        
+        for generator_id in results.generator_ids:
+            generator_no_by_generator_id.setdefault(generator_id, len(generator_no_by_generator_id))
+        minutes = results.get_minutes()
+        connection.executemany('INSERT INTO %s_intervals (region_id, interval_minute, %s) VALUES (?, ?%s)' % (interval_type, ', '.join(results.column_names), ', ?' * len(results.column_names)), 
+                               ((region_id, minute) + results.get_values(minute) for minute in minutes))
+        connection.executemany('INSERT INTO %s_interval_supplies VALUES (?, ?, ?%s)' % (interval_type, ', ?' * (2 if results.has_price_offers else 1)), 
+                               ((region_id, minute, generator_no_by_generator_id[entry[0]]) + entry[1:] for minute in minutes for entry in results.get_supply_entries(minute)))
+    
+    @staticmethod
+    def load_results(file_location):
+        '''Reads back the results written to a database file. Returns a dictionary of region ids mapped to a tuple 
+        of their dispatch and trading interval result stores (see the results module), which can then be queried
+        by date, generator, etc.'''
+        
+        connection = sqlite3.connect(file_location)
+        connection.text_factory = str #ids are read back as they were written, rather than as unicode
+        try:
+            start_date, = connection.execute('SELECT start_date FROM simulation').fetchone()
+            calendar = SimulationCalendar(datetime.strptime(start_date, SQLiteFileMonitor.DATE_TIME_FORMAT))
+            generator_id_by_generator_no = dict(connection.execute('SELECT generator_no, generator_id FROM generators'))
+            results_by_region_id = {}
+            for region_id, in connection.execute('SELECT DISTINCT region_id FROM dispatch_intervals ORDER BY region_id').fetchall():
+                results_by_region_id[region_id] = (
+                    SQLiteFileMonitor._load_result_store(connection, calendar, region_id, 'dispatch', AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES, 
+                                                         AEMOperator.DISPATCH_INTERVAL_RESULT_COLUMNS, generator_id_by_generator_no),
+                    SQLiteFileMonitor._load_result_store(connection, calendar, region_id, 'trading', AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL, 
+                                                         AEMOperator.TRADING_INTERVAL_RESULT_COLUMNS, generator_id_by_generator_no),
+                )
+            return results_by_region_id
+        finally:
+            connection.close()
+    
+    @staticmethod
+    def _load_result_store(connection, calendar, region_id, interval_type, interval_duration_minutes, column_names, generator_id_by_generator_no):
+        '''Creates a result store from the rows of a region in the tables of an interval type (e.g. trading).'''
+        
+        has_price_offers = interval_type == 'dispatch'
+        first_minute, last_minute = connection.execute('SELECT MIN(interval_minute), MAX(interval_minute) FROM %s_intervals WHERE region_id = ?' % interval_type, (region_id,)).fetchone()
+        results = IntervalResultStore(calendar, interval_duration_minutes, column_names, first_minute if first_minute is not None else 0, last_minute, has_price_offers)
+        
+        #the supply entries of each interval are read back in the order they were inserted (i.e. the order they were stored in)
+        supply_rows = connection.execute('SELECT interval_minute, generator_no, %s demand_supplied FROM %s_interval_supplies WHERE region_id = ? ORDER BY interval_minute, rowid' % 
+                                         ('price_offer,' if has_price_offers else '', interval_type), (region_id,))
+        supply_rows_by_minute = itertools.groupby(supply_rows, key=lambda row: row[0])
+        next_supply_rows = next(supply_rows_by_minute, None)
+        for row in connection.execute('SELECT interval_minute, %s FROM %s_intervals WHERE region_id = ? ORDER BY interval_minute' % (', '.join(column_names), interval_type), (region_id,)):
+            minute = row[0]
+            entries = []
+            if next_supply_rows is not None and next_supply_rows[0] == minute:
+                entries = [ (generator_id_by_generator_no[supply_row[1]],) + supply_row[2:] for supply_row in next_supply_rows[1] ]
+                next_supply_rows = next(supply_rows_by_minute, None)
+            results.add(minute, row[1:], entries)
+        return results
+
+class BinaryFileMonitor(object):
+    '''
+    A monitor that outputs the results of every dispatch and trading interval per region to a compact binary
+    file: the raw contents of the columns of each market operator's result stores (see the results module),
+    after a small pickled header. The file is written and read back (with load_results()) without creating an
+    object per interval, but is only intended to be read on machines of the same architecture.
+    '''
+    
+    FILE_SIGNATURE = 'FRANKLIN-RESULTS-1\n'
+    
+    def __init__(self, file_location):
+        self.file_location = file_location
+    
+    def log_run(self, simulation):
+        '''Writes the results of every dispatch and trading interval to file.'''
+        
+        #create directory if it does not exist
+        directory = os.path.dirname(self.file_location)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        region_ids = sorted(region_id for region_id,operator in simulation.operator_by_region.items() if operator.dispatch_interval_results is not None)
+        with open(self.file_location, 'wb') as output_file:
+            output_file.write(self.FILE_SIGNATURE)
+            cPickle.dump((simulation.start_date, simulation.end_date, region_ids), output_file, cPickle.HIGHEST_PROTOCOL)
+            for region_id in region_ids:
+                operator = simulation.operator_by_region[region_id]
+                operator.dispatch_interval_results.save(output_file)
+                operator.trading_interval_results.save(output_file)
+    
+    @staticmethod
+    def load_results(file_location):
+        '''Reads back the results written to a file. Returns a dictionary of region ids mapped to a tuple of their
+        dispatch and trading interval result stores (see the results module), which can then be queried by date,
+        generator, etc.'''
+        
+        with open(file_location, 'rb') as input_file:
+            assert input_file.read(len(BinaryFileMonitor.FILE_SIGNATURE)) == BinaryFileMonitor.FILE_SIGNATURE, '\'%s\' is not a results file.' % file_location
+            start_date, _, region_ids = cPickle.load(input_file)
+            calendar = SimulationCalendar(start_date)
+            return { region_id: (IntervalResultStore.load(input_file, calendar), IntervalResultStore.load(input_file, calendar)) for region_id in region_ids }
@@ -4,10 +4,108 @@ to a simulation.
 '''
 
 from agents import AEMOperator
-from messaging import GeneratorDispatchOffer, GeneratorAvailabilityRebid, GeneratorAvailabilityBid
+from messaging import Message, GeneratorDispatchOffer, GeneratorAvailabilityRebid, GeneratorAvailabilityBid
 from datetime import datetime, timedelta
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from bisect import bisect_left, bisect_right
+from itertools import islice
 from csv import reader
+from array import array
+from copy import copy
+import os, re, time, random, hashlib, cPickle
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class DataProviderCache(object):
+    '''
+    Stores the data parsed by a data provider in a binary (pickled) cache file, so that it
+    can be loaded back without parsing the data file again. Cache files are keyed by a hash
+    of the data file's contents and the parser's name, version and arguments; if any of these
+    change, the cache file is rebuilt (and the outdated one removed) automatically.
+    '''
+    
+    CACHE_FILE_EXTENSION = '.cache'
+    HASH_BLOCK_SIZE = 1024 * 1024
+    
+    def __init__(self, cache_directory, file_location, *parser_key):
+        self.cache_directory = cache_directory
+        self._cache_file_prefix = '%s.%s.' % (os.path.basename(file_location), hashlib.sha1(repr(parser_key)).hexdigest()[:8])
+        
+        data_file_hash = hashlib.sha1()
+        with open(file_location, 'rb') as data_file:
+            for block in iter(lambda: data_file.read(self.HASH_BLOCK_SIZE), ''):
+                data_file_hash.update(block)
+        self.cache_file_location = os.path.join(cache_directory, self._cache_file_prefix + data_file_hash.hexdigest() + self.CACHE_FILE_EXTENSION)
+    
+    def load(self):
+        '''Loads the cached data. Returns None if there is no cache file or it cannot be read.'''
+        
+        if os.path.exists(self.cache_file_location):
+            try:
+                with open(self.cache_file_location, 'rb') as cache_file:
+                    return cPickle.load(cache_file)
+            except Exception:
+                #an unreadable cache file is simply rebuilt
+                pass
+        return None
+    
+    def save(self, data):
+        '''Saves the data to the cache file, removing any outdated cache files for the same data
+        file and parser. Several processes can save the same cache file at once (e.g. the processes
+        of a ParallelSimulation or a sweep); whichever renames its file last wins.'''
+        
+        if not os.path.exists(self.cache_directory):
+            try:
+                os.makedirs(self.cache_directory)
+            except OSError:
+                #another process may have created it first
+                if not os.path.isdir(self.cache_directory):
+                    raise
+        
+        #write to a temporary file (of this process) first, so that a partially written cache file is never loaded
+        temporary_file_location = '%s.%d.tmp' % (self.cache_file_location, os.getpid())
+        with open(temporary_file_location, 'wb') as cache_file:
+            cPickle.dump(data, cache_file, cPickle.HIGHEST_PROTOCOL)
+        cache_file_name = os.path.basename(self.cache_file_location)
+        for file_name in os.listdir(self.cache_directory):
+            if file_name.startswith(self._cache_file_prefix) and file_name.endswith(self.CACHE_FILE_EXTENSION) and file_name != cache_file_name:
+                try:
+                    os.remove(os.path.join(self.cache_directory, file_name))
+                except OSError:
+                    #already removed by another process
+                    pass
+        try:
+            os.rename(temporary_file_location, self.cache_file_location)
+        except OSError:
+            #another process has already put the cache file in place
+            if not os.path.exists(self.cache_file_location):
+                raise
+            os.remove(temporary_file_location)
+
+class MemoisedDateParser(object):
+    '''
+    Parses date strings of a specified format, remembering the date parsed from each 
+    distinct string. AEMO data files repeat the same few hundred date strings many 
+    thousands of times, so this avoids most calls to datetime.strptime().
+    '''
+    
+    def __init__(self, date_format, strip_seconds=False):
+        self.date_format = date_format
+        self.strip_seconds = strip_seconds #if True, the seconds of parsed dates are set to zero
+        self._date_by_string = {}
+    
+    def parse(self, date_string):
+        '''Gets the date represented by the date string.'''
+        
+        date = self._date_by_string.get(date_string, None)
+        if date is None:
+            date = datetime.strptime(date_string, self.date_format)
+            if self.strip_seconds:
+                date = date.replace(second=0)
+            self._date_by_string[date_string] = date
+        return date
 
 class CSVPublicYestBidDataProvider(object):
     '''Provides bid data from a specified PUBLIC_YESTBID file, found at
@@ -47,11 +145,54 @@ class CSVPublicYestBidDataProvider(object):
     PASAAVAILABILITY_INDEX = 28
     BID_VERSION_NO_INDEX = 30
     BID_ENTRY_TYPE_INDEX = 32
+    
+    PARSER_VERSION = 1 #must be incremented whenever the parsed data changes, so that cached data is rebuilt
+        
+    def __init__(self, file_location, replace_earliest_offer_if_rebid=True, cache_directory=None):
+        '''If a cache directory is specified, the parsed bids are cached there (see DataProviderCache).'''
         
-    def __init__(self, file_location, replace_earliest_offer_if_rebid=True):
         self.start_date = None
         self.end_date = None
         self.bid_by_offer_date_by_duid = {} #duid mapped to an offer date mapped to a dispatch offer or availability re-bid.
+        self._offer_dates_by_duid = {} #duid mapped to a sorted list of its offer dates in bid_by_offer_date_by_duid
+        self.rows_parsed = 0 #the number of rows read from the data file
+        self.parse_duration = 0. #the time taken to parse (or load from cache) the data file (in seconds)
+        self._arguments = (os.path.abspath(file_location), replace_earliest_offer_if_rebid, os.path.abspath(cache_directory) if cache_directory else None) #used to load the provider again when unpickled
+        
+        start_time = time.time()
+        cache = DataProviderCache(cache_directory, file_location, self.__class__.__name__, self.PARSER_VERSION, replace_earliest_offer_if_rebid) if cache_directory else None
+        cached_data = cache.load() if cache else None
+        if cached_data:
+            self._unpack(cached_data)
+        else:
+            with open(file_location, 'rb') as data_file:
+                self._parse(data_file, replace_earliest_offer_if_rebid)
+            if cache:
+                cache.save(self._pack())
+        self._offer_dates_by_duid = { duid: sorted(bid_by_offer_date) for duid,bid_by_offer_date in self.bid_by_offer_date_by_duid.iteritems() }
+        self.parse_duration = time.time() - start_time
+    
+    @property
+    def rows_per_second(self):
+        '''The rate at which the data file was parsed.'''
+        return self.rows_parsed / self.parse_duration if self.parse_duration > 0 else float('inf')
+    
+    def __deepcopy__(self, memo):
+        '''The parsed bids are only ever read from, so copies of a config (e.g. the variants of a 
+        sweep) share the same provider rather than copying every bid.'''
+        return self
+    
+    def __reduce__(self):
+        '''Rather than pickling every bid (e.g. in a simulation snapshot), the provider is pickled as
+        its arguments, and loaded from its file (or cache) again when unpickled.'''
+        return (self.__class__, self._arguments)
+    
+    def _parse(self, data_file, replace_earliest_offer_if_rebid):
+        '''Reads the bids from a PUBLIC_YESTBID data file, streaming it row by row. Dates are parsed 
+        once per distinct date string, and only the columns used by each type of row are decoded.'''
+        
+        parse_date = MemoisedDateParser(self.BID_DATE_FORMAT).parse
+        parse_offer_date = MemoisedDateParser(self.BID_DATE_FORMAT, strip_seconds=True).parse #strip seconds, since the simulation can't handle that granularity. it is unlikely two bids in a single minute would occur anyway.
         
         #maintain a dictionary of duids mapped to a tuple of earliest offer date and earliest dispatch offer
         #this is required in the case where a generator has rebid entries but no daily or default entries in the data file.
@@ -62,28 +203,37 @@ class CSVPublicYestBidDataProvider(object):
         earliest_offer_date_and_offer_by_duid = {}
         
         #read each row in the data file
-        for row in reader(open(file_location, 'rb')):
-            if row[self.ROW_ID_INDEX] == self.REPORT_CONTAINER_ROW_ID_CHAR and row[self.END_OF_REPORT_INDEX] != self.END_OF_REPORT_STR:
-                self.end_date = datetime.strptime(row[self.FILE_PUBLISH_DATE_INDEX], self.FILE_PUBLISH_DATE_FORMAT).replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.TRADING_DAY_START_MINUTE, second=0, microsecond=0)
-                self.start_date = self.end_date - timedelta(days=1)
-            
-            elif row[self.ROW_ID_INDEX] == self.DATA_ROW_ID_CHAR:
+        rows_parsed = 0
+        for row in reader(data_file):
+            rows_parsed += 1
+            row_id = row[self.ROW_ID_INDEX]
+            if row_id == self.DATA_ROW_ID_CHAR:
                 if row[self.BID_TYPE_INDEX] == self.ENERGY_BID_TYPE:
                     duid = row[self.DUID_INDEX]
-                    bid_offer_date = datetime.strptime(row[self.BID_OFFER_DATE_INDEX], self.BID_DATE_FORMAT).replace(second=0) #strip seconds, since the simulation can't handle that granularity. it is unlikely two bids in a single minute would occur anyway.
+                    bid_offer_date = parse_offer_date(row[self.BID_OFFER_DATE_INDEX])
                     bid_offer_type = row[self.BID_OFFER_TYPE_INDEX]
-                    settlement_date = datetime.strptime(row[self.SETTLEMENT_DATE_INDEX], self.BID_DATE_FORMAT)
                     
-                    #if duid == 'MOR3':
-                        
+                    #is it a row containing availability bid per trading interval data? (by far the most common row)
+                    if bid_offer_type == self.TRADING_INTERVAL_OFFER_TYPE:
+                        availability_per_band = map(float, row[self.AVAILABILITY_BAND1_INDEX:self.AVAILABILITY_BAND10_INDEX + 1])
+                        trading_interval_date = parse_date(row[self.TRADING_INTERVAL_DATE_INDEX])
+                        max_availability = float(row[self.MAX_AVAILABILITY_INDEX])
+                        physical_availability = float(row[self.PASAAVAILABILITY_INDEX])
+                        rate_of_change_up_per_min = float(row[self.RATE_OF_CHANGE_UP_PER_MIN_INDEX])
+                        rate_of_change_down_per_min = float(row[self.RATE_OF_CHANGE_DOWN_PER_MIN_INDEX])
+                        availability_bid = GeneratorAvailabilityBid.TradingIntervalAvailabilityBid(availability_per_band, max_availability, physical_availability, rate_of_change_up_per_min, rate_of_change_down_per_min)
+                        #add a reference to this trading interval availability bid to the bid at this offer date
+                        self.bid_by_offer_date_by_duid[duid][bid_offer_date].availability_bid_by_trading_interval_date[trading_interval_date] = availability_bid
+                    
                     #is it a row containing daily bid data?
-                    if bid_offer_type == self.TRADING_DAY_OFFER_TYPE:
+                    elif bid_offer_type == self.TRADING_DAY_OFFER_TYPE:
+                        settlement_date = parse_date(row[self.SETTLEMENT_DATE_INDEX])
                         bid_entry_type = row[self.BID_ENTRY_TYPE_INDEX]
                         
                         #is it a daily dispatch offer? (i.e. submitted before yesterday's 12:30pm cut-off time)
                         #or is it a default dispatch bid? (i.e. an offer that applies where no daily bid has been made)
                         if bid_entry_type == self.DAILY_OFFER_ENTRY_TYPE or bid_entry_type == self.DEFAULT_OFFER_ENTRY_TYPE:
-                            price_per_band = [ float(row[i]) for i in xrange(self.PRICE_BAND1_INDEX, self.PRICE_BAND10_INDEX + 1) ]
+                            price_per_band = map(float, row[self.PRICE_BAND1_INDEX:self.PRICE_BAND10_INDEX + 1])
                             dispatch_offer = GeneratorDispatchOffer(duid, settlement_date, price_per_band)
                             self.bid_by_offer_date_by_duid.setdefault(duid, {})[bid_offer_date] = dispatch_offer
                             
@@ -98,21 +248,14 @@ class CSVPublicYestBidDataProvider(object):
                             
                             if replace_earliest_offer_if_rebid and (duid not in earliest_offer_date_and_offer_by_duid or bid_offer_date < earliest_offer_date_and_offer_by_duid[duid][0]):
                                 #create a dispatch offer in the event that this generator has no daily or default offers. it will replace this rebid.
-                                price_per_band = [ float(row[i]) for i in xrange(self.PRICE_BAND1_INDEX, self.PRICE_BAND10_INDEX + 1) ]
+                                price_per_band = map(float, row[self.PRICE_BAND1_INDEX:self.PRICE_BAND10_INDEX + 1])
                                 dispatch_offer = GeneratorDispatchOffer(duid, settlement_date, price_per_band)
                                 earliest_offer_date_and_offer_by_duid[duid] = (bid_offer_date, dispatch_offer)
-                    
-                    #is it a row containing availability bid per trading interval data?
-                    elif bid_offer_type == self.TRADING_INTERVAL_OFFER_TYPE:
-                        availability_per_band = [ float(row[i]) for i in xrange(self.AVAILABILITY_BAND1_INDEX, self.AVAILABILITY_BAND10_INDEX + 1) ]
-                        trading_interval_date = datetime.strptime(row[self.TRADING_INTERVAL_DATE_INDEX], self.BID_DATE_FORMAT)
-                        max_availability = float(row[self.MAX_AVAILABILITY_INDEX])
-                        physical_availability = float(row[self.PASAAVAILABILITY_INDEX])
-                        rate_of_change_up_per_min = float(row[self.RATE_OF_CHANGE_UP_PER_MIN_INDEX])
-                        rate_of_change_down_per_min = float(row[self.RATE_OF_CHANGE_DOWN_PER_MIN_INDEX])
-                        availability_bid = GeneratorAvailabilityBid.TradingIntervalAvailabilityBid(availability_per_band, max_availability, physical_availability, rate_of_change_up_per_min, rate_of_change_down_per_min)
-                        #add a reference to this trading interval availability bid to the bid at this offer date
-                        self.bid_by_offer_date_by_duid[duid][bid_offer_date].availability_bid_by_trading_interval_date[trading_interval_date] = availability_bid
+            
+            elif row_id == self.REPORT_CONTAINER_ROW_ID_CHAR and row[self.END_OF_REPORT_INDEX] != self.END_OF_REPORT_STR:
+                self.end_date = datetime.strptime(row[self.FILE_PUBLISH_DATE_INDEX], self.FILE_PUBLISH_DATE_FORMAT).replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.TRADING_DAY_START_MINUTE, second=0, microsecond=0)
+                self.start_date = self.end_date - timedelta(days=1)
+        self.rows_parsed = rows_parsed
         
         #replace each generator's earliest offer with a dispatch offer if it is a rebid
         #as explained earlier, this is a temporary fix for generators that have no daily or default entries, only rebids
@@ -125,6 +268,57 @@ class CSVPublicYestBidDataProvider(object):
                     #replace the rebid with the dispatch offer
                     self.bid_by_offer_date_by_duid[duid][earliest_offer_date] = dispatch_offer
     
+    def _pack(self):
+        '''Packs the parsed bids into a compact form for caching. Pickling each trading interval
+        availability bid as an object is barely faster than parsing the data file, so their values
+        are packed into flat arrays instead (in the same order as the bids' trading interval dates).'''
+        
+        bid_rows = [] #a tuple per bid of its duid, offer date, message id, settlement date, price per band (or rebid explanation), trading interval dates and number of price bands
+        availabilities = array('d') #the availability per band of every trading interval availability bid
+        other_values = array('d') #the max availability, physical availability and rates of change of every trading interval availability bid
+        for duid,bid_by_offer_date in self.bid_by_offer_date_by_duid.iteritems():
+            for offer_date,bid in bid_by_offer_date.iteritems():
+                is_dispatch_offer = isinstance(bid, GeneratorDispatchOffer)
+                trading_interval_dates = bid.availability_bid_by_trading_interval_date.keys()
+                num_price_bands = 0
+                for trading_interval_date in trading_interval_dates:
+                    availability_bid = bid.availability_bid_by_trading_interval_date[trading_interval_date]
+                    num_price_bands = len(availability_bid.availability_per_band)
+                    availabilities.extend(availability_bid.availability_per_band)
+                    other_values.extend((availability_bid.max_availability, availability_bid.physical_availability, availability_bid.rate_of_change_up_per_min, availability_bid.rate_of_change_down_per_min))
+                bid_rows.append((duid, offer_date, bid.message_id, bid.settlement_date, is_dispatch_offer, bid.price_per_band if is_dispatch_offer else bid.rebid_explanation, trading_interval_dates, num_price_bands))
+        return (self.start_date, self.end_date, self.rows_parsed, bid_rows, availabilities.tostring(), other_values.tostring())
+    
+    def _unpack(self, packed_data):
+        '''Rebuilds the bids from data packed by _pack().'''
+        
+        self.start_date, self.end_date, self.rows_parsed, bid_rows, availabilities_str, other_values_str = packed_data
+        availabilities = array('d', availabilities_str).tolist()
+        other_values = array('d', other_values_str).tolist()
+        availability_index = 0
+        other_values_index = 0
+        TradingIntervalAvailabilityBid = GeneratorAvailabilityBid.TradingIntervalAvailabilityBid
+        next_message_id = Message.NEXT_ID
+        for duid,offer_date,message_id,settlement_date,is_dispatch_offer,price_per_band_or_rebid_explanation,trading_interval_dates,num_price_bands in bid_rows:
+            if is_dispatch_offer:
+                bid = GeneratorDispatchOffer(duid, settlement_date, price_per_band_or_rebid_explanation)
+            else:
+                bid = GeneratorAvailabilityRebid(duid, settlement_date, price_per_band_or_rebid_explanation)
+            bid.message_id = message_id
+            next_message_id = max(next_message_id, message_id + 1)
+            
+            availability_bid_by_trading_interval_date = bid.availability_bid_by_trading_interval_date
+            for trading_interval_date in trading_interval_dates:
+                availability_per_band = availabilities[availability_index:availability_index + num_price_bands]
+                max_availability, physical_availability, rate_of_change_up_per_min, rate_of_change_down_per_min = other_values[other_values_index:other_values_index + 4]
+                availability_bid_by_trading_interval_date[trading_interval_date] = TradingIntervalAvailabilityBid(availability_per_band, max_availability, physical_availability, rate_of_change_up_per_min, rate_of_change_down_per_min)
+                availability_index += num_price_bands
+                other_values_index += 4
+            self.bid_by_offer_date_by_duid.setdefault(duid, {})[offer_date] = bid
+        
+        #make sure that new messages are not given the same ids as the cached bids
+        Message.NEXT_ID = next_message_id
+    
     def get_bids_at_offer_date(self, generator_id, offer_date):
         '''Gets all of a generator's dispatch bids and rebids at this offer date.
         Since a PUBLIC_YESTBID file only contains bid data for a single trading day, 
@@ -142,10 +336,272 @@ class CSVPublicYestBidDataProvider(object):
         per offer date. But other data providers may provide this functionality, hence each 
         offer date key in the dictionary has a list value.'''
         
+        return self.get_bids_by_offer_date_in_range(generator_id, None, date)
+    
+    def get_bids_by_offer_date_in_range(self, generator_id, start_date, end_date):
+        '''Gets all of a generator's dispatch bids and rebids from a start offer date (inclusive)
+        up to an end offer date (exclusive), returned in the same form as 
+        get_bids_by_offer_date_before_date(). If the start date is None, every bid before the end
+        date is returned.'''
+        
         if generator_id in self.bid_by_offer_date_by_duid:
-            return { offer_date: [ bid ] for offer_date,bid in self.bid_by_offer_date_by_duid[generator_id].items() if offer_date < date }
+            offer_dates = self._offer_dates_by_duid[generator_id]
+            bid_by_offer_date = self.bid_by_offer_date_by_duid[generator_id]
+            start_index = bisect_left(offer_dates, start_date) if start_date is not None else 0
+            end_index = bisect_left(offer_dates, end_date)
+            return { offer_date: [ bid_by_offer_date[offer_date] ] for offer_date in offer_dates[start_index:end_index] }
         else:
             return {}
+    
+    def get_next_offer_date_after_date(self, generator_id, date):
+        '''Gets the earliest offer date of a generator's bids after a specified date, or None 
+        if the generator has no bids after that date.'''
+        
+        offer_dates = self._offer_dates_by_duid.get(generator_id, [])
+        index = bisect_right(offer_dates, date)
+        return offer_dates[index] if index < len(offer_dates) else None
+    
+    def iter_offer_dates_from_date(self, generator_id, date):
+        '''Iterates over the offer dates of a generator's bids from a specified date (inclusive) 
+        onwards, in date order.'''
+        
+        offer_dates = self._offer_dates_by_duid.get(generator_id, [])
+        return islice(offer_dates, bisect_left(offer_dates, date), None)
+
+class DirectoryPublicYestBidDataProvider(object):
+    '''
+    Provides generator dispatch offers and availability rebids from a directory of 
+    PUBLIC_YESTBID files (one per trading day, as named by AEMO), so that a simulation can
+    span any number of trading days. Rather than reading every file up front, a trading day's
+    file is loaded once the simulation reaches the trading day's load date (a specified duration
+    before the trading day starts), and unloaded once all of its bids are in the past. Bids 
+    offered before a trading day's load date are offered at the load date instead. No more than 
+    max_loaded_trading_days are kept in memory at once; if more are needed, the least recently
+    used trading day is unloaded (and loaded again from file, if required). Trading days that
+    may have bids at the current date are never unloaded, so the limit is exceeded if there are
+    more of these than max_loaded_trading_days.
+    '''
+    
+    FILE_NAME_PATTERN = re.compile(r'^PUBLIC_YESTBID_(\d{8})\d*_\d+\.csv$', re.IGNORECASE)
+    FILE_NAME_DATE_FORMAT = '%Y%m%d'
+    
+    def __init__(self, directory, max_loaded_trading_days=3, load_duration_before_trading_day=timedelta(days=1), replace_earliest_offer_if_rebid=True, cache_directory=None):
+        '''See CSVPublicYestBidDataProvider for the replace_earliest_offer_if_rebid and cache_directory
+        arguments, which are applied to each file.'''
+        
+        assert max_loaded_trading_days >= 1
+        self.max_loaded_trading_days = max_loaded_trading_days
+        self.load_duration_before_trading_day = load_duration_before_trading_day
+        self.replace_earliest_offer_if_rebid = replace_earliest_offer_if_rebid
+        self.cache_directory = cache_directory
+        self.trading_days_loaded = 0 #the number of times a trading day has been loaded from file (including reloads)
+        
+        #index the files by trading day. each trading day is referred to by its position in date order
+        file_location_by_trading_day_start_date = {}
+        for file_name in os.listdir(directory):
+            match = self.FILE_NAME_PATTERN.match(file_name)
+            if match:
+                trading_day_start_date = datetime.strptime(match.group(1), self.FILE_NAME_DATE_FORMAT).replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.TRADING_DAY_START_MINUTE)
+                assert trading_day_start_date not in file_location_by_trading_day_start_date, 'More than one PUBLIC_YESTBID file found for the trading day starting at %s' % trading_day_start_date
+                file_location_by_trading_day_start_date[trading_day_start_date] = os.path.join(directory, file_name)
+        assert len(file_location_by_trading_day_start_date) > 0, 'No PUBLIC_YESTBID files found in %s' % directory
+        self._trading_day_start_dates = sorted(file_location_by_trading_day_start_date)
+        self._file_locations = [ file_location_by_trading_day_start_date[start_date] for start_date in self._trading_day_start_dates ]
+        self._load_dates = [ start_date - load_duration_before_trading_day for start_date in self._trading_day_start_dates ]
+        self.start_date = self._trading_day_start_dates[0]
+        self.end_date = self._trading_day_start_dates[-1] + timedelta(days=1)
+        
+        self._loaded_trading_days = OrderedDict() #trading day mapped to its bids by offer date by duid and its sorted offer dates by duid (least recently used first)
+        self._last_offer_date_by_trading_day = {} #the latest (actual) offer date of each trading day that has been loaded
+        self._current_date = None #the latest date that bids have been requested at or after
+        self._trading_days_with_bids_from_date = (None, []) #the last date passed to _get_trading_days_with_bids_from_date() and its result
+    
+    def __deepcopy__(self, memo):
+        '''Copies the provider without any of its loaded trading days, so that the copy (e.g. in a
+        variant of a sweep) can be queried from any date. The files are loaded again as required.'''
+        
+        provider = copy(self)
+        provider.trading_days_loaded = 0
+        provider._loaded_trading_days = OrderedDict()
+        provider._last_offer_date_by_trading_day = {}
+        provider._current_date = None
+        provider._trading_days_with_bids_from_date = (None, [])
+        memo[id(self)] = provider
+        return provider
+    
+    def __getstate__(self):
+        #the loaded trading days are not pickled (e.g. in a simulation snapshot); they are loaded again as required
+        state = self.__dict__.copy()
+        state['_loaded_trading_days'] = OrderedDict()
+        state['_last_offer_date_by_trading_day'] = {}
+        state['_trading_days_with_bids_from_date'] = (None, [])
+        return state
+    
+    @property
+    def loaded_trading_day_start_dates(self):
+        '''The start dates of the trading days currently loaded.'''
+        return sorted(self._trading_day_start_dates[trading_day] for trading_day in self._loaded_trading_days)
+    
+    def load_trading_days(self, start_date, end_date):
+        '''Loads the trading days whose bids may be requested from the start date to the end date in advance
+        (the earliest max_loaded_trading_days of them), e.g. before a ParallelSimulation forks its processes,
+        so that they share the loaded trading days rather than each loading them again. Loading a trading
+        day early does not change when its bids are offered.'''
+        
+        first_trading_day = self._get_first_trading_day_ending_after(start_date)
+        for trading_day in xrange(first_trading_day, min(bisect_right(self._load_dates, end_date), first_trading_day + self.max_loaded_trading_days)):
+            if trading_day not in self._loaded_trading_days:
+                self._get_trading_day(trading_day)
+    
+    def get_bids_at_offer_date(self, generator_id, offer_date):
+        '''Gets all of a generator's dispatch bids and rebids at this offer date. There may be
+        more than one, since bids for several trading days can be offered at the same date.'''
+        
+        self._advance_to(offer_date)
+        bids = []
+        for bids_by_offer_date_by_duid,_ in self._get_trading_days_with_bids_from_date(offer_date):
+            bids_by_offer_date = bids_by_offer_date_by_duid.get(generator_id, None)
+            if bids_by_offer_date and offer_date in bids_by_offer_date:
+                bids.extend(bids_by_offer_date[offer_date])
+        return bids
+    
+    def get_bids_by_offer_date_before_date(self, generator_id, date):
+        '''Gets all of a generator's dispatch bids and rebids before a specified offer date,
+        returned as a dictionary of offer dates mapped to lists of bids. Only the bids for 
+        trading days that have not ended by that date are included.'''
+        
+        trading_days = xrange(self._get_first_trading_day_ending_after(date), bisect_left(self._load_dates, date))
+        return self._get_bids_by_offer_date_in_range(trading_days, generator_id, None, date)
+    
+    def get_bids_by_offer_date_in_range(self, generator_id, start_date, end_date):
+        '''Gets all of a generator's dispatch bids and rebids from a start offer date (inclusive)
+        up to an end offer date (exclusive), returned in the same form as 
+        get_bids_by_offer_date_before_date(). Only the bids for trading days that have not ended
+        by the start date are included.'''
+        
+        trading_days = xrange(self._get_first_trading_day_ending_after(start_date), bisect_left(self._load_dates, end_date))
+        return self._get_bids_by_offer_date_in_range(trading_days, generator_id, start_date, end_date)
+    
+    def get_next_offer_date_after_date(self, generator_id, date):
+        '''Gets the earliest offer date of a generator's bids after a specified date, or None 
+        if the generator has no bids after that date. The load date of the next trading day to
+        be loaded is returned if it is earlier, as its bids are not known until it is loaded.'''
+        
+        self._advance_to(date)
+        next_offer_dates = []
+        for _,offer_dates_by_duid in self._get_trading_days_with_bids_from_date(date):
+            offer_dates = offer_dates_by_duid.get(generator_id, [])
+            index = bisect_right(offer_dates, date)
+            if index < len(offer_dates):
+                next_offer_dates.append(offer_dates[index])
+        
+        next_trading_day = bisect_right(self._load_dates, date)
+        if next_trading_day < len(self._load_dates):
+            next_offer_dates.append(self._load_dates[next_trading_day])
+        return min(next_offer_dates) if len(next_offer_dates) > 0 else None
+    
+    def iter_offer_dates_from_date(self, generator_id, date):
+        '''Iterates over the offer dates of a generator's bids from a specified date (inclusive) 
+        onwards, in date order. Trading days are loaded as the iteration reaches them, so (as per
+        get_next_offer_date_after_date()) the load dates of trading days are also included. Offer
+        dates that have passed (i.e. are before the latest date bids have been requested for) by 
+        the time the iteration reaches them are skipped.'''
+        
+        offer_date = self._get_first_offer_date_from_date(generator_id, date)
+        while offer_date is not None:
+            yield offer_date
+            if self._current_date > offer_date:
+                offer_date = self._get_first_offer_date_from_date(generator_id, self._current_date)
+            else:
+                offer_date = self.get_next_offer_date_after_date(generator_id, offer_date)
+    
+    def _get_first_offer_date_from_date(self, generator_id, date):
+        return date if len(self.get_bids_at_offer_date(generator_id, date)) > 0 else self.get_next_offer_date_after_date(generator_id, date)
+    
+    def _get_first_trading_day_ending_after(self, date):
+        return bisect_right(self._trading_day_start_dates, date - timedelta(days=1))
+    
+    def _get_bids_by_offer_date_in_range(self, trading_days, generator_id, start_date, end_date):
+        '''Gets a generator's bids by offer date from the start date (or from the earliest, if None) up
+        to the end date, across the specified trading days.'''
+        
+        bids_by_offer_date = {}
+        for trading_day in trading_days:
+            bids_by_offer_date_by_duid, offer_dates_by_duid = self._get_trading_day(trading_day)
+            offer_dates = offer_dates_by_duid.get(generator_id, [])
+            start_index = bisect_left(offer_dates, start_date) if start_date is not None else 0
+            for offer_date in offer_dates[start_index:bisect_left(offer_dates, end_date)]:
+                bids_by_offer_date.setdefault(offer_date, []).extend(bids_by_offer_date_by_duid[generator_id][offer_date])
+        return bids_by_offer_date
+    
+    def _get_trading_days_with_bids_from_date(self, date):
+        '''Gets the bids (as per _get_trading_day()) of each trading day that may have bids at or after
+        a date, i.e. those that have reached their load date and not yet ended, except for any already
+        known to have no bids from that date on. Since every generator asks for the same date in turn,
+        the result is kept until a different date is asked for.'''
+        
+        last_date, trading_days_with_bids = self._trading_days_with_bids_from_date
+        if date != last_date:
+            trading_days = xrange(self._get_first_trading_day_ending_after(date), bisect_right(self._load_dates, date))
+            trading_days_with_bids = [ self._get_trading_day(trading_day) for trading_day in trading_days if self._last_offer_date_by_trading_day.get(trading_day, date) >= date ]
+            self._trading_days_with_bids_from_date = (date, trading_days_with_bids)
+        return trading_days_with_bids
+    
+    def _get_trading_day(self, trading_day):
+        '''Gets a trading day's bids by offer date by duid and its sorted offer dates by duid, loading
+        the trading day if required.'''
+        
+        trading_day_bids = self._loaded_trading_days.pop(trading_day, None)
+        if trading_day_bids is None:
+            trading_day_bids = self._load_trading_day(trading_day)
+        #(re)insert the trading day as the most recently used
+        self._loaded_trading_days[trading_day] = trading_day_bids
+        return trading_day_bids
+    
+    def _load_trading_day(self, trading_day):
+        '''Reads a trading day's bids from file, unloading the least recently used trading days
+        if the maximum number of trading days are already loaded.'''
+        
+        num_trading_days_to_unload = len(self._loaded_trading_days) - self.max_loaded_trading_days + 1
+        if num_trading_days_to_unload > 0:
+            if self._current_date is not None:
+                first_current_trading_day = self._get_first_trading_day_ending_after(self._current_date)
+                last_current_trading_day = bisect_right(self._load_dates, self._current_date) - 1
+            else:
+                first_current_trading_day, last_current_trading_day = 0, -1
+            for loaded_trading_day in self._loaded_trading_days.keys():
+                if num_trading_days_to_unload > 0 and not first_current_trading_day <= loaded_trading_day <= last_current_trading_day:
+                    del self._loaded_trading_days[loaded_trading_day]
+                    num_trading_days_to_unload -= 1
+        
+        data_provider = CSVPublicYestBidDataProvider(self._file_locations[trading_day], self.replace_earliest_offer_if_rebid, self.cache_directory)
+        assert data_provider.start_date == self._trading_day_start_dates[trading_day], 'The trading day of %s does not match its file name' % self._file_locations[trading_day]
+        self.trading_days_loaded += 1
+        
+        #bids offered before the load date are offered at the load date instead (in their original order)
+        load_date = self._load_dates[trading_day]
+        last_offer_date = load_date
+        bids_by_offer_date_by_duid = {}
+        for duid,bid_by_offer_date in data_provider.bid_by_offer_date_by_duid.iteritems():
+            bids_by_offer_date = bids_by_offer_date_by_duid[duid] = {}
+            for offer_date in sorted(bid_by_offer_date):
+                bids_by_offer_date.setdefault(max(offer_date, load_date), []).append(bid_by_offer_date[offer_date])
+                last_offer_date = max(last_offer_date, offer_date)
+        offer_dates_by_duid = { duid: sorted(bids_by_offer_date) for duid,bids_by_offer_date in bids_by_offer_date_by_duid.iteritems() }
+        self._last_offer_date_by_trading_day[trading_day] = last_offer_date
+        self._trading_days_with_bids_from_date = (None, [])
+        return (bids_by_offer_date_by_duid, offer_dates_by_duid)
+    
+    def _advance_to(self, date):
+        '''Moves the provider's clock forward to a date (if it is later), unloading any trading days
+        whose bids are all before that date.'''
+        
+        if self._current_date is None or date > self._current_date:
+            self._current_date = date
+            for trading_day in self._loaded_trading_days.keys():
+                if self._last_offer_date_by_trading_day[trading_day] < date:
+                    del self._loaded_trading_days[trading_day]
+            self._trading_days_with_bids_from_date = (None, [])
 
 class CSVPublicPricesDataProvider(object):
     '''Provides pricing and demand data from a specified PUBLIC_PRICES file, found at
@@ -180,13 +636,40 @@ class CSVPublicPricesDataProvider(object):
     TRADING_INTERVAL_DISPATCHABLE_GENERATION_INDEX = 12
     TRADING_INTERVAL_DISPATCHABLE_LOAD_INDEX = 13
     
-    def __init__(self, file_location):
+    PARSER_VERSION = 1 #must be incremented whenever the parsed data changes, so that cached data is rebuilt
+    
+    def __init__(self, file_location, cache_directory=None):
+        '''If a cache directory is specified, the parsed data is cached there (see DataProviderCache).'''
+        
         self.start_date = None
         self.end_date = None
         self._price_info_by_dispatch_interval_date_by_region_id = {} #region id mapped to dispatch interval date mapped to demand
         self._price_info_by_trading_interval_date_by_region_id = {} #region id mapped to trading interval date mapped to demand
+        self._demands_by_region_id = {} #region id mapped to the date of its first dispatch interval and the total demand of every dispatch interval (see _get_demands())
+        self._arguments = (os.path.abspath(file_location), os.path.abspath(cache_directory) if cache_directory else None) #used to load the provider again when unpickled
         
-        for row in reader(open(file_location, 'rb')):
+        cache = DataProviderCache(cache_directory, file_location, self.__class__.__name__, self.PARSER_VERSION) if cache_directory else None
+        cached_data = cache.load() if cache else None
+        if cached_data:
+            self.start_date, self.end_date, self._price_info_by_dispatch_interval_date_by_region_id, self._price_info_by_trading_interval_date_by_region_id = cached_data
+        else:
+            with open(file_location, 'rb') as data_file:
+                self._parse(data_file)
+            if cache:
+                cache.save((self.start_date, self.end_date, self._price_info_by_dispatch_interval_date_by_region_id, self._price_info_by_trading_interval_date_by_region_id))
+    
+    def __deepcopy__(self, memo):
+        '''The parsed data is only ever read from, so copies of a config share the same provider.'''
+        return self
+    
+    def __reduce__(self):
+        '''The provider is pickled as its arguments, and loaded from its file (or cache) again when unpickled.'''
+        return (self.__class__, self._arguments)
+    
+    def _parse(self, data_file):
+        '''Reads the pricing and demand data from a PUBLIC_PRICES data file.'''
+        
+        for row in reader(data_file):
             if row[self.ROW_ID_INDEX] == self.REPORT_CONTAINER_ROW_ID_CHAR and row[self.END_OF_REPORT_INDEX] != self.END_OF_REPORT_STR:
                 self.end_date = datetime.strptime(row[self.FILE_PUBLISH_DATE_INDEX], self.FILE_PUBLISH_DATE_FORMAT).replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.TRADING_DAY_START_MINUTE, second=0, microsecond=0)
                 self.start_date = self.end_date - timedelta(days=1)
@@ -229,18 +712,65 @@ class CSVPublicPricesDataProvider(object):
         else:
             return None
     
+    def get_demand_forecast_batch(self, region_id, first_dispatch_interval_date, count):
+        '''Gets the demand forecasts for 24 hours from each of the specified number of consecutive dispatch 
+        intervals, from the specified dispatch interval date (see get_demand_forecast()), as a list. Intervals 
+        without data have forecasts of None.'''
+        
+        first_date, demands = self._get_demands(region_id)
+        dispatch_interval_date = first_dispatch_interval_date + timedelta(days=1)
+        if first_date is not None:
+            time_difference = dispatch_interval_date - first_date
+            dispatch_interval_no, remainder = divmod(time_difference.days * 86400 + time_difference.seconds, AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * 60)
+            if remainder == 0 and time_difference.microseconds == 0:
+                #the intervals within the data are sliced from the region's demand (padded with None either side)
+                start = max(dispatch_interval_no, 0)
+                end = min(max(dispatch_interval_no + count, 0), len(demands))
+                return [None] * min(start - dispatch_interval_no, count) + demands[start:end] + [None] * (dispatch_interval_no + count - max(end, start))
+        
+        #dates that are not a whole number of dispatch intervals from the data are looked up an interval at a time
+        dispatch_interval_duration = timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+        return [ self.get_demand_forecast(region_id, first_dispatch_interval_date + dispatch_interval_duration * interval_no) for interval_no in xrange(count) ]
+    
+    def _get_demands(self, region_id):
+        '''Gets the total demand of every dispatch interval in a region's data, as a tuple of the date of the
+        first dispatch interval (or None, if there is no data) and a list of demands (None for intervals without
+        data). The list is built when it is first needed.'''
+        
+        if region_id not in self._demands_by_region_id:
+            price_info_by_dispatch_interval_date = self._price_info_by_dispatch_interval_date_by_region_id.get(region_id, {})
+            if not price_info_by_dispatch_interval_date:
+                self._demands_by_region_id[region_id] = (None, [])
+            else:
+                first_date = min(price_info_by_dispatch_interval_date)
+                dispatch_interval_duration_seconds = AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * 60
+                demands_by_dispatch_interval_no = {}
+                for dispatch_interval_date,price_info in price_info_by_dispatch_interval_date.iteritems():
+                    time_difference = dispatch_interval_date - first_date
+                    dispatch_interval_no, remainder = divmod(time_difference.days * 86400 + time_difference.seconds, dispatch_interval_duration_seconds)
+                    if remainder == 0 and time_difference.microseconds == 0:
+                        demands_by_dispatch_interval_no[dispatch_interval_no] = price_info.total_demand
+                demands = [ demands_by_dispatch_interval_no.get(dispatch_interval_no, None) for dispatch_interval_no in xrange(max(demands_by_dispatch_interval_no) + 1) ]
+                self._demands_by_region_id[region_id] = (first_date, demands)
+        return self._demands_by_region_id[region_id]
+    
     @property
     def region_ids(self):
         return self._price_info_by_dispatch_interval_date_by_region_id.keys()
 
+#a module-level reference to the nested namedtuple, which is required for its instances to be pickled
+DispatchPriceInfo = CSVPublicPricesDataProvider.DispatchPriceInfo
+
 class MathApproximationDemandForecastDataProvider(object):
     '''
     This data provider uses mathematical functions to generate demand data that is
-    an approximation of the typical daily demand experienced in Victoria (based on 
-    observations).
+    an approximation of the typical daily demand experienced in Victoria (based on
+    observations). Batches of forecasts are computed for every interval at once (with
+    numpy, if it is installed), giving the same demand as get_demand_forecast().
     '''
     
     SECONDS_IN_A_MINUTE = 60
+    SECONDS_IN_A_DAY = 86400
     
     def __init__(self):
         self.funcs = [self._base_demand, self._demand_peaks]
@@ -252,39 +782,124 @@ class MathApproximationDemandForecastDataProvider(object):
     
     def _demand_peaks(self, dispatch_interval_date):
         '''
-        Uses formula -.22(x-192)^2+2000 to get a rough approximation of peak demand at 
+        Uses formula -.22(x-192)^2+2000 to get a rough approximation of peak demand at
         a dispatch interval. See http://fooplot.com/index.php?q0=-.22%28x-192%29^2+2000
         '''
         
-        first_dispatch_interval_time_today = dispatch_interval_date.replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
-        time_difference = dispatch_interval_date - first_dispatch_interval_time_today
-        dispatch_interval_no = (time_difference.seconds / self.SECONDS_IN_A_MINUTE) / AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES
+        dispatch_interval_no = self._get_seconds_from_first_dispatch_interval(dispatch_interval_date) / self.SECONDS_IN_A_MINUTE / AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES
         if dispatch_interval_no < 97 or dispatch_interval_no > 287:
             return 0.
         else:
             return -0.22 * (dispatch_interval_no - 192)**2 + 2000
     
+    #the functions that get_demand_forecast_batch() computes for every interval at once
+    _BATCHED_FUNCS = [_base_demand, _demand_peaks]
+    
+    def _get_seconds_from_first_dispatch_interval(self, dispatch_interval_date):
+        '''Gets the number of seconds from the (end of the) first dispatch interval of the day to the specified date,
+        wrapping around to the previous day's first dispatch interval for dates before it.'''
+        
+        first_dispatch_interval_time_today = dispatch_interval_date.replace(hour=AEMOperator.TRADING_DAY_START_HOUR, minute=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+        return (dispatch_interval_date - first_dispatch_interval_time_today).seconds
+    
     def get_demand_forecast(self, region_id, dispatch_interval_date):
-        '''Gets the demand forecast for 24 hours from the specified dispatch 
+        '''Gets the demand forecast for 24 hours from the specified dispatch
         interval date.'''
         
         return sum(func(dispatch_interval_date) for func in self.funcs)
+    
+    def get_demand_forecast_batch(self, region_id, first_dispatch_interval_date, count):
+        '''Gets the demand forecasts for 24 hours from each of the specified number of consecutive
+        dispatch intervals, from the specified dispatch interval date, as a list.'''
+        
+        dispatch_interval_duration = timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+        if [ getattr(func, 'im_func', None) for func in self.funcs ] != self._BATCHED_FUNCS:
+            #functions that have been replaced (or overridden) are computed an interval at a time
+            return [ self.get_demand_forecast(region_id, first_dispatch_interval_date + dispatch_interval_duration * interval_no) for interval_no in xrange(count) ]
+        
+        #the dispatch interval number of each interval within its day is found from the first's, rather than from its date
+        dispatch_interval_duration_seconds = AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * self.SECONDS_IN_A_MINUTE
+        first_seconds = self._get_seconds_from_first_dispatch_interval(first_dispatch_interval_date)
+        base_demand = self._base_demand(first_dispatch_interval_date)
+        if numpy is not None:
+            dispatch_interval_nos = (first_seconds + numpy.arange(count) * dispatch_interval_duration_seconds) % self.SECONDS_IN_A_DAY // dispatch_interval_duration_seconds
+            demand_peaks = numpy.where((dispatch_interval_nos < 97) | (dispatch_interval_nos > 287), 0., -0.22 * (dispatch_interval_nos - 192)**2 + 2000)
+            return (base_demand + demand_peaks).tolist()
+        
+        demand_forecasts = []
+        for interval_no in xrange(count):
+            dispatch_interval_no = (first_seconds + interval_no * dispatch_interval_duration_seconds) % self.SECONDS_IN_A_DAY // dispatch_interval_duration_seconds
+            demand_forecasts.append(base_demand + (0. if dispatch_interval_no < 97 or dispatch_interval_no > 287 else -0.22 * (dispatch_interval_no - 192)**2 + 2000))
+        return demand_forecasts
 
 class RandomDemandForecastDataProvider(object):
     '''
-    This data provider generates random demand data within a specified range.
+    This data provider generates random demand data within a specified range. The demand of each
+    region is drawn a trading day at a time, from a random number generator seeded by the provider's
+    seed and stream, the region and the trading day. So a forecast depends only on its dispatch interval
+    (not on which forecasts were requested before it, or by which process), and a simulation gets the
+    same demand whether it is run serially or in parallel. Consumers in the same region that use
+    providers with the same seed and stream get the same demand; for independent demand, give each
+    consumer its own stream (e.g. its id).
     '''
     
-    def __init__(self, min_demand, max_demand, seed=0):
+    DISPATCH_INTERVALS_PER_TRADING_DAY = 24 * 60 / AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES
+    MAX_CACHED_TRADING_DAYS = 16 #the number of (region, trading day) demand lists kept for later forecasts
+    _FIRST_TRADING_DAY_DATE = datetime(1970, 1, 1, AEMOperator.TRADING_DAY_START_HOUR, AEMOperator.TRADING_DAY_START_MINUTE) #the start of trading day 0
+    
+    def __init__(self, min_demand, max_demand, seed=0, stream=None):
         assert 0 <= min_demand < max_demand
-        import random
-        self.rand = random.Random()
-        self.rand.seed(seed)
         self.min_demand = float(min_demand)
         self.max_demand = float(max_demand)
+        self.seed = seed
+        self.stream = stream #a name (e.g. a consumer id) that gives the provider demand independent of other providers with the same seed
+        self._demands_by_trading_day_by_region_id = {} #region id mapped to trading day number mapped to the demand of each of its dispatch intervals
+        self._num_cached_trading_days = 0
+    
+    def _get_trading_day_and_dispatch_interval_no(self, dispatch_interval_date):
+        '''Gets the number of the trading day (from 1970) that a dispatch interval (identified by the date it
+        ends) is within, and its number within that trading day.'''
+        
+        time_difference = dispatch_interval_date - self._FIRST_TRADING_DAY_DATE
+        minutes = time_difference.days * 1440 + time_difference.seconds / 60 - 1
+        return (minutes // 1440, minutes % 1440 // AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES)
+    
+    def _get_trading_day_demands(self, region_id, trading_day):
+        '''Gets the demand of every dispatch interval in a trading day, drawing it if it is not cached.'''
+        
+        demands_by_trading_day = self._demands_by_trading_day_by_region_id.setdefault(region_id, {})
+        demands = demands_by_trading_day.get(trading_day, None)
+        if demands is None:
+            if self._num_cached_trading_days >= self.MAX_CACHED_TRADING_DAYS:
+                self._demands_by_trading_day_by_region_id = {region_id: demands_by_trading_day}
+                demands_by_trading_day.clear()
+                self._num_cached_trading_days = 0
+            #drawn with the random module (rather than numpy), so that the demand does not depend on whether numpy is installed
+            stream_seed = int(hashlib.md5(repr((self.seed, self.stream, region_id, trading_day))).hexdigest(), 16)
+            random_ = random.Random(stream_seed).random
+            min_demand = self.min_demand
+            demand_range = self.max_demand - self.min_demand
+            demands = [ min_demand + demand_range * random_() for _ in xrange(self.DISPATCH_INTERVALS_PER_TRADING_DAY) ]
+            demands_by_trading_day[trading_day] = demands
+            self._num_cached_trading_days += 1
+        return demands
     
     def get_demand_forecast(self, region_id, dispatch_interval_date):
-        '''Gets the demand forecast for 24 hours from the specified dispatch 
+        '''Gets the demand forecast for 24 hours from the specified dispatch
         interval date.'''
         
-        return self.rand.uniform(self.min_demand, self.max_demand)
\ No newline at end of file
+        trading_day, dispatch_interval_no = self._get_trading_day_and_dispatch_interval_no(dispatch_interval_date + timedelta(days=1))
+        return self._get_trading_day_demands(region_id, trading_day)[dispatch_interval_no]
+    
+    def get_demand_forecast_batch(self, region_id, first_dispatch_interval_date, count):
+        '''Gets the demand forecasts for 24 hours from each of the specified number of consecutive
+        dispatch intervals, from the specified dispatch interval date, as a list.'''
+        
+        trading_day, dispatch_interval_no = self._get_trading_day_and_dispatch_interval_no(first_dispatch_interval_date + timedelta(days=1))
+        demand_forecasts = []
+        while len(demand_forecasts) < count:
+            demands = self._get_trading_day_demands(region_id, trading_day)
+            demand_forecasts.extend(demands[dispatch_interval_no:dispatch_interval_no + count - len(demand_forecasts)])
+            trading_day += 1
+            dispatch_interval_no = 0
+        return demand_forecasts
@@ -0,0 +1,261 @@
+'''
+This module defines dispatch engines, which are used by market operators to determine
+the merit order (i.e. lowest price first) dispatch of generators for a dispatch interval.
+A dispatch engine requires two functions: create_merit_order_stack(), which prepares the
+dispatch offers for a trading interval (and can be cached until the offers change), and
+dispatch(), which dispatches a merit order stack to meet a demand. The latter returns a 
+tuple of the dispatch interval price, the total demand supplied, the price band used and a
+dictionary of generator ids mapped to their price offer and the demand they are dispatched
+to supply.
+'''
+
+from collections import namedtuple
+from itertools import chain
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ReferenceDispatchEngine(object):
+    '''
+    Determines the dispatch schedule by sorting the dispatch offers by price for each price
+    band in turn, until a band is found at which the demand can be supplied. This is the
+    original (and simplest) implementation, which is kept as a reference for testing other
+    dispatch engines against.
+    '''
+    
+    def create_merit_order_stack(self, dispatch_offers, trading_interval_date, num_price_bands):
+        '''Creates a merit order stack from the dispatch offers for the specified trading interval
+        date. No work is done in advance; the offers are sorted each time they are dispatched.'''
+        return MeritOrderStack(dispatch_offers, trading_interval_date, num_price_bands)
+    
+    def dispatch(self, merit_order_stack, total_demand):
+        '''Determines which generators to dispatch to supply the total demand, using the
+        availability bids of each dispatch offer for the stack's trading interval date.'''
+        
+        dispatch_offers = merit_order_stack.dispatch_offers
+        trading_interval_date = merit_order_stack.trading_interval_date
+        total_demand_supplied = 0.
+        dispatch_interval_price = 0.
+        price_offer_and_supply_by_generator_id = {} #maps a generator id to its price offer and the demand it will be dispatched to generate
+        for price_band_no in xrange(merit_order_stack.num_price_bands):
+            total_demand_supplied = 0.
+            dispatch_interval_price = 0.
+            price_offer_and_supply_by_generator_id.clear()
+            #determine which generators get dispatched for this interval based on their price
+            for dispatch_offer in sorted(dispatch_offers, key=lambda dispatch_offer: dispatch_offer.price_per_band[price_band_no]):
+                availability_bid = dispatch_offer.availability_bid_by_trading_interval_date[trading_interval_date]
+                availability = sum(availability_bid.availability_per_band[:price_band_no+1])
+                #availability = min(sum(availability_bid.availability_per_band[:price_band_no+1]), availability_bid.max_availability)
+                if availability > 0:
+                    demand_to_supply = min(availability, total_demand - total_demand_supplied)
+                    total_demand_supplied += demand_to_supply
+                    price_offer = dispatch_offer.price_per_band[price_band_no]
+                    price_offer_and_supply_by_generator_id[dispatch_offer.sender_id] = (price_offer,demand_to_supply)
+                    dispatch_interval_price = price_offer
+                    if total_demand_supplied >= total_demand:
+                        break
+                else:
+                    #FIXME: what to do here?
+                    pass
+            
+            if total_demand_supplied >= total_demand:
+                break
+        
+        return (dispatch_interval_price, total_demand_supplied, price_band_no, price_offer_and_supply_by_generator_id)
+
+class ArrayDispatchEngine(object):
+    '''
+    Determines the dispatch schedule using the same stack-based pricing model as the
+    ReferenceDispatchEngine, but packs the dispatch offers into price and availability
+    matrices (requires NumPy). Cumulative availabilities per band are computed once per 
+    merit order stack, and the generator at which the demand is met is found with batched
+    array operations rather than by visiting each dispatch offer in turn. Results are 
+    identical to the ReferenceDispatchEngine, including the order in which equally priced
+    offers are dispatched. Since a merit order stack is created again whenever an offer in it
+    changes (e.g. after every rebid), the last stack created from the same dispatch offers is
+    kept, and only the rows of the offers whose availability bids have changed are repacked.
+    '''
+    
+    MAX_PREVIOUS_STACKS = 64 #the most stacks kept (one per distinct list of dispatch offers, e.g. per region) before they are all discarded
+    
+    def __init__(self):
+        assert numpy is not None, 'The ArrayDispatchEngine requires NumPy to be installed.'
+        self._previous_stack_by_offer_ids = {} #the ids of a list of dispatch offers mapped to the last stack created from them (which keeps the ids from being reused)
+    
+    def __getstate__(self):
+        #the previous stacks are not copied (e.g. into a snapshot, or the variants of a sweep); stacks are packed in full again as required
+        state = self.__dict__.copy()
+        state['_previous_stack_by_offer_ids'] = {}
+        return state
+    
+    def create_merit_order_stack(self, dispatch_offers, trading_interval_date, num_price_bands):
+        '''Creates a merit order stack from the dispatch offers for the specified trading interval
+        date, packing their prices and cumulative availabilities into matrices (from the last stack
+        created from the same dispatch offers, if any).'''
+        
+        dispatch_offers = list(dispatch_offers)
+        offer_ids = (num_price_bands,) + tuple(map(id, dispatch_offers))
+        merit_order_stack = ArrayMeritOrderStack(dispatch_offers, trading_interval_date, num_price_bands, self._previous_stack_by_offer_ids.get(offer_ids, None))
+        if len(self._previous_stack_by_offer_ids) >= self.MAX_PREVIOUS_STACKS and offer_ids not in self._previous_stack_by_offer_ids:
+            self._previous_stack_by_offer_ids.clear()
+        self._previous_stack_by_offer_ids[offer_ids] = merit_order_stack
+        return merit_order_stack
+    
+    def dispatch(self, merit_order_stack, total_demand):
+        '''Determines which generators to dispatch to supply the total demand, using the
+        availability bids of each dispatch offer for the stack's trading interval date.'''
+        
+        for price_band_no in xrange(merit_order_stack.num_price_bands):
+            is_last_price_band = price_band_no == merit_order_stack.num_price_bands - 1
+            result = self._dispatch_price_band(merit_order_stack, merit_order_stack.get_price_band(price_band_no), total_demand, price_band_no, is_last_price_band)
+            if result is not None:
+                return result
+    
+    def _dispatch_price_band(self, merit_order_stack, price_band, total_demand, price_band_no, is_last_price_band):
+        '''Determines the dispatch schedule for a single price band of a merit order stack. Returns 
+        None if the demand cannot be supplied at this band (unless it is the last band, in which 
+        case the partial result is returned).'''
+        
+        #find the first offer (with availability) that is either limited by the demand remaining or
+        #meets the demand; every offer before it supplies its full availability
+        demand_remaining = total_demand - price_band.previous_cumulative_supplied
+        is_limited_by_demand = demand_remaining < price_band.position_availabilities
+        is_demand_met = numpy.where(is_limited_by_demand, price_band.previous_cumulative_supplied + demand_remaining, price_band.cumulative_supplied) >= total_demand
+        stop_indices = numpy.flatnonzero(is_limited_by_demand | is_demand_met)
+        num_fully_supplied = stop_indices[0] if len(stop_indices) > 0 else len(price_band.positions)
+        
+        total_demand_supplied = float(price_band.cumulative_supplied[num_fully_supplied-1]) if num_fully_supplied > 0 else 0.
+        supplied_positions = price_band.positions[:num_fully_supplied].tolist()
+        demand_to_supply_per_position = price_band.position_availabilities[:num_fully_supplied].tolist()
+        
+        #continue offer by offer from the stopping offer (this is usually only the stopping offer itself,
+        #unless floating point rounding prevents it from meeting the demand exactly)
+        last_visited_position = len(price_band.order) - 1
+        for position in price_band.positions[num_fully_supplied:].tolist():
+            demand_to_supply = min(float(price_band.availabilities[position]), total_demand - total_demand_supplied)
+            total_demand_supplied += demand_to_supply
+            supplied_positions.append(position)
+            demand_to_supply_per_position.append(demand_to_supply)
+            if total_demand_supplied >= total_demand:
+                last_visited_position = position
+                break
+        
+        #every offer up to the last one visited must have an availability bid for this trading interval
+        if price_band.is_missing_availability[:last_visited_position+1].any():
+            raise KeyError(merit_order_stack.trading_interval_date)
+        
+        if not total_demand_supplied >= total_demand and not is_last_price_band:
+            return None
+        
+        dispatch_interval_price = 0.
+        price_offer_and_supply_by_generator_id = {}
+        for position,demand_to_supply in zip(supplied_positions, demand_to_supply_per_position):
+            dispatch_offer = merit_order_stack.dispatch_offers[price_band.order[position]]
+            dispatch_interval_price = dispatch_offer.price_per_band[price_band_no]
+            price_offer_and_supply_by_generator_id[dispatch_offer.sender_id] = (dispatch_interval_price,demand_to_supply)
+        
+        return (dispatch_interval_price, total_demand_supplied, price_band_no, price_offer_and_supply_by_generator_id)
+
+class DifferentialDispatchEngine(object):
+    '''
+    Runs two dispatch engines side by side and checks that their results are identical,
+    returning the results of the first. Intended for testing a dispatch engine against the
+    ReferenceDispatchEngine.
+    '''
+    
+    def __init__(self, dispatch_engine, reference_dispatch_engine=None):
+        self.dispatch_engine = dispatch_engine
+        self.reference_dispatch_engine = reference_dispatch_engine if reference_dispatch_engine else ReferenceDispatchEngine()
+    
+    def create_merit_order_stack(self, dispatch_offers, trading_interval_date, num_price_bands):
+        '''Creates a merit order stack for each engine (returned as a tuple).'''
+        return (self.dispatch_engine.create_merit_order_stack(dispatch_offers, trading_interval_date, num_price_bands),
+                self.reference_dispatch_engine.create_merit_order_stack(dispatch_offers, trading_interval_date, num_price_bands))
+    
+    def dispatch(self, merit_order_stack, total_demand):
+        '''Dispatches using both engines, raising an AssertionError if their results differ.'''
+        
+        merit_order_stack, reference_merit_order_stack = merit_order_stack
+        result = self.dispatch_engine.dispatch(merit_order_stack, total_demand)
+        reference_result = self.reference_dispatch_engine.dispatch(reference_merit_order_stack, total_demand)
+        assert result == reference_result, 'Dispatch engine mismatch at %s: %s != %s' % (merit_order_stack.trading_interval_date, result, reference_result)
+        return result
+
+'''Defines a price band of an ArrayMeritOrderStack: the dispatch offers' order by price at the band, 
+their cumulative availabilities in that order, and the positions and cumulative supply of the offers 
+that have availability.'''
+PriceBand = namedtuple('PriceBand', 'order availabilities is_missing_availability positions position_availabilities cumulative_supplied previous_cumulative_supplied')
+
+class MeritOrderStack(object):
+    '''The dispatch offers to be dispatched for a trading interval, in a fixed order.'''
+    
+    def __init__(self, dispatch_offers, trading_interval_date, num_price_bands):
+        self.dispatch_offers = list(dispatch_offers)
+        self.trading_interval_date = trading_interval_date
+        self.num_price_bands = num_price_bands
+
+class ArrayMeritOrderStack(MeritOrderStack):
+    '''
+    A merit order stack with the dispatch offers' prices and cumulative availabilities packed
+    into matrices. Each price band's sort order (and the cumulative supply in that order) is 
+    computed the first time the band is needed, and then kept for every subsequent dispatch.
+    '''
+    
+    def __init__(self, dispatch_offers, trading_interval_date, num_price_bands, previous_stack=None):
+        '''If a previous stack created from the same dispatch offers (in the same order) is specified, its
+        prices and sort orders are shared, and its cumulative availabilities are copied, with only the rows
+        of the offers whose availability bids differ packed again.'''
+        
+        super(ArrayMeritOrderStack, self).__init__(dispatch_offers, trading_interval_date, num_price_bands)
+        num_offers = len(self.dispatch_offers)
+        self.availability_bids = [ dispatch_offer.availability_bid_by_trading_interval_date.get(trading_interval_date, None) for dispatch_offer in self.dispatch_offers ]
+        zero_availabilities = [0.] * num_price_bands
+        
+        if previous_stack is None:
+            #each matrix is packed by a single call, from every offer's values in turn
+            self.prices = numpy.fromiter(chain.from_iterable(dispatch_offer.price_per_band[:num_price_bands] for dispatch_offer in self.dispatch_offers), float, num_offers * num_price_bands).reshape(num_offers, num_price_bands)
+            self._orders = [None] * num_price_bands #the offers' sort order by price at each price band
+            
+            #pack the availabilities into a matrix, keeping track of offers without an availability bid
+            #for the trading interval (these are zero-filled, but must raise an error if they are reached)
+            availabilities = numpy.fromiter(chain.from_iterable(availability_bid.availability_per_band[:num_price_bands] if availability_bid is not None else zero_availabilities for availability_bid in self.availability_bids), float, num_offers * num_price_bands)
+            self.is_missing_availability = numpy.fromiter((availability_bid is None for availability_bid in self.availability_bids), bool, num_offers)
+            self.cumulative_availabilities = numpy.cumsum(availabilities.reshape(num_offers, num_price_bands), axis=1)
+        else:
+            #the prices (and so the sort orders) are the same, and only rebid availabilities differ
+            self.prices = previous_stack.prices
+            self._orders = previous_stack._orders
+            self.is_missing_availability = previous_stack.is_missing_availability.copy()
+            self.cumulative_availabilities = previous_stack.cumulative_availabilities.copy()
+            changed_indices = [ i for i,(availability_bid,previous_availability_bid) in enumerate(zip(self.availability_bids, previous_stack.availability_bids)) if availability_bid is not previous_availability_bid ]
+            if changed_indices:
+                changed_availability_bids = [ self.availability_bids[i] for i in changed_indices ]
+                availabilities = numpy.fromiter(chain.from_iterable(availability_bid.availability_per_band[:num_price_bands] if availability_bid is not None else zero_availabilities for availability_bid in changed_availability_bids), float, len(changed_indices) * num_price_bands)
+                self.is_missing_availability[changed_indices] = [ availability_bid is None for availability_bid in changed_availability_bids ]
+                self.cumulative_availabilities[changed_indices] = numpy.cumsum(availabilities.reshape(len(changed_indices), num_price_bands), axis=1)
+        self._price_bands = [None] * num_price_bands
+    
+    def get_price_band(self, price_band_no):
+        '''Gets the PriceBand for the specified price band number.'''
+        
+        price_band = self._price_bands[price_band_no]
+        if price_band is None:
+            order = self._orders[price_band_no]
+            if order is None:
+                order = self._orders[price_band_no] = numpy.argsort(self.prices[:,price_band_no], kind='mergesort') #a stable sort, as per sorted()
+            availabilities = self.cumulative_availabilities[order,price_band_no]
+            positions = numpy.flatnonzero(availabilities > 0)
+            position_availabilities = availabilities[positions]
+            cumulative_supplied = numpy.cumsum(position_availabilities)
+            previous_cumulative_supplied = numpy.concatenate(([0.], cumulative_supplied))[:-1]
+            price_band = PriceBand(order, availabilities, self.is_missing_availability[order], positions, position_availabilities, cumulative_supplied, previous_cumulative_supplied)
+            self._price_bands[price_band_no] = price_band
+        return price_band
+
+def create_default_dispatch_engine():
+    '''Creates an ArrayDispatchEngine if NumPy is installed, otherwise a ReferenceDispatchEngine. Since
+    only rebid rows of an ArrayMeritOrderStack are packed again, the ArrayDispatchEngine is as fast at
+    small regions, and faster at NEM scale (see benchmarks.nem_scale and benchmarks.dispatch_check).'''
+    return ArrayDispatchEngine() if numpy is not None else ReferenceDispatchEngine()
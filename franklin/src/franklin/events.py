@@ -1,10 +1,22 @@
 '''
 This module defines event classes that can be activated at specific times within
-a simulation, modifying and manipulating the the simulation in some manner.
+a simulation, modifying and manipulating the the simulation in some manner. An event
+is due at a time relative to the simulation's start date (its time_delta), or at an
+absolute date (AbsoluteTimeEvent), and can recur at a fixed interval (RecurringEvent),
+so that a periodic change needs a single event rather than one per occurrence. The
+events of a simulation are kept in an EventQueue, ordered by when they are next due.
 '''
 
+from agents import AEMOperator
+from datetime import datetime, timedelta
+import heapq
+
 class SimulationEvent(object):
-    '''Provides a basic skeleton for event classes to inherit from.'''
+    '''Provides a basic skeleton for event classes to inherit from. Once a simulation is running, only
+    the agents that are due are stepped, so an event that changes agents must either reschedule them
+    (see Simulation.reschedule_agents()) and set reschedules_agents, or have every agent stepped after it.'''
+    
+    reschedules_agents = False #True if process_event() reschedules every agent it changes; otherwise, every agent is stepped after the event
     
     def __init__(self, name, time_delta):
         self.name = name
@@ -14,19 +26,160 @@ class SimulationEvent(object):
         '''Activates and runs the event, modifying the specified simulation
         in some manner.'''
         pass
-
+    
+    def get_time(self, start_date):
+        '''Gets the date the event is first due, for a simulation with the specified start date (or None if
+        it is never due).'''
+        return start_date + self.time_delta
+    
+    def get_next_time(self, start_date, time):
+        '''Gets the date the event is next due after the specified date (at which it was due), or None
+        if it is not due again.'''
+        return None
+    
     def __str__(self):
         return "<Event: %s>" % self.name
 
+class AbsoluteTimeEvent(SimulationEvent):
+    '''Provides a skeleton for events that are due at a specific date, rather than a time relative to
+    the simulation's start date.'''
+    
+    def __init__(self, name, date):
+        super(AbsoluteTimeEvent, self).__init__(name, None)
+        self.date = date
+    
+    def get_time(self, start_date):
+        return self.date
+
+class RecurringEvent(SimulationEvent):
+    '''
+    Provides a skeleton for events that are due every interval, from a time relative to the simulation's
+    start date (its time_delta) up to an optional end time (also relative to the start date). If a time
+    of day is specified, the event is first due at the earliest time (from its time_delta) that is a whole
+    number of intervals from that time of day, e.g. an interval of TRADING_INTERVAL and a time of day of
+    midnight make an event due at the end of every trading interval, and an interval of DAY and a time of
+    day of 4am make it due at the start of every trading day.
+    '''
+    
+    TRADING_INTERVAL = timedelta(minutes=AEMOperator.DISPATCH_INTERVAL_DURATION_MINUTES * AEMOperator.DISPATCH_INTERVALS_PER_TRADING_INTERVAL)
+    DAY = timedelta(days=1)
+    
+    def __init__(self, name, time_delta, interval, time_of_day=None, end_time_delta=None):
+        super(RecurringEvent, self).__init__(name, time_delta)
+        assert interval > timedelta(0), 'The interval of a recurring event must be positive.'
+        self.interval = interval
+        self.time_of_day = time_of_day #a time (or None)
+        self.end_time_delta = end_time_delta #the relative time difference from the start time of the simulation after which the event is no longer due (or None)
+    
+    def get_time(self, start_date):
+        time = start_date + self.time_delta
+        if self.time_of_day is not None:
+            aligned_time = datetime.combine(time.date(), self.time_of_day)
+            while aligned_time - self.interval >= time:
+                aligned_time -= self.interval
+            while aligned_time < time:
+                aligned_time += self.interval
+            time = aligned_time
+        if self.end_time_delta is not None and time > start_date + self.end_time_delta:
+            return None
+        return time
+    
+    def get_next_time(self, start_date, time):
+        next_time = time + self.interval
+        if self.end_time_delta is not None and next_time > start_date + self.end_time_delta:
+            return None
+        return next_time
+    
+    def get_occurrence_no(self, start_date, time):
+        '''Gets the number of whole intervals from the time the event was first due to the specified date
+        (i.e. 0 for the first time it is processed, 1 for the second, and so on).'''
+        
+        time_difference = time - self.get_time(start_date)
+        interval = self.interval
+        return (time_difference.days * 86400000000 + time_difference.seconds * 1000000 + time_difference.microseconds) // \
+               (interval.days * 86400000000 + interval.seconds * 1000000 + interval.microseconds)
+
+class EventQueue(object):
+    '''
+    Keeps the events of a simulation in a heap, ordered by the date each is next due (events due at the
+    same date are processed in the order they were added). Events can be added (and removed) at any time,
+    including while the simulation is running. When a recurring event (one that provides get_next_time())
+    is popped, it is added again at the date it is next due. Events that do not provide get_time() are
+    due at their time_delta from the simulation's start date.
+    '''
+    
+    def __init__(self, start_date, events=()):
+        self.start_date = start_date
+        self._heap = [] #a heap of (due date, order added, event) tuples
+        self._num_added = 0
+        for event in events:
+            self.add(event)
+    
+    def __len__(self):
+        return len(self._heap)
+    
+    def add(self, event, time=None):
+        '''Adds an event, due at the specified date (by default, the date it is first due). An event that
+        is never due is not added.'''
+        
+        if time is None:
+            time = event.get_time(self.start_date) if hasattr(event, 'get_time') else self.start_date + event.time_delta
+            if time is None:
+                return
+        heapq.heappush(self._heap, (time, self._num_added, event))
+        self._num_added += 1
+    
+    def remove(self, event):
+        '''Removes an event (so that it is not processed again, if it is recurring). Returns True if the
+        event was in the queue; otherwise, False.'''
+        
+        heap = [ entry for entry in self._heap if entry[2] is not event ]
+        if len(heap) == len(self._heap):
+            return False
+        heapq.heapify(heap)
+        self._heap = heap
+        return True
+    
+    def get_next_time(self):
+        '''Gets the date the next event is due, or None if there are no more events.'''
+        return self._heap[0][0] if self._heap else None
+    
+    def pop_due(self, time):
+        '''Removes and returns the next event that is due at or before the specified date, or None if
+        there are none.'''
+        
+        heap = self._heap
+        if not heap or heap[0][0] > time:
+            return None
+        due_time, _, event = heapq.heappop(heap)
+        if hasattr(event, 'get_next_time'):
+            next_time = event.get_next_time(self.start_date, due_time)
+            if next_time is not None:
+                self.add(event, next_time)
+        return event
+
+def _set_demand_forecast_data_provider(simulation, region_id, demand_forecast_data_provider):
+    '''Replaces the demand forecast data provider for consumers that use one in a region, and reschedules
+    them (since they predict their demand again once their provider has changed).'''
+    
+    consumer_ids = []
+    for consumer in simulation.consumers_by_region[region_id]:
+        if hasattr(consumer, 'demand_forecast_data_provider'):
+            consumer.demand_forecast_data_provider = demand_forecast_data_provider
+            consumer_ids.append(consumer.id)
+    simulation.reschedule_agents(consumer_ids)
+
 class ChangeConsumerDemandForecastDataProviderEvent(SimulationEvent):
     '''
-    An event that changes the demand forecast data provider for consumers in a region. 
+    An event that changes the demand forecast data provider for consumers in a region.
     Only operates on consumers that have a demand_forecast_data_provider attribute
     (e.g. the ConsumerWithDemandForecastDataProvider type).
     '''
     
+    reschedules_agents = True
+    
     def __init__(self, time_delta, demand_forecast_data_provider, region_id):
-        super(ChangeConsumerDemandForecastDataProviderEvent, self).__init__('Change Consumer Demand Forecast Data Provider')
+        super(ChangeConsumerDemandForecastDataProviderEvent, self).__init__('Change Consumer Demand Forecast Data Provider', time_delta)
         self.demand_forecast_data_provider = demand_forecast_data_provider
         self.region_id = region_id
     
@@ -34,6 +187,27 @@ class ChangeConsumerDemandForecastDataProviderEvent(SimulationEvent):
         '''Replaces the demand forecast data provider for consumers
         that use one in this region.'''
         
-        for consumer in simulation.consumers_by_region[self.region_id]:
-            if hasattr(consumer, 'demand_forecast_data_provider'):
-                consumer.demand_forecast_data_provider = self.demand_forecast_data_provider
\ No newline at end of file
+        _set_demand_forecast_data_provider(simulation, self.region_id, self.demand_forecast_data_provider)
+
+class CycleConsumerDemandForecastDataProvidersEvent(RecurringEvent):
+    '''
+    A recurring event that changes the demand forecast data provider for consumers in a region
+    to the next of a list of providers every interval (starting from the first, and returning
+    to it after the last). Only operates on consumers that have a demand_forecast_data_provider
+    attribute (e.g. the ConsumerWithDemandForecastDataProvider type).
+    '''
+    
+    reschedules_agents = True
+    
+    def __init__(self, time_delta, interval, demand_forecast_data_providers, region_id, time_of_day=None, end_time_delta=None):
+        super(CycleConsumerDemandForecastDataProvidersEvent, self).__init__('Cycle Consumer Demand Forecast Data Providers', time_delta, interval, time_of_day, end_time_delta)
+        assert len(demand_forecast_data_providers) > 0, 'At least one demand forecast data provider is required.'
+        self.demand_forecast_data_providers = list(demand_forecast_data_providers)
+        self.region_id = region_id
+    
+    def process_event(self, simulation):
+        '''Replaces the demand forecast data provider for consumers that use one in this region
+        with the provider of the current interval.'''
+        
+        occurrence_no = self.get_occurrence_no(simulation.start_date, simulation.time)
+        _set_demand_forecast_data_provider(simulation, self.region_id, self.demand_forecast_data_providers[occurrence_no % len(self.demand_forecast_data_providers)])
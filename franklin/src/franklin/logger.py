@@ -1,27 +1,296 @@
 '''
 This module defines logging classes that can be used within a simulation to log
-events as they occur.
+events as they occur. Each event is logged as a structured record (its level, category,
+event type, agent, simulation time and values), and its message is only formatted
+from its values when the record is written. Since a simulation logs several events
+every time step, callers should check is_enabled_for() before logging (or building
+any values), so that disabled events cost no more than the check, e.g.:
+    
+    if logger.is_enabled_for(INFO, DISPATCH):
+        logger.log(INFO, DISPATCH, 'trading_interval', self.id, simulation.time, '%(agent_id)s: Spot price = $%(spot_price).2f', spot_price=spot_price)
+
+Values are formatted after log() returns (possibly in another thread), so they should not
+be objects that are changed afterwards.
 '''
 
-import logging, sys
+import os, sys, logging, threading, Queue
+
+#the levels of log records (as in the logging module)
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+CRITICAL = logging.CRITICAL
+
+#the categories of log records within a simulation (each can be given its own level)
+SIMULATION = 'simulation' #time steps and simulation events
+OFFERS = 'offers' #dispatch offers and availability re-bids, as received by market operators
+DISPATCH = 'dispatch' #the results of dispatch and trading intervals
+NOTIFICATIONS = 'notifications' #dispatch notifications, as received by generators
+MESSAGES = 'messages' #unrecognised messages
+
+class LogRecord(object):
+    '''An event logged within a simulation. Records logged without values (e.g. via info()) have
+    values of None, and their messages are not formatted.'''
     
-class BasicFileLogger(object):
-    '''Logs output to a file or output stream.'''
+    __slots__ = ('level', 'category', 'event_type', 'agent_id', 'time', 'message', 'values')
     
-    def __init__(self, file=None):
-        logging.basicConfig(stream=sys.stdout, file=file,level=logging.DEBUG, format='%(message)s')
+    def __init__(self, level, category, event_type, agent_id, time, message, values=None):
+        self.level = level
+        self.category = category
+        self.event_type = event_type
+        self.agent_id = agent_id
+        self.time = time
+        self.message = message
+        self.values = values #names mapped to the values the message is formatted with
     
-    def debug(self, msg):
-        logging.debug(msg)
+    def get_message(self):
+        '''Gets the record's message, formatted with its values (and its agent id and time).'''
+        
+        if self.values is None:
+            return self.message
+        return self.message % dict(self.values, agent_id=self.agent_id, time=self.time)
+    
+    def format(self, record_format):
+        '''Formats the record as a line of text, with the named fields of the record format
+        (level, category, event_type, agent_id, time and message).'''
         
+        return record_format % {
+            'level': logging.getLevelName(self.level),
+            'category': self.category or '',
+            'event_type': self.event_type or '',
+            'agent_id': self.agent_id or '',
+            'time': self.time or '',
+            'message': self.get_message(),
+        }
+
+class SimulationLogger(object):
+    '''
+    Provides the levels and filtering of a logger: records are only logged if their level is at
+    least the level of their category (or the logger's level, for categories without their own).
+    Subclasses write the records that are logged, via handle().
+    '''
+    
+    MESSAGE_RECORD_FORMAT = '%(message)s'
+    STRUCTURED_RECORD_FORMAT = '%(time)s\t%(level)s\t%(category)s\t%(event_type)s\t%(agent_id)s\t%(message)s'
+    
+    def __init__(self, level=DEBUG, levels_by_category=None, record_format=MESSAGE_RECORD_FORMAT):
+        self.level = level
+        self.levels_by_category = dict(levels_by_category or {}) #categories mapped to their levels
+        self.record_format = record_format
+    
+    def is_enabled_for(self, level, category=None):
+        '''Returns True if records of the specified level (and category) are logged; otherwise, False.'''
+        return level >= self.levels_by_category.get(category, self.level)
+    
+    def log(self, level, category, event_type, agent_id, time, message, **values):
+        '''Logs a record, if its level is enabled. Its message is formatted with its values (as keyword
+        arguments) and its agent id and time, when it is written.'''
+        
+        if self.is_enabled_for(level, category):
+            self.handle(LogRecord(level, category, event_type, agent_id, time, message, values))
+    
+    def debug(self, msg):
+        if self.is_enabled_for(DEBUG):
+            self.handle(LogRecord(DEBUG, None, None, None, None, msg))
+    
     def info(self, msg):
-        logging.info(msg)
+        if self.is_enabled_for(INFO):
+            self.handle(LogRecord(INFO, None, None, None, None, msg))
     
     def warning(self, msg):
-        logging.warning(msg)
-        
+        if self.is_enabled_for(WARNING):
+            self.handle(LogRecord(WARNING, None, None, None, None, msg))
+    
     def error(self, msg):
-        logging.error(msg)
+        if self.is_enabled_for(ERROR):
+            self.handle(LogRecord(ERROR, None, None, None, None, msg))
+    
+    def critical(self, msg):
+        if self.is_enabled_for(CRITICAL):
+            self.handle(LogRecord(CRITICAL, None, None, None, None, msg))
+    
+    def handle(self, record):
+        '''Writes a record that has been logged.'''
+        pass
+    
+    def flush(self):
+        '''Writes any records that have been logged but not yet written.'''
+        pass
+    
+    def close(self):
+        '''Writes any remaining records and closes the output.'''
+        pass
+    
+    def _open_output_file(self, file_location, append):
+        '''Opens the file to log to (or returns stdout, if there is no file location). The file is always
+        opened for appending (after being emptied, unless specified), so that the processes of a parallel
+        simulation can share it.'''
+        
+        if file_location is None:
+            return sys.stdout
+        
+        #create directory if it does not exist
+        directory = os.path.dirname(file_location)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if not append:
+            open(file_location, 'wb').close()
+        return open(file_location, 'ab')
+
+class BasicFileLogger(SimulationLogger):
+    '''Logs output to a file (or stdout, if no file location is specified), writing each record as it is logged.'''
+    
+    def __init__(self, file_location=None, level=DEBUG, levels_by_category=None, record_format=SimulationLogger.MESSAGE_RECORD_FORMAT):
+        super(BasicFileLogger, self).__init__(level, levels_by_category, record_format)
+        self.file_location = file_location
+        self._output_file = None
+        self._has_opened = False
+    
+    def handle(self, record):
+        if self._output_file is None:
+            self._output_file = self._open_output_file(self.file_location, self._has_opened)
+            self._has_opened = True
+        self._output_file.write(record.format(self.record_format) + '\n')
+        self._output_file.flush()
+    
+    def close(self):
+        '''Closes the file (which is reopened for appending if anything else is logged).'''
         
+        if self._output_file is not None and self._output_file is not sys.stdout:
+            self._output_file.close()
+        self._output_file = None
+    
+    def __getstate__(self):
+        #the file is not copied (e.g. into a snapshot), and is reopened for appending when next needed
+        state = self.__dict__.copy()
+        state['_output_file'] = None
+        return state
+
+class QueueFileLogger(SimulationLogger):
+    '''
+    Logs output to a file (or stdout, if no file location is specified) without making the simulation
+    wait on I/O: records are handed to a background thread in batches, which formats and writes them.
+    Records are written when a batch is full, when flush() is called, and when the logger is closed
+    (which waits for the writer thread to finish). If the logger is used in a forked process (e.g. by
+    a ParallelSimulation), the process starts its own writer thread, appending to the same file.
+    '''
+    
+    def __init__(self, file_location=None, level=DEBUG, levels_by_category=None, record_format=SimulationLogger.MESSAGE_RECORD_FORMAT, records_per_batch=1000):
+        super(QueueFileLogger, self).__init__(level, levels_by_category, record_format)
+        self.file_location = file_location
+        self.records_per_batch = records_per_batch #the number of records handed to the writer thread at a time
+        self._records = [] #the records waiting to be handed to the writer thread
+        self._record_batches = None #a queue of the record batches waiting to be written (None stops the writer thread)
+        self._writer_thread = None
+        self._writer_process_id = None #the process the writer thread was started in
+        self._writer_error = None
+        self._has_opened = False
+    
+    def handle(self, record):
+        self._records.append(record)
+        if len(self._records) >= self.records_per_batch:
+            self.flush()
+    
+    def flush(self):
+        '''Hands the records logged so far to the writer thread (starting it, if it is not running in this process).'''
+        
+        if self._records:
+            if self._writer_thread is None or self._writer_process_id != os.getpid():
+                self._start_writer()
+            self._record_batches.put(self._records)
+            self._records = []
+    
+    def close(self):
+        '''Writes any remaining records, then waits for the writer thread to finish and closes the file (which is
+        reopened for appending if anything else is logged).'''
+        
+        self.flush()
+        if self._writer_thread is not None and self._writer_process_id == os.getpid():
+            self._record_batches.put(None)
+            self._writer_thread.join()
+            writer_error = self._writer_error
+            self._record_batches = self._writer_thread = self._writer_process_id = self._writer_error = None
+            if writer_error is not None:
+                raise IOError('Failed to write to \'%s\': %s' % (self.file_location or 'stdout', writer_error))
+    
+    def _start_writer(self):
+        self._record_batches = Queue.Queue()
+        self._writer_thread = threading.Thread(target=self._write_record_batches, args=(self._open_output_file(self.file_location, self._has_opened),))
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+        self._writer_process_id = os.getpid()
+        self._writer_error = None
+        self._has_opened = True
+    
+    def _write_record_batches(self, output_file):
+        '''Writes the record batches in the queue to file until it is stopped (run in the writer thread).'''
+        
+        record_format = self.record_format
+        while True:
+            records = self._record_batches.get()
+            if records is None:
+                break
+            if self._writer_error is None:
+                try:
+                    #each batch is written at once, so batches from different processes are not interleaved
+                    output_file.write(''.join([ record.format(record_format) + '\n' for record in records ]))
+                    output_file.flush()
+                except Exception as e:
+                    self._writer_error = e #reported by close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    
+    def __getstate__(self):
+        #the writer thread and its queue are not copied (e.g. into a snapshot), and the writer is restarted when next needed
+        state = self.__dict__.copy()
+        state.update(_records=[], _record_batches=None, _writer_thread=None, _writer_process_id=None, _writer_error=None)
+        return state
+
+class NullLogger(object):
+    '''A logger that discards everything (and reports every level as disabled, so nothing is built to be logged).'''
+    
+    def is_enabled_for(self, level, category=None):
+        return False
+    
+    def log(self, level, category, event_type, agent_id, time, message, **values):
+        pass
+    
+    def debug(self, msg):
+        pass
+    
+    def info(self, msg):
+        pass
+    
+    def warning(self, msg):
+        pass
+    
+    def error(self, msg):
+        pass
+    
     def critical(self, msg):
-        logging.critical(msg)
\ No newline at end of file
+        pass
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+class LoggerAdapter(SimulationLogger):
+    '''
+    Adapts a logger that only has debug(), info(), warning(), error() and critical() methods (as
+    simulations accepted before records were structured) to the interface of a SimulationLogger.
+    Every level is reported as enabled, and each record logged is formatted and passed to the
+    method of its level. Flushing and closing the adapter does nothing.
+    '''
+    
+    def __init__(self, logger, record_format=SimulationLogger.MESSAGE_RECORD_FORMAT):
+        super(LoggerAdapter, self).__init__(record_format=record_format)
+        self.logger = logger
+    
+    def is_enabled_for(self, level, category=None):
+        return True
+    
+    def handle(self, record):
+        getattr(self.logger, logging.getLevelName(record.level).lower())(record.format(self.record_format))
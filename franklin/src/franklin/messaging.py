@@ -3,25 +3,57 @@ This modules defines messaging classes used within a simulation to enable agents
 to communicate with each other.
 '''
 
+import heapq
+
 class MessageDispatcher(object):
     '''Defines a centralised location from which messages can be sent and received
-    between entities.'''
+    between entities. Messages are held in a bucket per delivery date (with an inbox per
+    recipient), and the delivery dates are kept in a time-ordered queue. A bucket is
+    released as soon as it is collected for delivery.'''
     
     def __init__(self):
         #maps a date to recipient message_id's; each message_id maps to an inbox (a collection of messages)
-        self.inboxes_by_id_by_date = {}
+        self._inboxes_by_id_by_date = {}
+        self._delivery_dates = [] #a heap of the dates in _inboxes_by_id_by_date (may also contain dates already collected)
     
     def fetch_messages(self, date, recipient_id):
         '''Gets all of messages in the recipient message_id's inbox at this date.'''
         
-        inboxes_by_id = self.inboxes_by_id_by_date.get(date, None)
+        inboxes_by_id = self._inboxes_by_id_by_date.get(date, None)
         return inboxes_by_id.get(recipient_id, None) if inboxes_by_id else None
         
     def send(self, message, to_process_date, recipient_id):
         '''Sends the message to the inbox with the given recipient message_id, to be processed at the
         specified date.'''
         
-        self.inboxes_by_id_by_date.setdefault(to_process_date, {}).setdefault(recipient_id, []).append(message)
+        inboxes_by_id = self._inboxes_by_id_by_date.get(to_process_date, None)
+        if inboxes_by_id is None:
+            inboxes_by_id = self._inboxes_by_id_by_date[to_process_date] = {}
+            heapq.heappush(self._delivery_dates, to_process_date)
+        inboxes_by_id.setdefault(recipient_id, []).append(message)
+    
+    def collect_inboxes(self, date):
+        '''Removes and returns the inboxes to be delivered at this date, as a dictionary of recipient
+        message_id's mapped to their inbox (or None if there are no messages to deliver). Inboxes for
+        earlier dates that were never collected can no longer be delivered, and are discarded.'''
+        
+        while len(self._delivery_dates) > 0 and self._delivery_dates[0] < date:
+            self._inboxes_by_id_by_date.pop(heapq.heappop(self._delivery_dates), None)
+        return self._inboxes_by_id_by_date.pop(date, None)
+    
+    def discard_messages(self, recipient_id):
+        '''Discards every message waiting to be delivered to the recipient message_id.'''
+        
+        for inboxes_by_id in self._inboxes_by_id_by_date.values():
+            inboxes_by_id.pop(recipient_id, None)
+    
+    def next_delivery_time(self):
+        '''Gets the earliest date that has messages waiting to be processed, or None if
+        there are no messages waiting.'''
+        
+        while len(self._delivery_dates) > 0 and self._delivery_dates[0] not in self._inboxes_by_id_by_date:
+            heapq.heappop(self._delivery_dates)
+        return self._delivery_dates[0] if len(self._delivery_dates) > 0 else None
 
 class Message(object):
     '''Defines a bundle of information that can be passed around by a MessageDispatcher.'''
@@ -78,6 +110,15 @@ class DemandForecast(Message):
         self.dispatch_interval_date = dispatch_interval_date #the dispatch interval date of the predicted demand
         self.demand = demand #the demand in MW
         
+class DemandForecastBatch(Message):
+    '''Defines the predicted demand expected for consecutive dispatch intervals (e.g. the rest of a 
+    trading day), from a specified dispatch interval date.'''
+    
+    def __init__(self, sender_id, first_dispatch_interval_date, demands):
+        super(DemandForecastBatch, self).__init__(sender_id)
+        self.first_dispatch_interval_date = first_dispatch_interval_date #the dispatch interval date of the first predicted demand
+        self.demands = demands #the demand in MW of each dispatch interval (or None, for dispatch intervals without a prediction)
+        
 class GeneratorDispatchNotification(Message):
     '''Defines a notification for a generator to be dispatched at a specified
     dispatch interval date and to generated a specified MW amount of energy.'''
@@ -85,4 +126,7 @@ class GeneratorDispatchNotification(Message):
     def __init__(self, sender_id, dispatch_interval_date, demand_to_supply):
         super(GeneratorDispatchNotification, self).__init__(sender_id)
         self.dispatch_interval_date = dispatch_interval_date
-        self.demand_to_supply = demand_to_supply #the demand in MW
\ No newline at end of file
+        self.demand_to_supply = demand_to_supply #the demand in MW
+
+#module-level reference to the nested class, which is required for its instances to be pickled (e.g. in a simulation snapshot)
+TradingIntervalAvailabilityBid = GeneratorAvailabilityBid.TradingIntervalAvailabilityBid
\ No newline at end of file
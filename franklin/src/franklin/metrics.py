@@ -0,0 +1,133 @@
+'''
+This module defines the metrics that a simulation can collect about its own performance as it
+runs: the time spent in each phase of a time step (processing events, stepping each class of
+agent, delivering messages and clearing the market), counts of the work done (e.g. messages
+delivered per dispatch interval and offers in each merit order stack), and peak memory use.
+Metrics are only collected if a SimulationMetrics object is set as the simulation's metrics,
+so that a simulation without them does no extra work beyond checking for them once per phase.
+'''
+
+import os, time
+from csv import writer
+from datetime import timedelta
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class SimulationMetrics(object):
+    '''
+    Collects counters and timers for a simulation (see the module description). Timers are kept as
+    the total number of seconds spent in a phase, and a count of the times it was timed. If a file
+    location is specified, the metrics of each report interval of simulated time are appended to the
+    file (in CSV format) as the simulation runs.
+    '''
+    
+    #the names of the metrics collected by a simulation and its market operators
+    EVENTS = 'events'
+    AGENT_STEPS = 'agent_steps' #timed per class of agent (e.g. agent_steps:AEMOperator)
+    MESSAGE_DELIVERY = 'message_delivery'
+    MESSAGES_DELIVERED = 'messages_delivered' #counted per time step
+    OPERATOR_CLEARING = 'operator_clearing' #the dispatch of each dispatch interval (which is part of the market operators' agent steps)
+    OFFERS_IN_STACK = 'offers_in_stack' #the dispatch offers in each merit order stack created
+    DISPATCH_INTERVALS = 'dispatch_intervals' #the time steps at dispatch intervals
+    
+    DATE_TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+    timer = staticmethod(time.time)
+    
+    def __init__(self, file_location=None, report_interval=timedelta(hours=1)):
+        self.file_location = file_location
+        self.report_interval = report_interval
+        self.durations = {} #metric names mapped to the total number of seconds timed
+        self.counts = {} #metric names mapped to the number of times they were timed (or counted)
+        self.totals = {} #metric names mapped to the total of the values counted (e.g. the number of messages delivered)
+        self.maximums = {} #metric names mapped to the largest value counted
+        self._reported = ({}, {}, {}) #the durations, counts and totals when the metrics were last reported
+        self._has_reported = False
+    
+    def add_duration(self, name, seconds):
+        '''Adds a time (in seconds) to a timer.'''
+        
+        self.durations[name] = self.durations.get(name, 0.) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+    
+    def add_count(self, name, value=1):
+        '''Adds a value to a counter (keeping the number of values added).'''
+        
+        self.totals[name] = self.totals.get(name, 0) + value
+        self.counts[name] = self.counts.get(name, 0) + 1
+    
+    def add_value(self, name, value):
+        '''Adds a value to a counter, also keeping its largest value (e.g. the largest merit order stack).'''
+        
+        self.add_count(name, value)
+        if value > self.maximums.get(name, value - 1):
+            self.maximums[name] = value
+    
+    def get_mean(self, name):
+        '''Gets the mean value added to a counter (or the mean time of a timer), or None if nothing was added.'''
+        
+        count = self.counts.get(name, 0)
+        if count == 0:
+            return None
+        return (self.totals[name] if name in self.totals else self.durations[name]) / float(count)
+    
+    def get_messages_per_dispatch_interval(self):
+        '''Gets the mean number of messages delivered per dispatch interval (in every region), or None if no
+        dispatch intervals have been reached.'''
+        
+        num_dispatch_intervals = self.totals.get(self.DISPATCH_INTERVALS, 0)
+        return self.totals.get(self.MESSAGES_DELIVERED, 0) / float(num_dispatch_intervals) if num_dispatch_intervals > 0 else None
+    
+    def get_peak_memory(self):
+        '''Gets the peak memory use (resident set size) of the process in bytes, or None if it is not available.'''
+        
+        if resource is None:
+            return None
+        #Linux reports the peak in kilobytes (other platforms in bytes)
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_memory * 1024 if os.uname()[0] == 'Linux' else peak_memory
+    
+    def report(self, simulation):
+        '''Appends the metrics of the time since the last report (or since the simulation started) to file, as
+        rows of the simulation time, the metric name, its count and its total (in seconds, for timers).'''
+        
+        reported_durations, reported_counts, reported_totals = self._reported
+        rows = []
+        time_text = simulation.time.strftime(self.DATE_TIME_FORMAT)
+        for name,duration in sorted(self.durations.items()):
+            rows.append([time_text, name, self.counts[name] - reported_counts.get(name, 0), duration - reported_durations.get(name, 0.)])
+        for name,total in sorted(self.totals.items()):
+            rows.append([time_text, name, self.counts[name] - reported_counts.get(name, 0), total - reported_totals.get(name, 0)])
+        for name,maximum in sorted(self.maximums.items()):
+            rows.append([time_text, 'max_' + name, '', maximum])
+        rows.append([time_text, 'peak_memory', '', self.get_peak_memory()])
+        
+        #create directory if it does not exist (the file is replaced by the first report)
+        directory = os.path.dirname(self.file_location)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.file_location, 'ab' if self._has_reported else 'wb') as metrics_file:
+            file_writer = writer(metrics_file)
+            if not self._has_reported:
+                file_writer.writerow(['TIME', 'METRIC', 'COUNT', 'TOTAL'])
+            file_writer.writerows(rows)
+        self._reported = (self.durations.copy(), self.counts.copy(), self.totals.copy())
+        self._has_reported = True
+    
+    def summarise(self):
+        '''Gets a summary of every metric, as a list of lines of text.'''
+        
+        lines = []
+        for name,duration in sorted(self.durations.items()):
+            lines.append('%-40s %10.3fs total, %9.1fus mean (x%d)' % (name, duration, duration / self.counts[name] * 1000000., self.counts[name]))
+        for name,total in sorted(self.totals.items()):
+            maximum_text = ', %d max' % self.maximums[name] if name in self.maximums else ''
+            lines.append('%-40s %10d total, %11.1f mean%s (x%d)' % (name, total, self.get_mean(name), maximum_text, self.counts[name]))
+        messages_per_dispatch_interval = self.get_messages_per_dispatch_interval()
+        if messages_per_dispatch_interval is not None:
+            lines.append('%-40s %10.1f' % ('messages per dispatch interval', messages_per_dispatch_interval))
+        peak_memory = self.get_peak_memory()
+        if peak_memory is not None:
+            lines.append('%-40s %10.1fMB' % ('peak memory', peak_memory / 1048576.))
+        return lines
@@ -0,0 +1,162 @@
+'''
+This module defines a simulation that runs each region in a separate process. Regions
+only interact through the simulation clock (all messages are between a region's own
+agents), so each region's agents and market operator can be simulated independently,
+with the regions kept in step at every dispatch interval.
+'''
+
+from simulation import Simulation
+import multiprocessing, traceback
+
+class RegionExchange(object):
+    '''
+    Provides a basic skeleton for exchanging quantities between the regions of a
+    ParallelSimulation (e.g. interconnector flows). At each dispatch interval barrier,
+    get_quantity() is called in every region's process, and the quantities are then
+    passed to receive_quantities() in every region's process.
+    '''
+    
+    def get_quantity(self, simulation, region_id):
+        '''Returns a (picklable) quantity from a region at the current simulation time.'''
+        return None
+    
+    def receive_quantities(self, simulation, region_id, quantity_by_region_id):
+        '''Receives the quantity of every region at the current simulation time,
+        as a dictionary of region ids mapped to quantities.'''
+        pass
+
+class ParallelSimulation(Simulation):
+    '''
+    A simulation that runs each region's agents and market operator in a separate (forked)
+    process. The processes wait for each other at every dispatch interval (i.e. a barrier),
+    where quantities can be exchanged between regions via a RegionExchange. When the run
+    finishes, the dispatch and trading interval information of each region's market operator
+    is merged back into operator_by_region (the state of other agents is not). Agents must
+    only send messages to agents in their own region.
+    '''
+    
+    def __init__(self, logger, start_date, end_date, region_ids, generators, consumers, events, dispatch_engine=None, region_exchange=None):
+        '''Takes the same arguments as a Simulation, plus an optional region exchange.'''
+        
+        self.region_exchange = region_exchange
+        self._process_region_id = None #the region simulated by this process (None in the parent process)
+        super(ParallelSimulation, self).__init__(logger, start_date, end_date, region_ids, generators, consumers, events, dispatch_engine)
+    
+    def run(self):
+        '''Runs a simulation from its start date to its end date, with a process per region.'''
+        
+        #load the generators' bids in this process, so that they are shared by every forked process (rather than each
+        #process loading every generator's bids again). only data providers that support it load bids in advance
+        bid_data_providers = set(generator.bid_data_provider for generators in self.generators_by_region.values() for generator in generators if hasattr(generator, 'bid_data_provider'))
+        for bid_data_provider in bid_data_providers:
+            if hasattr(bid_data_provider, 'load_trading_days'):
+                bid_data_provider.load_trading_days(self.start_date, self.end_date)
+        
+        processes_and_connections_by_region_id = {}
+        self.logger.flush() #so that log records waiting to be written are not copied into (and written by) every process
+        try:
+            for region_id in sorted(self.region_ids):
+                connection, process_connection = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=self._run_region, args=(region_id, process_connection))
+                process.daemon = True
+                process.start()
+                processes_and_connections_by_region_id[region_id] = (process, connection)
+            
+            #pass every region through each barrier together, until all of them are finished
+            while True:
+                replies_by_region_id = {}
+                for region_id,(process,connection) in processes_and_connections_by_region_id.items():
+                    try:
+                        replies_by_region_id[region_id] = connection.recv()
+                    except EOFError:
+                        replies_by_region_id[region_id] = ('error', None, 'The process exited unexpectedly.')
+                
+                for region_id,(reply_type,time,content) in replies_by_region_id.items():
+                    if reply_type == 'error':
+                        raise RuntimeError('Simulation of region %s failed:\n%s' % (region_id, content))
+                reply_types_and_times = set((reply_type, time) for reply_type,time,_ in replies_by_region_id.values())
+                assert len(reply_types_and_times) == 1, 'Regions are out of step: %s' % reply_types_and_times
+                reply_type, time = reply_types_and_times.pop()
+                self.set_time(time)
+                
+                if reply_type == 'barrier':
+                    quantity_by_region_id = { region_id: quantity for region_id,(_,_,quantity) in replies_by_region_id.items() }
+                    for process,connection in processes_and_connections_by_region_id.values():
+                        connection.send(quantity_by_region_id)
+                else:
+                    for region_id,(_,_,(dispatch_interval_results, trading_interval_results, rollup_results_by_name)) in replies_by_region_id.items():
+                        if region_id in self.operator_by_region and dispatch_interval_results is not None:
+                            for results in [dispatch_interval_results, trading_interval_results] + rollup_results_by_name.values():
+                                results.calendar = self.calendar
+                            self.operator_by_region[region_id].dispatch_interval_results = dispatch_interval_results
+                            self.operator_by_region[region_id].trading_interval_results = trading_interval_results
+                            self.operator_by_region[region_id].rollup_results_by_name = rollup_results_by_name
+                    break
+        finally:
+            for process,connection in processes_and_connections_by_region_id.values():
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+    
+    def _run_region(self, region_id, connection):
+        '''Runs the simulation of a single region in its process, passing through a barrier (via
+        the connection to the parent process) at every dispatch interval.'''
+        
+        try:
+            #retire every agent in other regions
+            self._process_region_id = region_id
+            for agent in self.agents_by_id.values():
+                if agent.region_id != region_id:
+                    self.remove_agent(agent.id)
+                    self.message_dispatcher.discard_messages(agent.id)
+            
+            self._start_running()
+            calendar = self.calendar
+            last_minute = calendar.get_minute(self.end_date)
+            barrier_minute = self.minute if calendar.is_dispatch_interval(self.minute) else calendar.get_next_dispatch_interval_minute(self.minute)
+            while self.minute <= last_minute:
+                self.step()
+                next_step_minute = self._get_next_step_minute()
+                #pass through each barrier up to the next time step (the region has no work due in between)
+                while barrier_minute < next_step_minute and barrier_minute <= last_minute:
+                    self._set_minute(barrier_minute)
+                    self._pass_barrier(region_id, connection)
+                    barrier_minute = calendar.get_next_dispatch_interval_minute(barrier_minute)
+                    next_step_minute = self._get_next_step_minute()
+                self._set_minute(next_step_minute)
+            
+            operator = self.operator_by_region.get(region_id, None)
+            results = (operator.dispatch_interval_results, operator.trading_interval_results, operator.rollup_results_by_name) if operator else (None, None, {})
+            self.logger.close() #write the log records of this process (the parent process does not have them)
+            connection.send(('finished', self.time, results))
+        except Exception:
+            connection.send(('error', None, traceback.format_exc()))
+        finally:
+            connection.close()
+    
+    def _pass_barrier(self, region_id, connection):
+        '''Waits at a barrier for every other region, exchanging quantities with them if there is
+        a region exchange.'''
+        
+        quantity = self.region_exchange.get_quantity(self, region_id) if self.region_exchange else None
+        connection.send(('barrier', self.time, quantity))
+        quantity_by_region_id = connection.recv()
+        if self.region_exchange:
+            self.region_exchange.receive_quantities(self, region_id, quantity_by_region_id)
+            #the exchange may have changed when agents are due
+            self._reschedule_agents(self.agents_by_id.keys())
+    
+    def add_operator(self, operator):
+        '''Adds a market operator to the simulation (if it is in the region simulated by this process).'''
+        if self._process_region_id is None or operator.region_id == self._process_region_id:
+            super(ParallelSimulation, self).add_operator(operator)
+    
+    def add_generator(self, generator):
+        '''Adds a generator to the simulation (if it is in the region simulated by this process).'''
+        if self._process_region_id is None or generator.region_id == self._process_region_id:
+            super(ParallelSimulation, self).add_generator(generator)
+    
+    def add_consumer(self, consumer):
+        '''Adds a consumer to the simulation (if it is in the region simulated by this process).'''
+        if self._process_region_id is None or consumer.region_id == self._process_region_id:
+            super(ParallelSimulation, self).add_consumer(consumer)
@@ -0,0 +1,443 @@
+'''
+This module defines the stores used by market operators to keep the results of their dispatch
+and trading intervals. Rather than an object (and a dictionary of generator supplies) per interval,
+results are kept in columns: a preallocated array per value (e.g. price), with a row per interval,
+and a sparse matrix of the supply (and price offer) of each generator dispatched per interval, with
+generators referred to by integer ids. Results can be queried by time range and generator without
+creating any objects per interval (e.g. by data monitors or analysis code). The demand forecasts
+that market operators receive for upcoming dispatch intervals are kept in the same way.
+'''
+
+from array import array
+from math import isnan
+import cPickle
+
+NAN = float('nan') #marks the dispatch intervals that a consumer has not forecast (see DemandForecastStore)
+
+class IntervalResultStore(object):
+    '''
+    Stores the results of a market operator's intervals of a fixed duration (e.g. its dispatch
+    intervals). Each interval is identified by the minute index it ends at (see the clock module),
+    and has a row in every column. Rows are preallocated for a range of intervals (e.g. the whole
+    simulation), and the columns are extended if results are added outside of it. The supply entries
+    of each interval (generator id, price offer and supply) are stored contiguously in flat arrays, in
+    the order they were added, with the start and end offsets of each interval's entries kept per row.
+    '''
+    
+    def __init__(self, calendar, interval_duration_minutes, column_names, first_minute=0, last_minute=None, has_price_offers=True):
+        '''The store's rows are preallocated for the intervals from the first minute index to the last (if any).
+        Results must be added at minute indices a whole number of intervals from the first minute index.'''
+        
+        self.calendar = calendar
+        self.interval_duration_minutes = interval_duration_minutes
+        self.column_names = tuple(column_names)
+        self.has_price_offers = has_price_offers
+        self._first_minute = first_minute
+        num_rows = (last_minute - first_minute) // interval_duration_minutes + 1 if last_minute is not None else 0
+        self._columns = [ array('d', [0.]) * num_rows for _ in self.column_names ]
+        self._has_result = array('b', [0]) * num_rows
+        self._entry_starts = array('l', [0]) * num_rows
+        self._entry_ends = array('l', [0]) * num_rows
+        self._entry_generators = array('l') #the integer id of each entry's generator
+        self._entry_price_offers = array('d')
+        self._entry_supplies = array('d')
+        self.generator_ids = [] #the generator id of each integer id
+        self._integer_id_by_generator_id = {}
+        self.num_results = 0
+    
+    def __len__(self):
+        return self.num_results
+    
+    def __contains__(self, minute):
+        row = self._get_row(minute)
+        return row is not None and self._has_result[row] == 1
+    
+    def get_generator_integer_id(self, generator_id):
+        '''Gets the integer id of a generator, or None if it has no supply entries in the store.'''
+        return self._integer_id_by_generator_id.get(generator_id, None)
+    
+    def _get_row(self, minute):
+        '''Gets the row of the interval at the specified minute index, or None if it is outside of the store
+        (or not at the end of an interval).'''
+        
+        row, remainder = divmod(minute - self._first_minute, self.interval_duration_minutes)
+        return row if remainder == 0 and 0 <= row < len(self._has_result) else None
+    
+    def _extend_to(self, minute):
+        '''Extends the columns so that they include the interval at the specified minute index.'''
+        
+        row = (minute - self._first_minute) // self.interval_duration_minutes
+        if row < 0:
+            num_rows = -row
+            self._first_minute = minute
+            self._columns = [ array('d', [0.]) * num_rows + column for column in self._columns ]
+            self._has_result = array('b', [0]) * num_rows + self._has_result
+            self._entry_starts = array('l', [0]) * num_rows + self._entry_starts
+            self._entry_ends = array('l', [0]) * num_rows + self._entry_ends
+        elif row >= len(self._has_result):
+            num_rows = max(row + 1 - len(self._has_result), len(self._has_result)) #at least double the rows, so that extending one interval at a time is not quadratic
+            for column in self._columns:
+                column.extend(array('d', [0.]) * num_rows)
+            self._has_result.extend(array('b', [0]) * num_rows)
+            self._entry_starts.extend(array('l', [0]) * num_rows)
+            self._entry_ends.extend(array('l', [0]) * num_rows)
+    
+    def discard_before(self, minute):
+        '''Discards the results of the intervals before the specified minute index (e.g. to keep only a sliding
+        window of recent results). The columns are only compacted once the discarded rows outnumber the rows
+        kept, so that discarding one interval at a time takes linear time overall.'''
+        
+        num_rows = min(len(self._has_result), max(0, -(-(minute - self._first_minute) // self.interval_duration_minutes)))
+        for row in xrange(num_rows):
+            if self._has_result[row] == 1:
+                self._has_result[row] = 0
+                self.num_results -= 1
+        if num_rows == 0 or num_rows < len(self._has_result) - num_rows:
+            return
+        
+        #drop the discarded rows, and the supply entries before those of the first row kept
+        self._first_minute += num_rows * self.interval_duration_minutes
+        self._columns = [ column[num_rows:] for column in self._columns ]
+        self._has_result = self._has_result[num_rows:]
+        self._entry_starts = self._entry_starts[num_rows:]
+        self._entry_ends = self._entry_ends[num_rows:]
+        first_entry = min([ self._entry_starts[row] for row in xrange(len(self._has_result)) if self._has_result[row] == 1 ] or [len(self._entry_supplies)])
+        self._entry_generators = self._entry_generators[first_entry:]
+        self._entry_price_offers = self._entry_price_offers[first_entry:] if self.has_price_offers else self._entry_price_offers
+        self._entry_supplies = self._entry_supplies[first_entry:]
+        for row in xrange(len(self._has_result)):
+            if self._has_result[row] == 1:
+                self._entry_starts[row] -= first_entry
+                self._entry_ends[row] -= first_entry
+    
+    def add(self, minute, values, supply_entries):
+        '''Adds (or replaces) the results of the interval at the specified minute index: a value per column
+        and an iterable of supply entries, each a tuple of a generator id, its price offer and its supply (or
+        a generator id and its supply, if the store has no price offers).'''
+        
+        assert (minute - self._first_minute) % self.interval_duration_minutes == 0, 'Minute index %d is not at the end of an interval.' % minute
+        row = self._get_row(minute)
+        if row is None:
+            self._extend_to(minute)
+            row = self._get_row(minute)
+        for column,value in zip(self._columns, values):
+            column[row] = value
+        
+        self._entry_starts[row] = len(self._entry_supplies)
+        for entry in supply_entries:
+            generator_id = entry[0]
+            integer_id = self._integer_id_by_generator_id.get(generator_id, None)
+            if integer_id is None:
+                integer_id = self._integer_id_by_generator_id[generator_id] = len(self.generator_ids)
+                self.generator_ids.append(generator_id)
+            self._entry_generators.append(integer_id)
+            if self.has_price_offers:
+                self._entry_price_offers.append(entry[1])
+            self._entry_supplies.append(entry[-1])
+        self._entry_ends[row] = len(self._entry_supplies)
+        
+        if self._has_result[row] == 0:
+            self._has_result[row] = 1
+            self.num_results += 1
+    
+    def get_values(self, minute):
+        '''Gets a tuple of the column values of the interval at the specified minute index (which must have results).'''
+        
+        row = self._get_row(minute)
+        return tuple(column[row] for column in self._columns)
+    
+    def get_value(self, minute, column_name):
+        '''Gets a column's value for the interval at the specified minute index (which must have results).'''
+        return self._columns[self.column_names.index(column_name)][self._get_row(minute)]
+    
+    def get_supply_entries(self, minute):
+        '''Gets a list of the supply entries of the interval at the specified minute index (which must have
+        results), in the order they were added. See add() for the format of the entries.'''
+        
+        row = self._get_row(minute)
+        generator_ids = self.generator_ids
+        entries = xrange(self._entry_starts[row], self._entry_ends[row])
+        if self.has_price_offers:
+            return [ (generator_ids[self._entry_generators[i]], self._entry_price_offers[i], self._entry_supplies[i]) for i in entries ]
+        return [ (generator_ids[self._entry_generators[i]], self._entry_supplies[i]) for i in entries ]
+    
+    def _get_rows(self, start_date, end_date):
+        '''Gets the range of rows of the intervals from the start date to the end date (inclusive). Either date
+        can be None, meaning from the first (or up to the last) interval in the store.'''
+        
+        start_row = 0
+        end_row = len(self._has_result)
+        if start_date is not None:
+            start_row = max(start_row, -(-(self.calendar.get_minute_at_or_after(start_date) - self._first_minute) // self.interval_duration_minutes))
+        if end_date is not None:
+            end_row = min(end_row, (self.calendar.get_minute(end_date) - self._first_minute) // self.interval_duration_minutes + 1)
+        return xrange(start_row, max(start_row, end_row))
+    
+    def get_minutes(self, start_date=None, end_date=None):
+        '''Gets an array of the minute indices of the intervals with results from the start date to the end date
+        (inclusive), in time order. The results of other queries with the same dates are in the same order.'''
+        
+        has_result = self._has_result
+        return array('l', [ self._first_minute + row * self.interval_duration_minutes for row in self._get_rows(start_date, end_date) if has_result[row] ])
+    
+    def get_dates(self, start_date=None, end_date=None):
+        '''Gets a list of the dates of the intervals with results from the start date to the end date (inclusive).'''
+        return [ self.calendar.get_date(minute) for minute in self.get_minutes(start_date, end_date) ]
+    
+    def get_column(self, column_name, start_date=None, end_date=None):
+        '''Gets an array of a column's values for the intervals with results from the start date to the end date (inclusive).'''
+        
+        column = self._columns[self.column_names.index(column_name)]
+        has_result = self._has_result
+        return array('d', [ column[row] for row in self._get_rows(start_date, end_date) if has_result[row] ])
+    
+    def get_generator_supplies(self, generator_id, start_date=None, end_date=None):
+        '''Gets an array of a generator's supply for the intervals with results from the start date to the end date
+        (inclusive); the supply is zero for intervals in which the generator was not dispatched.'''
+        
+        integer_id = self.get_generator_integer_id(generator_id)
+        has_result = self._has_result
+        supplies = array('d')
+        for row in self._get_rows(start_date, end_date):
+            if has_result[row]:
+                supply = 0.
+                if integer_id is not None:
+                    for i in xrange(self._entry_starts[row], self._entry_ends[row]):
+                        if self._entry_generators[i] == integer_id:
+                            supply = self._entry_supplies[i]
+                            break
+                supplies.append(supply)
+        return supplies
+
+    def save(self, output_file):
+        '''Writes the store to an open (binary) file: a small pickled header, followed by the raw contents of
+        each column and supply entry array. See load().'''
+        
+        header = (self.interval_duration_minutes, self.column_names, self.has_price_offers, self._first_minute, 
+                  len(self._has_result), len(self._entry_supplies), self.generator_ids, self.num_results)
+        cPickle.dump(header, output_file, cPickle.HIGHEST_PROTOCOL)
+        for values in self._get_row_arrays() + self._get_entry_arrays():
+            values.tofile(output_file)
+    
+    @classmethod
+    def load(cls, input_file, calendar):
+        '''Reads a store written by save() from an open (binary) file, using the specified calendar (which must
+        have the same epoch as the calendar of the saved store).'''
+        
+        interval_duration_minutes, column_names, has_price_offers, first_minute, num_rows, num_entries, generator_ids, num_results = cPickle.load(input_file)
+        store = cls(calendar, interval_duration_minutes, column_names, first_minute, has_price_offers=has_price_offers)
+        for values in store._get_row_arrays():
+            values.fromfile(input_file, num_rows)
+        for values in store._get_entry_arrays():
+            values.fromfile(input_file, num_entries)
+        store.generator_ids = generator_ids
+        store._integer_id_by_generator_id = { generator_id: integer_id for integer_id,generator_id in enumerate(generator_ids) }
+        store.num_results = num_results
+        return store
+    
+    def _get_row_arrays(self):
+        '''Gets the arrays with an item per row, in the order they are saved.'''
+        return self._columns + [self._has_result, self._entry_starts, self._entry_ends]
+    
+    def _get_entry_arrays(self):
+        '''Gets the arrays with an item per supply entry, in the order they are saved.'''
+        return [self._entry_generators] + ([self._entry_price_offers] if self.has_price_offers else []) + [self._entry_supplies]
+
+class IntervalAccumulator(object):
+    '''
+    Keeps running totals of the dispatch intervals in a longer interval (e.g. a trading interval, or an
+    hourly or daily rollup): the sum of their prices, their total demand and demand supplied, and the
+    demand supplied by each generator. Each dispatch interval is added as it is dispatched, so that the
+    longer interval's results are ready as soon as its last dispatch interval has been added. Intervals
+    end a whole number of their durations from the start of the trading day (e.g. on the hour, for an
+    hourly interval, and at the end of the trading day, for a daily interval). The totals only cover the
+    consecutive dispatch intervals added since the last interval ended (or since the last missing
+    dispatch interval).
+    '''
+    
+    def __init__(self, interval_duration_minutes, dispatch_interval_duration_minutes):
+        assert interval_duration_minutes % dispatch_interval_duration_minutes == 0, 'An interval must be a whole number of dispatch intervals.'
+        self.interval_duration_minutes = interval_duration_minutes
+        self.dispatch_interval_duration_minutes = dispatch_interval_duration_minutes
+        self.num_dispatch_intervals = interval_duration_minutes // dispatch_interval_duration_minutes #the number of dispatch intervals in a complete interval
+        self.reset()
+    
+    def reset(self):
+        '''Clears the running totals (e.g. at the end of an interval).'''
+        
+        self.price_sum = 0.
+        self.total_demand_supplied = 0.
+        self.total_demand = 0.
+        self.demand_supplied_by_generator_id = {}
+        self.num_added = 0 #the number of consecutive dispatch intervals added
+        self._last_minute = None
+    
+    def add(self, minute, price, total_demand_supplied, total_demand, supplies):
+        '''Adds the results of the dispatch interval at the specified minute index, including an iterable of
+        (generator id, demand supplied) tuples. If the previous dispatch interval was not added, the totals
+        are restarted from this one.'''
+        
+        if self._last_minute is not None and minute != self._last_minute + self.dispatch_interval_duration_minutes:
+            self.reset()
+        self.price_sum += price
+        self.total_demand_supplied += total_demand_supplied
+        self.total_demand += total_demand
+        demand_supplied_by_generator_id = self.demand_supplied_by_generator_id
+        for generator_id,demand_supplied in supplies:
+            demand_supplied_by_generator_id[generator_id] = demand_supplied_by_generator_id.get(generator_id, 0) + demand_supplied
+        self.num_added += 1
+        self._last_minute = minute
+    
+    def is_interval_end(self, calendar, minute):
+        '''Returns True if an interval ends at the specified minute index; otherwise, False.'''
+        return (calendar.get_trading_day_end_minute(minute) - minute) % self.interval_duration_minutes == 0
+    
+    def is_complete(self):
+        '''Returns True if every dispatch interval of the interval ending at the last one added has been added; otherwise, False.'''
+        return self.num_added == self.num_dispatch_intervals
+    
+    def get_average_price(self):
+        return self.price_sum / self.num_added
+
+class DemandForecastStore(object):
+    '''
+    Keeps the total demand forecast for each upcoming dispatch interval of a market operator's region, in an
+    array with a row per dispatch interval (preallocated, and extended as forecasts are added further ahead).
+    The forecasts of every consumer are summed as they are received, so that each dispatch interval's total
+    demand is ready when it is dispatched. Dispatch intervals without any forecasts have no total demand.
+    Each consumer's forecasts are also kept (in an array of its own, with NaN for no forecast), so that a
+    consumer can forecast a dispatch interval again, replacing its earlier forecast in the total.
+    '''
+    
+    def __init__(self, dispatch_interval_duration_minutes, first_minute=0, num_rows=0):
+        self.dispatch_interval_duration_minutes = dispatch_interval_duration_minutes
+        self._first_minute = first_minute
+        self._total_demands = array('d', [0.]) * num_rows
+        self._has_demand = array('b', [0]) * num_rows
+        self._consumer_ids = [] #the ids of the consumers that have added forecasts, in the order they were first added
+        self._demands_by_consumer_id = {} #consumer ids mapped to an array of the consumer's forecast of each row (NaN if none)
+    
+    def add(self, minute, demands, consumer_id):
+        '''Adds a consumer's demand forecasts of consecutive dispatch intervals, from the dispatch interval at the
+        specified minute index, replacing any that it has already forecast for the same dispatch intervals. Demands
+        of None (i.e. dispatch intervals without a forecast) are skipped, or remove the consumer's earlier forecast.'''
+        
+        first_row, remainder = divmod(minute - self._first_minute, self.dispatch_interval_duration_minutes)
+        assert remainder == 0, 'Minute index %d is not at the end of a dispatch interval.' % minute
+        if consumer_id not in self._demands_by_consumer_id:
+            self._consumer_ids.append(consumer_id)
+            self._demands_by_consumer_id[consumer_id] = array('d', [NAN]) * len(self._has_demand)
+        if first_row < 0:
+            num_rows = -first_row
+            self._first_minute = minute
+            self._total_demands = array('d', [0.]) * num_rows + self._total_demands
+            self._has_demand = array('b', [0]) * num_rows + self._has_demand
+            for consumer_id_,consumer_demands in self._demands_by_consumer_id.items():
+                self._demands_by_consumer_id[consumer_id_] = array('d', [NAN]) * num_rows + consumer_demands
+            first_row = 0
+        if first_row + len(demands) > len(self._has_demand):
+            num_rows = max(first_row + len(demands) - len(self._has_demand), len(self._has_demand)) #at least double the rows, so that extending a little at a time is not quadratic
+            self._total_demands.extend(array('d', [0.]) * num_rows)
+            self._has_demand.extend(array('b', [0]) * num_rows)
+            for consumer_demands in self._demands_by_consumer_id.itervalues():
+                consumer_demands.extend(array('d', [NAN]) * num_rows)
+        
+        total_demands = self._total_demands
+        has_demand = self._has_demand
+        consumer_demands = self._demands_by_consumer_id[consumer_id]
+        for row,demand in enumerate(demands, first_row):
+            if isnan(consumer_demands[row]):
+                if demand is not None:
+                    consumer_demands[row] = demand
+                    total_demands[row] += demand
+                    has_demand[row] = 1
+            else:
+                #the consumer's earlier forecast is replaced, so the row's total is summed again
+                consumer_demands[row] = demand if demand is not None else NAN
+                self._sum_row(row)
+    
+    def _sum_row(self, row):
+        '''Sums the total demand of a row from every consumer's forecast of it.'''
+        
+        total_demand = 0.
+        has_demand = 0
+        for consumer_id in self._consumer_ids:
+            demand = self._demands_by_consumer_id[consumer_id][row]
+            if not isnan(demand):
+                total_demand += demand
+                has_demand = 1
+        self._total_demands[row] = total_demand
+        self._has_demand[row] = has_demand
+    
+    def get_total_demand(self, minute):
+        '''Gets the total demand forecast for the dispatch interval at the specified minute index, or None if
+        there are no forecasts for it.'''
+        
+        row, remainder = divmod(minute - self._first_minute, self.dispatch_interval_duration_minutes)
+        if remainder == 0 and 0 <= row < len(self._has_demand) and self._has_demand[row] == 1:
+            return self._total_demands[row]
+        return None
+    
+    def discard_before(self, minute):
+        '''Discards the forecasts of the dispatch intervals before the specified minute index (e.g. once they have
+        been dispatched). As with IntervalResultStore, the rows are only dropped once they outnumber the rows kept.'''
+        
+        num_rows = min(len(self._has_demand), max(0, -(-(minute - self._first_minute) // self.dispatch_interval_duration_minutes)))
+        if num_rows == 0 or num_rows < len(self._has_demand) - num_rows:
+            return
+        self._first_minute += num_rows * self.dispatch_interval_duration_minutes
+        self._total_demands = self._total_demands[num_rows:]
+        self._has_demand = self._has_demand[num_rows:]
+        for consumer_id,consumer_demands in self._demands_by_consumer_id.items():
+            self._demands_by_consumer_id[consumer_id] = consumer_demands[num_rows:]
+
+class IntervalInfoView(object):
+    '''
+    A read-only dictionary-like view of an IntervalResultStore, in which each interval's date is mapped
+    to an interval information namedtuple (e.g. AEMOperator.DispatchIntervalInfo). The namedtuple,
+    including its dictionary of generator supplies, is created each time an interval is looked up, so
+    the store's query functions should be preferred where performance matters.
+    '''
+    
+    def __init__(self, store, create_info):
+        self._store = store #the viewed store (or None if there are no results yet)
+        self._create_info = create_info #creates an interval information namedtuple from a store and a minute index
+    
+    def __len__(self):
+        return len(self._store) if self._store is not None else 0
+    
+    def __contains__(self, date):
+        return self._get_minute(date) is not None
+    
+    def _get_minute(self, date):
+        '''Gets the minute index of the interval at the specified date, or None if the store has no results for it.'''
+        
+        if self._store is None:
+            return None
+        calendar = self._store.calendar
+        minute = calendar.get_minute(date)
+        return minute if minute in self._store and calendar.get_date(minute) == date else None
+    
+    def __getitem__(self, date):
+        minute = self._get_minute(date)
+        if minute is None:
+            raise KeyError(date)
+        return self._create_info(self._store, minute)
+    
+    def get(self, date, default=None):
+        minute = self._get_minute(date)
+        return self._create_info(self._store, minute) if minute is not None else default
+    
+    def keys(self):
+        return self._store.get_dates() if self._store is not None else []
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def items(self):
+        if self._store is None:
+            return []
+        return [ (self._store.calendar.get_date(minute), self._create_info(self._store, minute)) for minute in self._store.get_minutes() ]
+    
+    def values(self):
+        return [ info for _,info in self.items() ]
@@ -2,9 +2,13 @@
 This module defines classes to control the simulation of energy market operations.
 '''
 
-from messaging import MessageDispatcher
+from messaging import MessageDispatcher, Message
 from agents import AEMOperator
+from clock import SimulationCalendar
+from logger import INFO, SIMULATION
+from events import EventQueue
 from datetime import timedelta
+import os, heapq, cPickle, multiprocessing, traceback
 
 class Simulation(object):
     '''
@@ -13,105 +17,412 @@ class Simulation(object):
     a simulation from its start date to its end date.
     '''
     
-    def __init__(self, logger, start_date, end_date, region_ids, generators, consumers, events):
+    TIME_STEP = timedelta(minutes=1) #the finest granularity of the simulation clock (must be a whole number of minutes)
+    
+    def __init__(self, logger, start_date, end_date, region_ids, generators, consumers, events, dispatch_engine=None):
         '''
         The constructor takes the following arguments:
          - logger: a logging object.
          - start_date: the start date and time of the simulation.
          - end_date: the end date and time of the simulation.
-         - events: a collection of events that will be used to modify the simulation while it is running.
+         - events: a collection of events that will be used to modify the simulation while it is running (see the events module).
          - region_ids: a collection of region id's.
          - regional_data_initialisers: a dictionary of region_id names mapped to objects that have a load_data_provider and capacity_data_provider.
          - generators: a collection of generators.
          - consumers: a collection of consumers.
+         - dispatch_engine: the dispatch engine used by each region's market operator (optional; see the dispatch module).
         '''
         
         self.logger = logger
         self.start_date = start_date
         self.end_date = end_date
         self.region_ids = region_ids
-        self._event_stack = sorted(events, key=lambda event: event.time_delta, reverse=True)
+        self.calendar = SimulationCalendar(start_date) #converts the clock's minute indices (counted from the start date) to and from dates
+        self._time_step_minutes = (self.TIME_STEP.days * 86400 + self.TIME_STEP.seconds) // 60
+        assert self._time_step_minutes > 0 and self.TIME_STEP == timedelta(minutes=self._time_step_minutes)
+        self._event_queue = EventQueue(start_date, events)
         self.message_dispatcher = MessageDispatcher()
+        self.streaming_monitors = [] #data monitors passed the results of each interval as the market operators store them (see the data_monitors module)
+        self.metrics = None #if set, metrics are collected as the simulation runs (see the metrics module)
         
         self.operator_by_region = {}
         self.generators_by_region = {}
         self.consumers_by_region = {}
+        self._agents_by_id = {} #every agent in the simulation, maintained by the add_*() and remove_agent() functions
+        self._wake_queue = None #a heap of (wake minute, agent id) tuples, used once the simulation is running (may contain outdated entries)
+        self._wake_time_by_agent_id = {} #the minute index each agent is currently scheduled to be stepped at
         time_steps_to_run_before_start = set()
         
         #create a market operator per region
         for region_id in self.region_ids:
-            operator = AEMOperator('AEMO-%s' % region_id, region_id)
-            self.operator_by_region[region_id] = operator
+            operator = AEMOperator('AEMO-%s' % region_id, region_id, dispatch_engine)
             self.generators_by_region[region_id] = set()
             self.consumers_by_region[region_id] = set()
+            self.add_operator(operator)
             time_steps_to_run_before_start.update(operator.get_initialisation_times(self))
         
         #set the generators per region
         for generator in generators:
             if generator.region_id in self.region_ids:
-                self.generators_by_region[generator.region_id].add(generator)
+                self.add_generator(generator)
                 time_steps_to_run_before_start.update(generator.get_initialisation_times(self))
         
         #set the consumers per region
         for consumer in consumers:
             if consumer.region_id in self.region_ids:
-                self.consumers_by_region[consumer.region_id].add(consumer)
+                self.add_consumer(consumer)
                 time_steps_to_run_before_start.update(consumer.get_initialisation_times(self))
         
         #run the time steps required for market simulation initialisation
         for time in sorted(time_steps_to_run_before_start):
-            self.time = time
+            self.set_time(time)
             self.step(process_market_schedules=False)
     
-    def run(self):
-        '''Runs a simulation from its start date to its end date.'''
+    def run(self, snapshot_file_location=None, snapshot_interval=timedelta(days=1)):
+        '''Runs a simulation from its start date to its end date. Rather than stepping
+        through every minute, the clock jumps straight to the next time step at which 
+        an event, an agent or a message delivery is due. Each time step, only the agents
+        due at that time are stepped (every agent is due at the start date). If the 
+        simulation has already been run part of the way (see run_until()), or has been
+        loaded from a snapshot, it is resumed from where it stopped. If a snapshot file 
+        location is specified, a snapshot is saved there at every snapshot interval of
+        simulated time, so that the run can be resumed if it is interrupted.'''
+        
+        self.run_until(self.end_date, snapshot_file_location, snapshot_interval)
+    
+    def run_until(self, date, snapshot_file_location=None, snapshot_interval=timedelta(days=1)):
+        '''Runs a simulation up to (and including) the specified date, or its end date if that is
+        earlier. The simulation can be resumed later by calling run() or run_until() again. See
+        run() for the snapshot arguments.'''
         
-        self.time = self.start_date
-        while self.time <= self.end_date:
+        if self._wake_queue is None:
+            self._start_running()
+        last_minute = self.calendar.get_minute(min(date, self.end_date))
+        next_snapshot_time = self.time + snapshot_interval
+        metrics = self.metrics if self.metrics is not None and self.metrics.file_location else None
+        next_metrics_report_time = self.time + metrics.report_interval if metrics is not None else None
+        while self.minute <= last_minute:
             self.step()
-            self.time += timedelta(minutes=1)
+            self._set_minute(self._get_next_step_minute())
+            if snapshot_file_location and self.time >= next_snapshot_time:
+                self.save_snapshot(snapshot_file_location)
+                next_snapshot_time = self.time + snapshot_interval
+            if metrics is not None and self.time >= next_metrics_report_time:
+                metrics.report(self)
+                next_metrics_report_time = self.time + metrics.report_interval
+    
+    def save_snapshot(self, file_location):
+        '''Saves the full state of the simulation (its clock, agents, market operators' books, pending
+        messages and events) to file, so that it can be resumed later (see load_snapshot()). Every
+        agent, event and data provider must be picklable. The file is replaced in a single step, so
+        an interrupted save leaves the previous snapshot intact.'''
+        
+        temp_file_location = '%s.%d.tmp' % (file_location, os.getpid())
+        try:
+            with open(temp_file_location, 'wb') as snapshot_file:
+                cPickle.dump(self, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            os.remove(temp_file_location)
+            raise
+        os.rename(temp_file_location, file_location)
+    
+    @staticmethod
+    def load_snapshot(file_location):
+        '''Loads a simulation saved by save_snapshot(). Calling its run() function resumes it from the
+        time step it was saved at.'''
+        
+        with open(file_location, 'rb') as snapshot_file:
+            return cPickle.load(snapshot_file)
+    
+    def __getstate__(self):
+        #message ids must stay unique across the pending messages in a snapshot and any sent after it is loaded.
+        #streaming monitors (which hold open files and threads) are not saved; they are added again on resuming
+        state = self.__dict__.copy()
+        state['_next_message_id'] = Message.NEXT_ID
+        state['streaming_monitors'] = []
+        return state
+    
+    def __setstate__(self, state):
+        Message.NEXT_ID = max(Message.NEXT_ID, state.pop('_next_message_id'))
+        self.__dict__.update(state)
+    
+    def run_branches(self, branch_functions, processes=None):
+        '''Runs several branches of a simulation from its current state (e.g. after the prefix they
+        share has been simulated with run_until()). Each branch runs in a forked process, so the shared
+        prefix is simulated only once, and its state is shared with every branch until the branch 
+        changes it (i.e. copy-on-write). Each branch function is called in its own process with the
+        branch's simulation; it would typically change the simulation (e.g. with add_event()), run it
+        and then log its results or return them. Returns the (picklable) value returned by each branch
+        function, in order. No more than the specified number of branches are run at once (by default,
+        the number of CPUs).'''
+        
+        processes = processes if processes else multiprocessing.cpu_count()
+        results = []
+        for first_branch_no in xrange(0, len(branch_functions), processes):
+            processes_and_connections = []
+            try:
+                for branch_function in branch_functions[first_branch_no:first_branch_no+processes]:
+                    connection, process_connection = multiprocessing.Pipe()
+                    process = multiprocessing.Process(target=self._run_branch, args=(branch_function, process_connection))
+                    process.daemon = True
+                    process.start()
+                    processes_and_connections.append((process, connection))
+                
+                for branch_no,(process,connection) in enumerate(processes_and_connections, first_branch_no):
+                    try:
+                        reply_type, content = connection.recv()
+                    except EOFError:
+                        reply_type, content = ('error', 'The process exited unexpectedly.')
+                    if reply_type == 'error':
+                        raise RuntimeError('Branch %d of the simulation failed:\n%s' % (branch_no, content))
+                    results.append(content)
+            finally:
+                for process,connection in processes_and_connections:
+                    if process.is_alive():
+                        process.terminate()
+                    process.join()
+        return results
+    
+    def _run_branch(self, branch_function, connection):
+        '''Runs a branch function in a branch's process, sending its result (or error) to the parent process.'''
+        
+        try:
+            connection.send(('finished', branch_function(self)))
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+        finally:
+            connection.close()
+    
+    def set_time(self, time):
+        '''Sets the simulation clock to the specified date. The clock keeps both the date (time) and
+        the minute index it falls in (minute; see the clock module), which is cheaper to work with.'''
+        
+        self.time = time
+        self.minute = self.calendar.get_minute(time)
+    
+    def _set_minute(self, minute):
+        '''Sets the simulation clock to the specified minute index.'''
+        
+        self.minute = minute
+        self.time = self.calendar.get_date(minute)
+    
+    def _start_running(self):
+        '''Sets the clock to the start date, with every agent due.'''
+        
+        self._set_minute(0)
+        self._wake_queue = []
+        self._wake_time_by_agent_id = {}
+        for agent_id in self._agents_by_id:
+            self._set_wake_time(agent_id, 0)
+    
+    def _get_next_step_minute(self):
+        '''Gets the minute index of the next time step at which there is work due. If there is no 
+        more work due at all, a time step after the simulation end date is returned.'''
+        
+        calendar = self.calendar
+        due_minutes = []
+        
+        #the next event
+        next_event_time = self._event_queue.get_next_time()
+        if next_event_time is not None:
+            due_minutes.append(calendar.get_minute_at_or_after(next_event_time))
+        
+        #the next message delivery
+        next_delivery_time = self.message_dispatcher.next_delivery_time()
+        if next_delivery_time is not None:
+            due_minutes.append(calendar.get_minute_at_or_after(next_delivery_time))
+        
+        #the next agent wake-up
+        self._discard_outdated_wake_times()
+        if len(self._wake_queue) > 0:
+            due_minutes.append(self._wake_queue[0][0])
+        
+        if len(due_minutes) == 0:
+            return self._align_to_time_step(calendar.get_minute(self.end_date) + self._time_step_minutes)
+        return self._align_to_time_step(max(min(due_minutes), self.minute + self._time_step_minutes))
+    
+    def _align_to_time_step(self, minute):
+        '''Rounds a minute index up to the nearest time step of the simulation clock (i.e. the first 
+        time step at which a minute-by-minute simulation would have reached the minute).'''
+        return -(-minute // self._time_step_minutes) * self._time_step_minutes
     
     def step(self, process_market_schedules=True):
         '''Executes a single time step for a simulation. This includes processing
         defined events at this time, running each agent's step() function, and 
         processing their inter-communications via the message dispatching system.'''
         
-        self.logger.info('<Time: %s>' % self.time)
-        #process events
-        while len(self._event_stack) > 0 and self.time >= self.start_date + self._event_stack[-1].time_delta:
-            event = self._event_stack.pop()
+        logger = self.logger
+        if logger.is_enabled_for(INFO, SIMULATION):
+            logger.log(INFO, SIMULATION, 'time_step', None, self.time, '<Time: %(time)s>')
+        metrics = self.metrics
+        if metrics is not None:
+            start_time = metrics.timer()
+            if self.calendar.is_dispatch_interval(self.minute):
+                metrics.add_count(metrics.DISPATCH_INTERVALS)
+        
+        #process events. every agent is executed before the simulation is running, or after an event that does
+        #not reschedule the agents it changes (since it may have changed when agents are due)
+        step_every_agent = self._wake_queue is None
+        event = self._event_queue.pop_due(self.time)
+        while event is not None:
             event.process_event(self)
-            self.logger.info('Processed simulation event: %s' % event)
+            if logger.is_enabled_for(INFO, SIMULATION):
+                logger.log(INFO, SIMULATION, 'event', None, self.time, 'Processed simulation event: %(event)s', event=str(event))
+            if not getattr(event, 'reschedules_agents', False):
+                step_every_agent = True
+            event = self._event_queue.pop_due(self.time)
+        if metrics is not None:
+            metrics.add_duration(metrics.EVENTS, metrics.timer() - start_time)
         
-        #execute each agent for this time step
+        #execute each agent due at this time step
         agents_by_id = self.agents_by_id
-        for agent in agents_by_id.values():
-            agent.step(self)
+        agents_to_step = agents_by_id.values() if step_every_agent else self._pop_due_agents()
+        if metrics is None:
+            for agent in agents_to_step:
+                agent.step(self)
+        else:
+            self._step_agents_with_metrics(agents_to_step, metrics)
         
-        #handle agent communications for this time step
-        #TODO: refactor this
-        message_inboxes_by_agent_id = self.message_dispatcher.inboxes_by_id_by_date.get(self.time, None)
-        while message_inboxes_by_agent_id and len(message_inboxes_by_agent_id) > 0:
-            message_inboxes_by_agent_id_copy = dict(message_inboxes_by_agent_id) #make a copy of the inboxes
-            message_inboxes_by_agent_id.clear() #clear all inboxes
-            for id,messages in message_inboxes_by_agent_id_copy.items():
+        #handle agent communications for this time step (including any messages sent
+        #for this same time step whilst the agents are handling their messages)
+        if metrics is not None:
+            start_time = metrics.timer()
+            num_messages_delivered = 0
+        agent_ids_messaged = set()
+        message_inboxes_by_agent_id = self.message_dispatcher.collect_inboxes(self.time)
+        while message_inboxes_by_agent_id:
+            for id,messages in message_inboxes_by_agent_id.items():
                 agents_by_id[id].handle_messages(self, messages)
+                agent_ids_messaged.add(id)
+            if metrics is not None:
+                num_messages_delivered += sum(len(messages) for messages in message_inboxes_by_agent_id.itervalues())
+            message_inboxes_by_agent_id = self.message_dispatcher.collect_inboxes(self.time)
+        if metrics is not None:
+            metrics.add_duration(metrics.MESSAGE_DELIVERY, metrics.timer() - start_time)
+            metrics.add_value(metrics.MESSAGES_DELIVERED, num_messages_delivered)
+        
+        #reschedule the agents that have been executed or have handled messages
+        if self._wake_queue is not None:
+            self._reschedule_agents(agents_by_id.keys() if step_every_agent else agent_ids_messaged.union(agent.id for agent in agents_to_step))
+    
+    def _step_agents_with_metrics(self, agents, metrics):
+        '''Executes each of the agents, timing their steps by class of agent.'''
+        
+        timer = metrics.timer
+        for agent in agents:
+            start_time = timer()
+            agent.step(self)
+            metrics.add_duration('%s:%s' % (metrics.AGENT_STEPS, agent.__class__.__name__), timer() - start_time)
+    
+    def _reschedule_agents(self, agent_ids):
+        '''Updates the wake times of the specified agents (ignoring any that have been removed).'''
+        
+        for agent_id in agent_ids:
+            agent = self._agents_by_id.get(agent_id, None)
+            if agent is not None:
+                if hasattr(agent, 'next_wake_time'):
+                    wake_time = agent.next_wake_time(self)
+                    self._set_wake_time(agent_id, self.calendar.get_minute_at_or_after(wake_time) if wake_time is not None else None)
+                else:
+                    self._set_wake_time(agent_id, self.minute + self._time_step_minutes)
+    
+    def _set_wake_time(self, agent_id, wake_time):
+        '''Schedules an agent to be stepped at the specified minute index (replacing its previous wake
+        time), or never again if the minute index is None.'''
+        
+        if wake_time is None:
+            self._wake_time_by_agent_id.pop(agent_id, None)
+        elif self._wake_time_by_agent_id.get(agent_id, None) != wake_time:
+            self._wake_time_by_agent_id[agent_id] = wake_time
+            heapq.heappush(self._wake_queue, (wake_time, agent_id))
+    
+    def _discard_outdated_wake_times(self):
+        '''Discards entries at the front of the wake queue that have been replaced by another
+        wake time (or whose agent has been removed).'''
+        
+        wake_queue = self._wake_queue
+        while len(wake_queue) > 0 and self._wake_time_by_agent_id.get(wake_queue[0][1], None) != wake_queue[0][0]:
+            heapq.heappop(wake_queue)
+    
+    def _pop_due_agents(self):
+        '''Removes the agents due at (or before) the current time from the wake queue, returning
+        them in wake time order (then by agent id).'''
+        
+        due_agents = []
+        self._discard_outdated_wake_times()
+        while len(self._wake_queue) > 0 and self._wake_queue[0][0] <= self.minute:
+            _,agent_id = heapq.heappop(self._wake_queue)
+            del self._wake_time_by_agent_id[agent_id]
+            due_agents.append(self._agents_by_id[agent_id])
+            self._discard_outdated_wake_times()
+        return due_agents
     
     @property
     def agents_by_id(self):
-        #NOTE: below may be slow if called repeatedly throughout a simulation.
-        #however, if agents can be injected into the simulation while it is running
-        #(which is entirely possible), this may be the only way to effectively
-        #collate them all into a single dictionary. the alternative would be to store all
-        #agents in a single dictionary all the time.
-        agents_by_id = {}
-        for region_id in self.region_ids:
-            if region_id in self.operator_by_region:
-                operator = self.operator_by_region[region_id]
-                agents_by_id[operator.id] = operator
-            if region_id in self.generators_by_region:
-                agents_by_id.update({ generator.id : generator for generator in self.generators_by_region[region_id] })
-            if region_id in self.consumers_by_region:
-                agents_by_id.update({ consumer.id : consumer for consumer in self.consumers_by_region[region_id] })
-        return agents_by_id
-        
\ No newline at end of file
+        '''A dictionary of agent ids mapped to every agent in the simulation. Agents must be 
+        added and removed via the add_*() and remove_agent() functions to appear here.'''
+        return self._agents_by_id
+    
+    def add_operator(self, operator):
+        '''Adds a market operator to the simulation, replacing any existing operator in its
+        region. Can be called while the simulation is running (e.g. by an event).'''
+        
+        assert operator.region_id in self.region_ids
+        if operator.region_id in self.operator_by_region:
+            self.remove_agent(self.operator_by_region[operator.region_id].id)
+        self.operator_by_region[operator.region_id] = operator
+        self._agents_by_id[operator.id] = operator
+        if self._wake_queue is not None:
+            self._set_wake_time(operator.id, self.minute)
+    
+    def add_generator(self, generator):
+        '''Adds a generator to the simulation. Can be called while the simulation is running
+        (e.g. by an event).'''
+        
+        assert generator.region_id in self.region_ids
+        self.generators_by_region.setdefault(generator.region_id, set()).add(generator)
+        self._agents_by_id[generator.id] = generator
+        if self._wake_queue is not None:
+            self._set_wake_time(generator.id, self.minute)
+    
+    def add_consumer(self, consumer):
+        '''Adds a consumer to the simulation. Can be called while the simulation is running
+        (e.g. by an event).'''
+        
+        assert consumer.region_id in self.region_ids
+        self.consumers_by_region.setdefault(consumer.region_id, set()).add(consumer)
+        self._agents_by_id[consumer.id] = consumer
+        if self._wake_queue is not None:
+            self._set_wake_time(consumer.id, self.minute)
+    
+    def reschedule_agents(self, agent_ids):
+        '''Updates when the specified agents are next due to be stepped (see their next_wake_time()), e.g. after
+        an event has changed them. Can be called while the simulation is running.'''
+        
+        if self._wake_queue is not None:
+            self._reschedule_agents(agent_ids)
+    
+    def add_event(self, event):
+        '''Adds an event to the simulation, to be processed after any other events at the same time. 
+        Can be called while the simulation is running (e.g. in a branch, or by another event; see 
+        run_branches()). An event whose time has already passed is processed at the next time step.'''
+        self._event_queue.add(event)
+    
+    def remove_event(self, event):
+        '''Removes an event from the simulation (e.g. a recurring event that is no longer needed). Returns
+        True if the event was still due to be processed; otherwise, False.'''
+        return self._event_queue.remove(event)
+    
+    def remove_agent(self, agent_id):
+        '''Removes (i.e. retires) an agent from the simulation. Returns the removed agent, or 
+        None if there is no agent with the specified id. Can be called while the simulation 
+        is running (e.g. by an event).'''
+        
+        agent = self._agents_by_id.pop(agent_id, None)
+        if agent is not None:
+            self._wake_time_by_agent_id.pop(agent_id, None)
+            if self.operator_by_region.get(agent.region_id, None) is agent:
+                del self.operator_by_region[agent.region_id]
+            self.generators_by_region.get(agent.region_id, set()).discard(agent)
+            self.consumers_by_region.get(agent.region_id, set()).discard(agent)
+        return agent
@@ -0,0 +1,177 @@
+'''
+This module provides functions for loading, validating and running sweeps: many variants of
+a base config dictionary, each with some of its keys overridden, run in a pool of processes.
+A sweep is defined in a Python module alongside its base config dictionary, as either:
+ - a list of override dictionaries, one per variant. Each maps config keys to their values
+   in the variant, and can also specify the variant's 'name' and a 'modify' function (which
+   is passed the variant's config dictionary to change it in place, after the overrides).
+ - a grid: a dictionary of config keys mapped to lists of values, with a variant for every
+   combination of values.
+Each variant is a deep copy of the base config, so the large data providers that are only
+read from (e.g. CSVPublicYestBidDataProvider) are shared rather than copied (see their
+__deepcopy__() functions), and are loaded once per worker process.
+'''
+
+import os, copy, itertools, traceback, multiprocessing
+from csv import writer
+from franklin import configuration_utilities
+from franklin.data_monitors import CSVFileMonitor
+
+'''Defines the name required for a sweep to be recognised within a module as an attribute.'''
+SWEEP_NAME = 'sweep'
+
+'''Defines the override keys that are not config keys.'''
+VARIANT_NAME_KEY = 'name'
+VARIANT_MODIFY_KEY = 'modify'
+
+'''Defines the name of the spot price summary file written to a sweep's output directory.'''
+SPOT_PRICE_SUMMARY_FILE_NAME = 'spot_prices.csv'
+
+def load_sweep_from_module(module_path):
+    '''Loads a Python module containing a config dictionary and a sweep from a specified file path.
+    Returns a tuple of the config dictionary and a list of (name, overrides) tuples per variant
+    (see get_variants()) if both exist; otherwise, None is returned. Modules are only imported once
+    per process, so this can be called again (e.g. by a worker process) at no extra cost.'''
+    
+    config_dict = configuration_utilities.load_config_dict_from_module(module_path)
+    sweep = configuration_utilities.load_config_dict_from_module(module_path, SWEEP_NAME)
+    if config_dict is None or sweep is None:
+        return None
+    return (config_dict, get_variants(sweep))
+
+def get_variants(sweep):
+    '''Gets the variants of a sweep (either a list of override dictionaries or a grid), as a list of
+    (name, overrides) tuples. Variants without a name are named by their position in the sweep.'''
+    
+    if isinstance(sweep, dict):
+        keys = sorted(sweep.keys())
+        overrides_per_variant = [ dict(zip(keys, values)) for values in itertools.product(*[ sweep[key] for key in keys ]) ]
+    else:
+        overrides_per_variant = list(sweep)
+    
+    variants = []
+    for variant_no,overrides in enumerate(overrides_per_variant):
+        name = overrides.get(VARIANT_NAME_KEY, 'variant-%03d' % (variant_no + 1))
+        variants.append((name, overrides))
+    names = [ name for name,_ in variants ]
+    assert len(set(names)) == len(names), 'Sweep variant names must be unique.'
+    return variants
+
+def create_variant_config_dict(config_dict, name, overrides, output_directory):
+    '''Creates the (unvalidated) config dictionary for a variant, by overriding the base config dictionary's
+    keys and then deep copying it. The files that the data monitor, the logger and the metrics are written
+    to (if any) are moved into the variant's own directory within the output directory.'''
+    
+    variant_config_dict = dict(config_dict)
+    for key,value in overrides.items():
+        if key not in (VARIANT_NAME_KEY, VARIANT_MODIFY_KEY):
+            variant_config_dict[key] = value
+    variant_config_dict = copy.deepcopy(variant_config_dict)
+    
+    if VARIANT_MODIFY_KEY in overrides:
+        overrides[VARIANT_MODIFY_KEY](variant_config_dict)
+    for key in ('data_monitor', 'logger'):
+        file_writer = variant_config_dict.get(key, None)
+        #a logger without a file location writes to stdout, so it is left as it is
+        if getattr(file_writer, 'file_location', None):
+            file_writer.file_location = os.path.join(output_directory, name, os.path.basename(file_writer.file_location))
+    if variant_config_dict.get('metrics_file', None):
+        variant_config_dict['metrics_file'] = os.path.join(output_directory, name, os.path.basename(variant_config_dict['metrics_file']))
+    return variant_config_dict
+
+def validate_sweep(config_dict, variants, output_directory):
+    '''Validates the config dictionary of every variant in a sweep. Returns a tuple of two dictionaries:
+    variant names mapped to their critical errors, and variant names mapped to their non-critical errors.
+    If the dictionaries are empty, there were no errors encountered.'''
+    
+    critical_errors_by_name = {}
+    non_critical_errors_by_name = {}
+    for name,overrides in variants:
+        variant_config_dict = create_variant_config_dict(config_dict, name, overrides, output_directory)
+        critical_errors, non_critical_errors = configuration_utilities.validate_config_dict(variant_config_dict)
+        if not critical_errors and variant_config_dict['parallel_regions']:
+            #the processes of a pool cannot start processes of their own
+            critical_errors.append('\'parallel_regions\' cannot be used within a sweep.')
+        if not critical_errors and variant_config_dict['snapshot_file']:
+            critical_errors.append('\'snapshot_file\' cannot be used within a sweep.')
+        if critical_errors:
+            critical_errors_by_name[name] = critical_errors
+        if non_critical_errors:
+            non_critical_errors_by_name[name] = non_critical_errors
+    return (critical_errors_by_name, non_critical_errors_by_name)
+
+def run_sweep(module_path, output_directory, processes=None):
+    '''Runs every variant of the sweep in the specified module, using a pool of processes (as many as there
+    are CPUs, unless specified). The spot prices of every variant are summarised in a CSV file in the output
+    directory. Returns a list of (name, error) tuples for any variants that failed to run. This can fail if
+    the sweep has not been validated first.'''
+    
+    config_dict, variants = load_sweep_from_module(module_path)
+    pool = multiprocessing.Pool(processes, _initialise_worker, (module_path,))
+    try:
+        results_by_name = dict(pool.imap_unordered(_run_variant, [ (variant_no, output_directory) for variant_no in xrange(len(variants)) ]))
+    finally:
+        pool.close()
+        pool.join()
+    
+    spot_price_by_date_by_region_id_by_name = {}
+    failed_variants = []
+    for name,_ in variants:
+        succeeded, result = results_by_name[name]
+        if succeeded:
+            spot_price_by_date_by_region_id_by_name[name] = result
+        else:
+            failed_variants.append((name, result))
+    
+    _write_spot_price_summary(os.path.join(output_directory, SPOT_PRICE_SUMMARY_FILE_NAME), [ name for name,_ in variants if name in spot_price_by_date_by_region_id_by_name ], spot_price_by_date_by_region_id_by_name)
+    return failed_variants
+
+def _write_spot_price_summary(file_location, names, spot_price_by_date_by_region_id_by_name):
+    '''Writes the spot price of every region and trading interval to file, with a column per variant.'''
+    
+    #create directory if it does not exist
+    directory = os.path.dirname(file_location)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    
+    region_ids_and_dates = set()
+    for spot_price_by_date_by_region_id in spot_price_by_date_by_region_id_by_name.values():
+        for region_id,spot_price_by_date in spot_price_by_date_by_region_id.items():
+            region_ids_and_dates.update((region_id, date) for date in spot_price_by_date)
+    
+    with open(file_location, 'wb') as summary_file:
+        file_writer = writer(summary_file)
+        file_writer.writerow(['REGION_ID', 'TRADING_INTERVAL'] + names)
+        for region_id,date in sorted(region_ids_and_dates):
+            file_writer.writerow([region_id, date.strftime(CSVFileMonitor.DATE_TIME_FORMAT)] + [ spot_price_by_date_by_region_id_by_name[name].get(region_id, {}).get(date, 'N/A') for name in names ])
+
+'''The base config dictionary and variants of the sweep run by this (worker) process.'''
+_worker_sweep = None
+
+def _initialise_worker(module_path):
+    '''Loads the sweep (and its data providers) once per worker process.'''
+    
+    global _worker_sweep
+    _worker_sweep = load_sweep_from_module(module_path)
+
+def _run_variant((variant_no, output_directory)):
+    '''Runs a variant of the worker's sweep. Returns a tuple of the variant's name and a tuple of whether
+    it succeeded and either its spot prices (region ids mapped to trading interval dates mapped to spot
+    prices) or the error that stopped it.'''
+    
+    config_dict, variants = _worker_sweep
+    name, overrides = variants[variant_no]
+    try:
+        variant_config_dict = create_variant_config_dict(config_dict, name, overrides, output_directory)
+        critical_errors, _ = configuration_utilities.validate_config_dict(variant_config_dict)
+        if critical_errors:
+            return (name, (False, '\n'.join(critical_errors)))
+        simulation = configuration_utilities.run_simulation_with_config(variant_config_dict)
+        spot_price_by_date_by_region_id = {}
+        for region_id,operator in simulation.operator_by_region.items():
+            results = operator.trading_interval_results
+            if results is not None:
+                spot_price_by_date_by_region_id[region_id] = dict(zip(results.get_dates(), results.get_column('spot_price')))
+        return (name, (True, spot_price_by_date_by_region_id))
+    except Exception:
+        return (name, (False, traceback.format_exc()))
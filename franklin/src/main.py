@@ -27,6 +27,8 @@ if __name__ == '__main__' :
     parser.add_option('-c', '--config', help='Configuration file to execute.', metavar='FILE')
     parser.add_option('-o', '--optimise', help='Use Psyco optimisation (requires Psyco to be installed).', action='store_true', default=False)
     parser.add_option('-p', '--profile', help='Use cProfile profiling.', action='store_true', default=False)
+    parser.add_option('-m', '--metrics', help='Collect metrics of the time spent in each phase of the simulation, and print them once it finishes.', action='store_true', default=False)
+    parser.add_option('-r', '--resume', help='Resume the simulation from the config\'s snapshot file.', action='store_true', default=False)
     options, _ = parser.parse_args()
     
     #load psyco if specified
@@ -56,18 +58,27 @@ if __name__ == '__main__' :
         _print_error_list('The following non-critical errors were encountered:', non_critical_errors)
     
     #run the config (and profile if specified)
-    print 'Simulation started...'
+    if options.resume and not config_dict['snapshot_file']:
+        _exit_with_error_list('No snapshot file specified via the config\'s \'snapshot_file\' key to resume from.')
+    print 'Simulation resumed...' if options.resume else 'Simulation started...'
     if options.profile:
         from cProfile import Profile
         print 'Initialising cProfile...'
         profiler = Profile()
         try:
-            profiler.runcall(configuration_utilities.run_simulation_with_config, config_dict)
+            simulation = profiler.runcall(configuration_utilities.run_simulation_with_config, config_dict, options.resume, options.metrics)
         finally:
             import pstats
             print ''
             print 'cProfile statistics:'
             pstats.Stats(profiler).sort_stats('cumulative').print_stats()
     else:
-        configuration_utilities.run_simulation_with_config(config_dict)
-    print 'Simulation finished.'
\ No newline at end of file
+        simulation = configuration_utilities.run_simulation_with_config(config_dict, options.resume, options.metrics)
+    print 'Simulation finished.'
+    
+    #print metrics if specified
+    if options.metrics:
+        print ''
+        print 'Simulation metrics:'
+        for line in simulation.metrics.summarise():
+            print line
\ No newline at end of file
@@ -0,0 +1,48 @@
+'''
+Provides a centralised location from which sweeps (many variants of a config dictionary)
+can be loaded from file, validated, and run in a pool of processes (with some optional
+command line arguments). See the sweep_utilities module for how sweeps are defined.
+'''
+
+import sys, optparse
+from franklin import sweep_utilities
+from main import _exit_with_error_list, _print_error_list
+
+if __name__ == '__main__' :
+    #parse command line arguments
+    parser = optparse.OptionParser()
+    parser.add_option('-s', '--sweep', help='Sweep file to execute (containing a config and a sweep).', metavar='FILE')
+    parser.add_option('-o', '--output', help='Directory to write the output of every variant and the spot price summary to.', metavar='DIRECTORY')
+    parser.add_option('-p', '--processes', help='Number of processes to run variants in (defaults to the number of CPUs).', type='int', default=None)
+    options, _ = parser.parse_args()
+    
+    if not options.sweep:
+        _exit_with_error_list('No sweep file specified via --sweep option.')
+    if not options.output:
+        _exit_with_error_list('No output directory specified via --output option.')
+    
+    #load config dictionary and sweep from file
+    print 'Loading sweep file \'%s\'...' % options.sweep
+    sweep = sweep_utilities.load_sweep_from_module(options.sweep)
+    if not sweep:
+        _exit_with_error_list('Specified sweep file does not exist or config dictionary and sweep could not be found in the file.')
+    config_dict, variants = sweep
+    
+    #validate the config dictionary of every variant
+    print 'Parsing and validating %d variants...' % len(variants)
+    critical_errors_by_name, non_critical_errors_by_name = sweep_utilities.validate_sweep(config_dict, variants, options.output)
+    for name,non_critical_errors in sorted(non_critical_errors_by_name.items()):
+        _print_error_list('The following non-critical errors were encountered in variant \'%s\':' % name, non_critical_errors)
+    if len(critical_errors_by_name) > 0:
+        for name,critical_errors in sorted(critical_errors_by_name.items()):
+            _print_error_list('The following critical errors were encountered in variant \'%s\':' % name, critical_errors)
+        sys.exit(1)
+    
+    #run the sweep
+    print 'Sweep started...'
+    failed_variants = sweep_utilities.run_sweep(options.sweep, options.output, options.processes)
+    if len(failed_variants) > 0:
+        for name,error in failed_variants:
+            _print_error_list('Variant \'%s\' failed:' % name, [error])
+        sys.exit(1)
+    print 'Sweep finished.'